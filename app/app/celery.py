@@ -12,13 +12,20 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.conf.update(result_expires=3600,
                 enable_utc=False)
 
+# Reminders are planned per visit and sent when due, instead of all of them at 10:00
 app.conf.beat_schedule = {
-    "every day": {
-        "task": "send_sms_remainder",  # <---- Name of task
-        "schedule": crontab(hour=10,
-                            minute=00,
-                            )
-    }
+    "plan reminders": {
+        "task": "plan_reminder_jobs",
+        "schedule": crontab(minute='*/15'),
+    },
+    "dispatch reminders": {
+        "task": "dispatch_reminder_jobs",
+        "schedule": crontab(),
+    },
+    "drain sms outbox": {
+        "task": "drain_sms_outbox",
+        "schedule": crontab(),
+    },
 }
 
 app.autodiscover_tasks()
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 
 from pathlib import Path
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -45,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'booking.middleware.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -119,10 +121,6 @@ USE_I18N = True
 
 USE_TZ = True
 
-# If you set this to False, Django will not format dates, numbers and
-# calendars according to the current locale
-USE_L10N = True
-
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/4.1/howto/static-files/
 
@@ -133,11 +131,83 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'redis://redis:6379/1'),
+    }
+}
+
+if 'test' in sys.argv:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_BROKER", "redis://redis:6379/0")
+# Task arguments must be primitive values, never model instances
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_RESULT_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
 
 LOGOUT_REDIRECT_URL = '/'
 LOGIN_REDIRECT_URL = '/'
 LOGIN_URL = '/login/'
 
 AUTH_USER_MODEL = 'booking.User'
+
+# Maximum number of visits handled by a single send_sms_remainder chunk subtask
+SMS_REMAINDER_CHUNK_SIZE = int(os.environ.get('SMS_REMAINDER_CHUNK_SIZE', 200))
+
+# Reminders are sent REMINDER_LEAD_HOURS before a visit, moved earlier to fall between
+# REMINDER_WINDOW_START and REMINDER_WINDOW_END (HH:MM), and spread over REMINDER_SPREAD_MINUTES
+REMINDER_LEAD_HOURS = int(os.environ.get('REMINDER_LEAD_HOURS', 24))
+REMINDER_WINDOW_START = os.environ.get('REMINDER_WINDOW_START', '08:00')
+REMINDER_WINDOW_END = os.environ.get('REMINDER_WINDOW_END', '20:00')
+REMINDER_SPREAD_MINUTES = int(os.environ.get('REMINDER_SPREAD_MINUTES', 30))
+# Reminders claimed by a dispatching worker at once, and seconds after which a claim of a dead worker expires
+REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 200))
+REMINDER_CLAIM_TIMEOUT = int(os.environ.get('REMINDER_CLAIM_TIMEOUT', 600))
+# Outbox messages claimed by a draining worker at once, and seconds after which a claim of a dead worker
+# expires. Must be longer than sending a batch with all its retries takes
+SMS_OUTBOX_BATCH_SIZE = int(os.environ.get('SMS_OUTBOX_BATCH_SIZE', 100))
+SMS_OUTBOX_CLAIM_TIMEOUT = int(os.environ.get('SMS_OUTBOX_CLAIM_TIMEOUT', 600))
+
+# SMS api
+SMS_API_URL = os.environ.get('SMS_API_URL', 'https://api.vpbx.pl/api/v1')
+SMS_API_USER = os.environ.get('SMS_API_USER')
+SMS_API_PASSWORD = os.environ.get('SMS_API_PASSWORD')
+SMS_API_SENDER = os.environ.get('SMS_API_SENDER')
+# Number of messages sent at once by one worker process (and size of its connection pool)
+SMS_GATEWAY_CONCURRENCY = int(os.environ.get('SMS_GATEWAY_CONCURRENCY', 8))
+SMS_GATEWAY_TIMEOUT = float(os.environ.get('SMS_GATEWAY_TIMEOUT', 10))
+# Lifetime of the api bearer token and how long before expiry it is refreshed, in seconds
+SMS_TOKEN_TTL = int(os.environ.get('SMS_TOKEN_TTL', 3600))
+SMS_TOKEN_REFRESH_MARGIN = int(os.environ.get('SMS_TOKEN_REFRESH_MARGIN', 300))
+# Attempts per message and the exponential backoff between them, in seconds
+SMS_MAX_ATTEMPTS = int(os.environ.get('SMS_MAX_ATTEMPTS', 5))
+SMS_RETRY_BASE_DELAY = float(os.environ.get('SMS_RETRY_BASE_DELAY', 1))
+SMS_RETRY_MAX_DELAY = float(os.environ.get('SMS_RETRY_MAX_DELAY', 30))
+
+# How long the visits of a day are cached, in seconds
+SCHEDULE_CACHE_TIMEOUT = int(os.environ.get('SCHEDULE_CACHE_TIMEOUT', 24 * 60 * 60))
+# Working hours searched for free slots, as HH:MM
+BOOKING_DAY_START = os.environ.get('BOOKING_DAY_START', '08:00')
+BOOKING_DAY_END = os.environ.get('BOOKING_DAY_END', '20:00')
+
+# Objects listed by an api page by default, and at most per page or per bulk request
+API_PAGE_SIZE = int(os.environ.get('API_PAGE_SIZE', 100))
+API_MAX_BULK = int(os.environ.get('API_MAX_BULK', 1000))
+# Rows fetched from the database at once while streaming an export
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+# Imported rows validated and inserted at once
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+
+# Times the same query may run within one request or task before it is reported as a possible N+1
+NPLUSONE_THRESHOLD = int(os.environ.get('NPLUSONE_THRESHOLD', 10))
+# Bearer token required by the metrics endpoint, which is only served to staff users when it is not set
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Seconds a process buffers the totals of its requests and tasks before adding them to the shared cache
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 10))
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Client, Visit, User
+from .models import Client, Visit, User, FailedSms, SmsCharge, ReminderJob, OutboundSms
 from django.contrib.auth.admin import UserAdmin
 
 
@@ -30,3 +30,29 @@ class VisitAdmin(admin.ModelAdmin):
 
 admin.site.register(Client, ClientAdmin)
 admin.site.register(Visit, VisitAdmin)
+
+
+@admin.register(FailedSms)
+class FailedSmsAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'owner', 'to', 'error', 'attempts')
+    list_filter = ('error',)
+
+
+@admin.register(SmsCharge)
+class SmsChargeAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'user', 'kind', 'amount', 'messages')
+    list_filter = ('kind',)
+
+
+@admin.register(ReminderJob)
+class ReminderJobAdmin(admin.ModelAdmin):
+    list_display = ('send_at', 'owner', 'visit', 'status')
+    list_filter = ('status',)
+    raw_id_fields = ('visit', 'owner')
+
+
+@admin.register(OutboundSms)
+class OutboundSmsAdmin(admin.ModelAdmin):
+    list_display = ('send_after', 'owner', 'kind', 'to', 'status', 'error')
+    list_filter = ('status', 'kind')
+    raw_id_fields = ('owner',)
@@ -0,0 +1,271 @@
+"""
+JSON API over visits and clients of the logged in user.
+
+GET lists objects (`?fields=id,date&limit=&cursor=`), POST creates, PATCH updates and DELETE deletes
+a whole list of objects in a single transaction. Every request only ever sees the user's own objects,
+because they are looked up through the owner-filtered queryset.
+"""
+import datetime
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.forms.models import model_to_dict
+from django.http import Http404, JsonResponse
+from django.views import View
+from phonenumber_field.phonenumber import PhoneNumber
+
+from .bulk import duplicate_phone_numbers, overlapping_visits
+from .forms import ClientBulkForm, VisitTimeForm
+from .models import Client, Visit
+from .pagination import KeysetPaginator
+from .schedule import invalidate_schedule
+from .search import normalize, search_clients
+
+
+class ApiJSONEncoder(DjangoJSONEncoder):
+
+    def default(self, o):
+        if isinstance(o, PhoneNumber):
+            return str(o)
+        return super().default(o)
+
+
+class ApiError(Exception):
+
+    def __init__(self, payload, status=400):
+        super().__init__(payload)
+        self.payload = payload
+        self.status = status
+
+
+def api_response(payload, status=200):
+    return JsonResponse(payload, status=status, encoder=ApiJSONEncoder)
+
+
+class BulkApiView(View):
+    """
+    Base view of a JSON resource. Subclasses provide the owner-filtered queryset and the bulk writes.
+    """
+    model = None
+    fields = ()
+
+    def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return api_response({'error': 'Authentication required'}, status=401)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except ApiError as error:
+            return api_response(error.payload, status=error.status)
+        except IntegrityError as error:
+            # The PostgreSQL overlap constraint caught a batch racing another request
+            if 'visit_owner_no_overlap' not in str(error):
+                raise
+            return api_response({'error': 'This time overlaps another visit'}, status=409)
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get(self, request, *args, **kwargs):
+        fields = self.get_fields()
+        try:
+            limit = min(int(request.GET.get('limit', settings.API_PAGE_SIZE)), settings.API_MAX_BULK)
+        except ValueError:
+            raise ApiError({'error': 'limit must be a number'})
+        queryset = self.filter_queryset(self.get_queryset()).only(*fields)
+        try:
+            page = KeysetPaginator(queryset, max(limit, 1), ['pk']).page(request.GET.get('cursor'))
+        except Http404:
+            raise ApiError({'error': 'Invalid cursor'})
+        return api_response({
+            'results': [self.serialize(obj, fields) for obj in page],
+            'next': page.next_cursor,
+        })
+
+    def post(self, request, *args, **kwargs):
+        rows = self.get_rows(request)
+        with transaction.atomic():
+            objects = self.create(rows)
+        return api_response({'results': [self.serialize(obj) for obj in objects]}, status=201)
+
+    def patch(self, request, *args, **kwargs):
+        rows = self.get_rows(request)
+        if not all(isinstance(row, dict) and isinstance(row.get('id'), int) for row in rows):
+            raise ApiError({'error': 'Every object must have an id'})
+        with transaction.atomic():
+            instances = self.get_queryset().in_bulk([row['id'] for row in rows])
+            missing = {
+                position: {'id': ['Not found']}
+                for position, row in enumerate(rows) if instances.get(row['id']) is None
+            }
+            if missing:
+                raise ApiError({'errors': missing}, status=404)
+            objects = self.update([(instances[row['id']], row) for row in rows])
+        return api_response({'results': [self.serialize(obj) for obj in objects]})
+
+    def delete(self, request, *args, **kwargs):
+        ids = self.get_rows(request)
+        if not all(isinstance(pk, int) for pk in ids):
+            raise ApiError({'error': 'Expected a list of ids'})
+        with transaction.atomic():
+            deleted = self.delete_objects(self.get_queryset().filter(pk__in=ids))
+        return api_response({'deleted': deleted})
+
+    def get_fields(self):
+        fields = self.request.GET.get('fields')
+        if not fields:
+            return self.fields
+        fields = tuple(fields.split(','))
+        unknown = set(fields) - set(self.fields)
+        if unknown:
+            raise ApiError({'error': f'Unknown fields: {", ".join(sorted(unknown))}'})
+        return fields
+
+    def filter_queryset(self, queryset):
+        return queryset
+
+    def get_rows(self, request):
+        try:
+            rows = json.loads(request.body)
+        except ValueError:
+            raise ApiError({'error': 'Invalid JSON'})
+        if not isinstance(rows, list):
+            raise ApiError({'error': 'Expected a list'})
+        if len(rows) > settings.API_MAX_BULK:
+            raise ApiError({'error': f'At most {settings.API_MAX_BULK} objects per request'})
+        return rows
+
+    def serialize(self, obj, fields=None):
+        return {
+            field: self.model._meta.get_field(field).value_from_object(obj)
+            for field in fields or self.fields
+        }
+
+    def validate(self, form_class, rows, instances):
+        """
+        Validate `rows` with `form_class`, which fills in `instances`. Return cleaned data of the rows
+        and errors of the invalid ones by position. Fields missing from a row keep the values of a saved instance.
+        """
+        forms = []
+        for position, (row, instance) in enumerate(zip(rows, instances)):
+            if not isinstance(row, dict):
+                raise ApiError({'errors': {position: {'__all__': ['Expected an object']}}})
+            data = {**model_to_dict(instance, form_class._meta.fields), **row} if instance.pk else row
+            forms.append(form_class(data=data, instance=instance))
+        errors = {position: form.errors for position, form in enumerate(forms) if not form.is_valid()}
+        return [form.cleaned_data for form in forms], errors
+
+
+class VisitsApiView(BulkApiView):
+    """
+    Visits of the user. `?date=`, `?from=` and `?to=` filter the list by date.
+    """
+    model = Visit
+    fields = ('id', 'client', 'date', 'time', 'duration', 'end_time', 'notes')
+
+    def get_queryset(self):
+        return Visit.objects.owned_by(self.request.user)
+
+    def filter_queryset(self, queryset):
+        for parameter, lookup in (('date', 'date'), ('from', 'date__gte'), ('to', 'date__lte')):
+            if not self.request.GET.get(parameter):
+                continue
+            try:
+                queryset = queryset.filter(**{lookup: datetime.date.fromisoformat(self.request.GET[parameter])})
+            except ValueError:
+                raise ApiError({'error': f'{parameter} must be a date'})
+        return queryset
+
+    def create(self, rows):
+        visits = self.build(rows, [Visit() for _ in rows])
+        visits = Visit.objects.bulk_create(visits)
+        invalidate_schedule(self.request.user.pk)
+        return visits
+
+    def update(self, pairs):
+        instances = [instance for instance, row in pairs]
+        visits = self.build([row for instance, row in pairs], instances)
+        Visit.objects.bulk_update(visits, ['client', 'date', 'time', 'duration', 'end_time', 'notes'])
+        invalidate_schedule(self.request.user.pk)
+        return visits
+
+    def delete_objects(self, visits):
+        # The visits and their reminder jobs are deleted without fetching the visits first
+        deleted, per_model = visits.delete()
+        return per_model.get(Visit._meta.label, 0)
+
+    def build(self, rows, visits):
+        """
+        Fill `visits` from validated `rows`, checking clients and overlaps of the whole batch at once.
+        """
+        cleaned, errors = self.validate(VisitTimeForm, rows, visits)
+        client_pks = [row.get('client', visit.client_id) for row, visit in zip(rows, visits)]
+        clients = Client.objects.owned_by(self.request.user).in_bulk(
+            {pk for pk in client_pks if isinstance(pk, int)}
+        )
+        for position, (client_pk, visit, data) in enumerate(zip(client_pks, visits, cleaned)):
+            client = clients.get(client_pk) if isinstance(client_pk, int) else None
+            if client is None:
+                errors.setdefault(position, {})['client'] = ['Unknown client']
+            if position in errors:
+                continue
+            visit.client = client
+            visit.owner_id = self.request.user.pk
+            visit.end_time = data['end_time']
+        if errors:
+            raise ApiError({'errors': errors})
+        overlapping = overlapping_visits(self.request.user, visits, [visit.pk for visit in visits if visit.pk])
+        if overlapping:
+            raise ApiError({'errors': {
+                position: {'__all__': ['This time overlaps another visit']} for position in sorted(overlapping)
+            }})
+        return visits
+
+
+class ClientsApiView(BulkApiView):
+    """
+    Clients of the user. `?search=` filters the list like the clients page.
+    """
+    model = Client
+    fields = ('id', 'first_name', 'last_name', 'phone_number')
+
+    def get_queryset(self):
+        return Client.objects.owned_by(self.request.user)
+
+    def filter_queryset(self, queryset):
+        return search_clients(queryset, self.request.GET.get('search'))
+
+    def create(self, rows):
+        clients = self.build(rows, [Client(user=self.request.user) for _ in rows])
+        return Client.objects.bulk_create(clients)
+
+    def update(self, pairs):
+        clients = self.build([row for instance, row in pairs], [instance for instance, row in pairs])
+        Client.objects.bulk_update(clients, ['first_name', 'last_name', 'search_name', 'phone_number'])
+        # Names of the clients' visits are part of the cached schedules
+        for owner_pk in Visit.objects.filter(client__in=clients).values_list('owner', flat=True).distinct():
+            invalidate_schedule(owner_pk)
+        return clients
+
+    def delete_objects(self, clients):
+        # Visits of the clients are deleted with them, invalidating their schedules
+        deleted, per_model = clients.delete()
+        return per_model.get(Client._meta.label, 0)
+
+    def build(self, rows, clients):
+        """
+        Fill `clients` from validated `rows`, checking phone numbers of the whole batch at once.
+        """
+        cleaned, errors = self.validate(ClientBulkForm, rows, clients)
+        if errors:
+            raise ApiError({'errors': errors})
+        for client in clients:
+            client.search_name = normalize(f'{client.first_name} {client.last_name}')
+        duplicates = duplicate_phone_numbers(clients, [client.pk for client in clients if client.pk])
+        if duplicates:
+            raise ApiError({'errors': {
+                position: {'phone_number': ['Client with this Phone number already exists.']}
+                for position in sorted(duplicates)
+            }})
+        return clients
@@ -0,0 +1,244 @@
+"""
+Benchmark suite of the booking app: every url of booking.urls, the sms tasks against a stub gateway
+and the visit cancellation, run against seeded data.
+
+Each benchmark is a function registered with @benchmark. It gets a Context holding the seeded data and
+times code with `context.measure()`, which records wall time and queries of every round. Reports are
+plain dicts, written as JSON so the reports of two commits can be compared with `compare()`.
+"""
+import datetime
+import platform
+import subprocess
+from contextlib import contextmanager
+from functools import partial
+
+import django
+from celery import current_app
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import Client as TestClient
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from booking import sms
+from booking.cancellation import cancel_visits
+from booking.instrumentation import Measurement
+from booking.models import OutboundSms, Visit
+from booking.outbox import enqueue
+from booking.planner import with_recipient
+from booking.sms_stub import StubSmsGateway
+from booking.tasks import drain_sms_outbox, send_sms_remainder_chunk
+from booking.urls import app_name, urlpatterns
+
+SUITE = []
+# Logging out would end the session the other urls are requested with
+SKIPPED_URLS = ('logout',)
+
+
+def benchmark(func):
+    """
+    Register `func` in SUITE.
+    """
+    SUITE.append(func)
+    return func
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+
+class Context:
+    """
+    Seeded data the benchmarks run against and the results they measured.
+    """
+
+    def __init__(self, user, rounds, sms_latency=0, only=None):
+        self.user = user
+        self.rounds = rounds
+        self.sms_latency = sms_latency
+        self.only = only
+        self.date = Visit.objects.owned_by(user).order_by('date').values_list('date', flat=True).first()
+        self.visit = Visit.objects.owned_by(user).filter(date=self.date).order_by('time').first()
+        self.results = {}
+
+    def measure(self, name, func, setup=None):
+        """
+        Run `func` `rounds` times and record the results under `name`. `setup` is run before each round,
+        outside of the measurement.
+        """
+        if self.only and self.only not in name:
+            return
+        timings = []
+        queries = []
+        for _ in range(self.rounds):
+            if setup:
+                setup()
+            with Measurement() as measurement:
+                func()
+            timings.append(measurement.wall_time)
+            queries.append(measurement.queries)
+        timings.sort()
+        self.results[name] = {
+            'rounds': len(timings),
+            'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+            'min_ms': round(timings[0] * 1000, 3),
+            'p50_ms': round(percentile(timings, 50) * 1000, 3),
+            'p99_ms': round(percentile(timings, 99) * 1000, 3),
+            'ops_per_sec': round(len(timings) / sum(timings), 1),
+            'queries': max(queries),
+        }
+
+    def reset_balance(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(balance=1000)
+
+
+def run(context):
+    """
+    Run every benchmark of SUITE and return the report.
+    """
+    for func in SUITE:
+        func(context)
+    return {
+        'meta': {
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'rounds': context.rounds,
+        },
+        'results': context.results,
+    }
+
+
+def compare(baseline, report, threshold=0.2):
+    """
+    `(name, metric, old, new)` of the results of `report` which are more than `threshold` (a fraction)
+    slower than in `baseline`, or run more queries.
+    """
+    regressions = []
+    for name, result in report['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            continue
+        if result['p50_ms'] > old['p50_ms'] * (1 + threshold):
+            regressions.append((name, 'p50_ms', old['p50_ms'], result['p50_ms']))
+        if result['queries'] > old['queries']:
+            regressions.append((name, 'queries', old['queries'], result['queries']))
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def stub_gateway(latency):
+    """
+    Send the sms of tasks run in this process to a local stub gateway, running the tasks eagerly.
+    """
+    always_eager = current_app.conf.task_always_eager
+    with StubSmsGateway(latency=latency) as stub, override_settings(SMS_API_URL=stub.url):
+        # The process gateway is created again against the stub url, and again after it stops
+        sms._gateway = None
+        current_app.conf.task_always_eager = True
+        try:
+            yield stub
+        finally:
+            current_app.conf.task_always_eager = always_eager
+            sms._gateway = None
+
+
+def get_url(client, url):
+    response = client.get(url, HTTP_AUTHORIZATION=f'Bearer {settings.METRICS_TOKEN}')
+    if response.status_code != 200:
+        raise AssertionError(f'{url} answered {response.status_code}')
+    # Streamed responses are only produced while they are read
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+@benchmark
+def urls(context):
+    client = TestClient()
+    client.force_login(context.user)
+    # Requests are answered in process, coming from the test client's host like in tests, and the metrics
+    # endpoint is scraped with a token
+    with override_settings(
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], METRICS_TOKEN=settings.METRICS_TOKEN or 'benchmark'
+    ):
+        for pattern in urlpatterns:
+            if pattern.name in SKIPPED_URLS:
+                continue
+            kwargs = {}
+            if 'pk' in pattern.pattern.converters:
+                kwargs['pk'] = context.visit.pk if pattern.name.startswith('visit') else context.visit.client_id
+            url = reverse(f'{app_name}:{pattern.name}', kwargs=kwargs)
+            context.measure(f'url {pattern.name}', partial(get_url, client, url))
+
+
+@benchmark
+def sms_tasks(context):
+    visits = Visit.objects.owned_by(context.user).filter(date=context.date)
+    messages = [
+        (context.user.pk, visit_pk, to.lstrip('+'), 'Benchmark')
+        for visit_pk, to in with_recipient(visits).values_list('pk', 'to')
+    ]
+
+    def clear_outbox():
+        context.reset_balance()
+        # Reminders already in the outbox would not be queued again
+        OutboundSms.objects.filter(owner=context.user).delete()
+
+    def fill_outbox():
+        clear_outbox()
+        enqueue(OutboundSms.CANCELLATION, messages)
+
+    with stub_gateway(context.sms_latency):
+        context.measure(
+            'task send_sms_remainder_chunk',
+            lambda: send_sms_remainder_chunk.apply(
+                kwargs={'user_pks': [context.user.pk], 'date': context.date.isoformat()}
+            ).get(),
+            setup=clear_outbox,
+        )
+        context.measure(
+            'task drain_sms_outbox',
+            lambda: drain_sms_outbox.apply().get(),
+            setup=fill_outbox,
+        )
+
+
+@benchmark
+def cancellation(context):
+    visits = list(Visit.objects.owned_by(context.user).filter(date=context.date))
+    # A day after all seeded visits, filled with copies of the first day's visits before every round
+    date = Visit.objects.owned_by(context.user).order_by('-date').values_list('date', flat=True)[0]
+    date += datetime.timedelta(days=1)
+
+    def setup():
+        context.reset_balance()
+        Visit.objects.bulk_create([
+            Visit(
+                date=date, time=visit.time, duration=visit.duration, end_time=visit.end_time,
+                client_id=visit.client_id, owner=context.user,
+            )
+            for visit in visits
+        ])
+
+    with stub_gateway(context.sms_latency):
+        context.measure(
+            'cancel_visits',
+            lambda: cancel_visits(context.user, date, date, text='Benchmark'),
+            setup=setup,
+        )
@@ -0,0 +1,75 @@
+"""
+Sms billing. Funds are reserved before sending and unused ones are refunded afterwards,
+always with a single batched UPDATE and matching `SmsCharge` ledger rows.
+"""
+from collections import namedtuple
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, When
+
+from booking.models import SmsCharge
+
+Reservation = namedtuple('Reservation', 'messages amount')
+
+
+def _add_to_balances(amounts):
+    """
+    Add `amounts[user_pk]` to the balance of each user in one UPDATE, relative to the current value.
+    """
+    get_user_model().objects.filter(pk__in=amounts).update(
+        balance=Case(
+            *[When(pk=user_pk, then=F('balance') + amount) for user_pk, amount in amounts.items()],
+            default=F('balance'),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+def reserve(messages):
+    """
+    Hold the price of `messages[user_pk]` sms for each user. Users whose balance does not cover it are skipped.
+    Returns a `Reservation` for every user whose funds are now held.
+    """
+    messages = {user_pk: count for user_pk, count in messages.items() if count}
+    if not messages:
+        return {}
+    with transaction.atomic():
+        # Locking in pk order keeps concurrent reservations for overlapping users from deadlocking
+        users = get_user_model().objects.select_for_update().filter(pk__in=messages).order_by('pk')
+        reservations = {
+            user_pk: Reservation(messages[user_pk], messages[user_pk] * sms_price)
+            for user_pk, balance, sms_price in users.values_list('pk', 'balance', 'sms_price')
+            if balance >= messages[user_pk] * sms_price
+        }
+        if reservations:
+            _add_to_balances({user_pk: -reservation.amount for user_pk, reservation in reservations.items()})
+            SmsCharge.objects.bulk_create([
+                SmsCharge(user_id=user_pk, kind=SmsCharge.RESERVATION, amount=-amount, messages=count)
+                for user_pk, (count, amount) in reservations.items()
+            ])
+    return reservations
+
+
+def release(reservations, sent):
+    """
+    Refund the part of each reservation which was not spent on the `sent[user_pk]` delivered sms.
+    Returns the total amount charged.
+    """
+    refunds = {}
+    charged = Decimal('0.00')
+    for user_pk, (count, amount) in reservations.items():
+        unused = count - sent.get(user_pk, 0)
+        refund = amount / count * unused
+        charged += amount - refund
+        if unused:
+            refunds[user_pk] = Reservation(unused, refund)
+    if refunds:
+        with transaction.atomic():
+            _add_to_balances({user_pk: refund.amount for user_pk, refund in refunds.items()})
+            SmsCharge.objects.bulk_create([
+                SmsCharge(user_id=user_pk, kind=SmsCharge.REFUND, amount=amount, messages=count)
+                for user_pk, (count, amount) in refunds.items()
+            ])
+    return charged
@@ -0,0 +1,51 @@
+"""
+Checks of whole batches of visits and clients, each made with a single query instead of one per object.
+"""
+from collections import Counter
+
+from booking.models import Client, Visit
+
+
+def overlapping_visits(owner, visits, exclude_pks=()):
+    """
+    Positions in `visits` of those overlapping each other or another visit of `owner`.
+    Visits with pks in `exclude_pks` are the ones being replaced by the batch.
+    """
+    existing = Visit.objects.owned_by(owner).filter(
+        date__in={visit.date for visit in visits}
+    ).exclude(pk__in=exclude_pks).values_list('date', 'time', 'end_time')
+    periods = sorted(
+        [(date, time, end_time, None) for date, time, end_time in existing]
+        + [(visit.date, visit.time, visit.end_time, position) for position, visit in enumerate(visits)],
+        key=lambda period: period[:3]
+    )
+    overlapping = set()
+    # The visit of the day ending last so far
+    latest = None
+    for date, time, end_time, position in periods:
+        if latest is not None and latest[0] == date and time < latest[1]:
+            overlapping.update(pos for pos in (position, latest[2]) if pos is not None)
+        if latest is None or latest[0] != date or end_time > latest[1]:
+            latest = (date, end_time, position)
+    return overlapping
+
+
+def duplicate_phone_numbers(clients, exclude_pks=(), keep_first=False):
+    """
+    Positions in `clients` of those whose phone number belongs to another client or repeats in the batch.
+    Clients with pks in `exclude_pks` are the ones being replaced by the batch. With `keep_first`,
+    the first of the clients sharing a new number is not a duplicate.
+    """
+    numbers = [str(client.phone_number) for client in clients]
+    taken = set(
+        str(number) for number in Client.objects.filter(
+            phone_number__in=set(numbers)
+        ).exclude(pk__in=exclude_pks).values_list('phone_number', flat=True)
+    )
+    if keep_first:
+        first = {}
+        for position, number in enumerate(numbers):
+            first.setdefault(number, position)
+        return {position for position, number in enumerate(numbers) if number in taken or first[number] != position}
+    counts = Counter(numbers)
+    return {position for position, number in enumerate(numbers) if number in taken or counts[number] > 1}
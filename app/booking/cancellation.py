@@ -0,0 +1,40 @@
+"""
+Bulk cancellation of visits.
+"""
+from django.db import transaction
+
+from booking.models import OutboundSms, Visit
+from booking.outbox import enqueue
+from booking.planner import with_recipient
+from booking.tasks import drain_sms_outbox
+
+
+class CancellationError(Exception):
+    pass
+
+
+def cancel_visits(user, from_date, to_date, text=None):
+    """
+    Delete visits of `user` between `from_date` and `to_date` inclusive and, if `text` is given,
+    queue sms to their clients in the same transaction. Returns the number of cancelled visits.
+    Runs a fixed number of queries however many visits are in the range.
+    """
+    visits = Visit.objects.owned_by(user).filter(date__gte=from_date, date__lte=to_date)
+    with transaction.atomic():
+        if text:
+            # Snapshot the numbers while the visits still exist, the outbox never reads them back
+            messages = [
+                (user.pk, visit_pk, to.lstrip('+'), text)
+                for visit_pk, to in with_recipient(visits).values_list('pk', 'to')
+            ]
+            # The price is held now, so it can't be spent elsewhere before the sms are sent
+            if messages and user.pk not in enqueue(OutboundSms.CANCELLATION, messages):
+                raise CancellationError('Not enough money on your account')
+            if messages:
+                transaction.on_commit(drain_sms_outbox.delay)
+        # The visits and their reminder jobs are deleted without fetching the visits first
+        deleted, per_model = visits.delete()
+        cancelled = per_model.get(Visit._meta.label, 0)
+        if not cancelled:
+            raise CancellationError('No visits found for this period')
+    return cancelled
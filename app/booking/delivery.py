@@ -0,0 +1,119 @@
+"""
+Delivery of SMS batches with bounded retries.
+"""
+import random
+import time
+
+import requests
+from django.conf import settings
+
+from booking.models import FailedSms
+from booking.sms import SmsTokenManager
+
+SENT = 'sent'
+RETRY = 'retry'
+EXPIRED_TOKEN = 'expired_token'
+PERMANENT = 'permanent'
+
+
+def classify(outcome):
+    """
+    Return the outcome kind and a short description of a single `SmsGateway.send_many` result.
+    """
+    if isinstance(outcome, requests.RequestException):
+        return RETRY, f'{type(outcome).__name__}: {outcome}'
+    if outcome.status_code == 429 or outcome.status_code >= 500:
+        return RETRY, f'HTTP {outcome.status_code}'
+    if outcome.status_code == 401:
+        return EXPIRED_TOKEN, 'HTTP 401'
+    try:
+        result = outcome.json()['result']
+    except (ValueError, KeyError, TypeError):
+        if outcome.status_code >= 400:
+            return PERMANENT, f'HTTP {outcome.status_code}'
+        return RETRY, 'Malformed response'
+    if result == 'OK':
+        return SENT, ''
+    # The api answers 'error' when the token has expired
+    if result == 'error':
+        return EXPIRED_TOKEN, 'Result error'
+    if outcome.status_code >= 400:
+        return PERMANENT, f'HTTP {outcome.status_code}: {result}'
+    return RETRY, f'Result {result}'
+
+
+def backoff_delay(attempt, base_delay=None, max_delay=None):
+    """
+    Exponential backoff with full jitter for the given attempt number (starting from 1).
+    """
+    base_delay = settings.SMS_RETRY_BASE_DELAY if base_delay is None else base_delay
+    max_delay = settings.SMS_RETRY_MAX_DELAY if max_delay is None else max_delay
+    return random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+
+
+def login(tokens):
+    """
+    Return a token from `tokens` and an empty error, or None and a short description of the failed login.
+    """
+    try:
+        token = tokens.get_token()
+    except (requests.RequestException, ValueError, KeyError, TypeError) as error:
+        return None, f'Login {type(error).__name__}: {error}'
+    if not token:
+        return None, 'Login returned no token'
+    return token, ''
+
+
+def deliver_each(gateway, messages, max_attempts=None):
+    """
+    Send `(to, text)` messages, retrying failed ones up to `max_attempts` times in total.
+    Returns an `(error, attempts)` pair for every message, in order. The error is empty for sent messages.
+    A failed login fails the attempt of every pending message, like a transient error.
+    """
+    max_attempts = max_attempts or settings.SMS_MAX_ATTEMPTS
+    tokens = SmsTokenManager(gateway)
+    results = [None] * len(messages)
+    pending = list(enumerate(messages))
+    if not pending:
+        return results
+    token = None
+    for attempt in range(1, max_attempts + 1):
+        if token is None:
+            token, login_error = login(tokens)
+        if token is None:
+            outcomes = [(RETRY, login_error)] * len(pending)
+        else:
+            outcomes = [classify(outcome) for outcome in gateway.send_many(token, [m for _, m in pending])]
+        retry = []
+        token_expired = False
+        for (index, message), (kind, error) in zip(pending, outcomes):
+            if kind == SENT:
+                results[index] = ('', attempt)
+            elif kind == PERMANENT or attempt == max_attempts:
+                results[index] = (error, attempt)
+            else:
+                retry.append((index, message))
+                token_expired = token_expired or kind == EXPIRED_TOKEN
+        pending = retry
+        if not pending:
+            break
+        if token_expired:
+            tokens.invalidate(token)
+            token = None
+        time.sleep(backoff_delay(attempt))
+    return results
+
+
+def deliver(gateway, messages, owner_id=None, max_attempts=None):
+    """
+    Send `(to, text)` messages like `deliver_each`. Messages that could not be delivered are stored
+    as `FailedSms`. Returns the number of sent messages.
+    """
+    messages = list(messages)
+    results = deliver_each(gateway, messages, max_attempts)
+    FailedSms.objects.bulk_create([
+        FailedSms(owner_id=owner_id, to=to, text=text, error=error, attempts=attempts)
+        for (to, text), (error, attempts) in zip(messages, results)
+        if error
+    ])
+    return sum(1 for error, attempts in results if not error)
@@ -0,0 +1,91 @@
+"""
+Export of visits and clients as CSV or newline delimited JSON. Rows are read with a server-side cursor
+and rendered one at a time, so memory stays flat however many rows a user has. Under ASGI the lines
+are read through `aiter_lines`, as the database can't be queried from the event loop.
+"""
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from booking.models import Client, Visit
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+VISIT_COLUMNS = ('id', 'date', 'time', 'duration', 'client_id', 'first_name', 'last_name', 'phone_number', 'notes')
+CLIENT_COLUMNS = ('id', 'first_name', 'last_name', 'phone_number')
+
+
+def visit_rows(user, from_date=None, to_date=None):
+    """
+    Visits of `user` from `from_date` to `to_date` as tuples of VISIT_COLUMNS, in date and time order.
+    """
+    visits = Visit.objects.owned_by(user)
+    if from_date:
+        visits = visits.filter(date__gte=from_date)
+    if to_date:
+        visits = visits.filter(date__lte=to_date)
+    return visits.order_by('date', 'time', 'pk').values_list(
+        'pk', 'date', 'time', 'duration', 'client', 'client__first_name', 'client__last_name',
+        'client__phone_number', 'notes'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def client_rows(user):
+    """
+    Clients of `user` as tuples of CLIENT_COLUMNS, in pk order.
+    """
+    return Client.objects.owned_by(user).order_by('pk').values_list(
+        'pk', 'first_name', 'last_name', 'phone_number'
+    ).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+class Echo:
+    """
+    File-like object handing back what csv.writer writes to it.
+    """
+
+    def write(self, value):
+        return value
+
+
+def render_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + '\n'
+
+
+def render(export_format, columns, rows):
+    """
+    Lines of `rows` rendered in `export_format`, one of FORMATS.
+    """
+    if export_format == 'ndjson':
+        return render_ndjson(columns, rows)
+    return render_csv(columns, rows)
+
+
+def read_lines(lines, count):
+    return ''.join(islice(lines, count))
+
+
+async def aiter_lines(lines, batch_size=None):
+    """
+    Async iterator over rendered `lines`, read `batch_size` at a time in the request's thread.
+    """
+    batch_size = batch_size or settings.EXPORT_CHUNK_SIZE
+    read = sync_to_async(read_lines, thread_sensitive=True)
+    while True:
+        batch = await read(lines, batch_size)
+        if not batch:
+            return
+        yield batch
@@ -1,5 +1,5 @@
 from django import forms
-from .models import Visit
+from .models import Client, Visit, visit_end_time
 import datetime
 from django.utils.translation import gettext as _
 from django.contrib.auth.forms import UserCreationForm
@@ -26,6 +26,84 @@ class VisitFilterForm(forms.ModelForm):
         self.fields['date'].initial = datetime.datetime.now()
 
 
+class VisitTimeForm(forms.ModelForm):
+    """
+    Date, time and duration of a visit, checked without querying the database.
+    """
+
+    class Meta:
+        model = Visit
+        fields = ('date', 'time', 'duration', 'notes')
+        widgets = {
+            'date': forms.widgets.DateInput(attrs={'type': 'date'}),
+            'time': forms.widgets.TimeInput(attrs={'type': 'time'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['duration'].required = False
+
+    def clean_duration(self):
+        duration = self.cleaned_data['duration']
+        return Visit.DEFAULT_DURATION if duration is None else duration
+
+    def clean(self):
+        cleaned_data = super().clean()
+        date, time, duration = cleaned_data.get('date'), cleaned_data.get('time'), cleaned_data.get('duration')
+        if date is None or time is None or duration is None:
+            return cleaned_data
+        cleaned_data['end_time'] = visit_end_time(date, time, duration)
+        if cleaned_data['end_time'] is None:
+            raise forms.ValidationError('Visit must end before midnight')
+        return cleaned_data
+
+
+class VisitForm(VisitTimeForm):
+    overlap_error = 'This time overlaps another visit'
+
+    class Meta(VisitTimeForm.Meta):
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        client, end_time = cleaned_data.get('client'), cleaned_data.get('end_time')
+        if client is None or end_time is None:
+            return cleaned_data
+        # One lookup on the (owner, date, time) index instead of loading the whole day
+        overlapping = Visit.objects.overlapping(client.user_id, cleaned_data['date'], cleaned_data['time'], end_time)
+        if overlapping.exclude(pk=self.instance.pk).exists():
+            raise forms.ValidationError(self.overlap_error)
+        return cleaned_data
+
+
+class ClientBulkForm(forms.ModelForm):
+    """
+    Client fields checked without querying the database. Uniqueness of phone numbers is checked
+    for the whole batch by booking.bulk.
+    """
+
+    class Meta:
+        model = Client
+        fields = ('first_name', 'last_name', 'phone_number')
+
+    def validate_unique(self):
+        pass
+
+
+class ClientImportForm(forms.Form):
+    file = forms.FileField(help_text='CSV with a first_name,last_name,phone_number header, or JSON objects')
+    format = forms.ChoiceField(choices=[('', 'From file name'), ('csv', 'CSV'), ('json', 'JSON')], required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('file') and not cleaned_data.get('format'):
+            extension = cleaned_data['file'].name.rsplit('.', 1)[-1].lower()
+            if extension not in ('csv', 'json', 'ndjson', 'jsonl'):
+                raise forms.ValidationError('Select the format of the file')
+            cleaned_data['format'] = 'csv' if extension == 'csv' else 'json'
+        return cleaned_data
+
+
 class VisitsCancelForm(forms.Form):
     from_date = forms.DateField(widget=forms.widgets.DateInput(attrs={'type': 'date'}))
     to_date = forms.DateField(widget=forms.widgets.DateInput(attrs={'type': 'date'}))
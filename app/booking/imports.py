@@ -0,0 +1,113 @@
+"""
+Import of clients from CSV or JSON files. The file is read row by row and handled in chunks: each chunk
+is validated, checked for phone numbers already in use with one query and inserted with one bulk insert.
+Invalid rows are reported and skipped, the rest of the file is still imported.
+"""
+import csv
+import io
+import json
+from collections import namedtuple
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from booking.bulk import duplicate_phone_numbers
+from booking.forms import ClientBulkForm
+from booking.models import Client
+from booking.search import normalize
+
+FORMATS = ('csv', 'json')
+
+ImportResult = namedtuple('ImportResult', 'created errors')
+
+
+class ClientImportError(Exception):
+    pass
+
+
+def read_rows(file, file_format):
+    """
+    Yield `(line, row)` pairs of a binary `file`. CSV files need a header with the client fields,
+    JSON files hold an object per line or a list of objects.
+    """
+    text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    try:
+        if file_format == 'csv':
+            reader = csv.DictReader(text)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        first = text.read(1)
+        if first == '[':
+            # A list can't be parsed line by line, it is loaded whole
+            try:
+                rows = json.loads(first + text.read())
+            except ValueError:
+                raise ClientImportError('Invalid JSON')
+            if not isinstance(rows, list):
+                raise ClientImportError('Expected a list of objects')
+            yield from enumerate(rows, start=1)
+            return
+        for line, row in enumerate(chain([first + text.readline()], text), start=1):
+            if not row.strip():
+                continue
+            try:
+                yield line, json.loads(row)
+            except ValueError:
+                # Reported as an invalid row
+                yield line, row
+    except UnicodeDecodeError:
+        raise ClientImportError('The file must be UTF-8 encoded')
+    except csv.Error as error:
+        raise ClientImportError(f'Invalid CSV: {error}')
+
+
+def import_clients(user, rows, chunk_size=None):
+    """
+    Create clients of `user` from `(line, row)` pairs. Returns an ImportResult with the number of
+    created clients and `(line, errors)` of the rows which were skipped.
+    """
+    chunk_size = chunk_size or settings.IMPORT_CHUNK_SIZE
+    rows = iter(rows)
+    created = 0
+    errors = []
+    with transaction.atomic():
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            clients, chunk_errors = build_clients(user, chunk)
+            Client.objects.bulk_create(clients)
+            created += len(clients)
+            errors.extend(chunk_errors)
+    return ImportResult(created, errors)
+
+
+def build_clients(user, chunk):
+    """
+    Valid clients of a chunk of `(line, row)` pairs and errors of the invalid rows.
+    """
+    candidates = []
+    errors = []
+    for line, row in chunk:
+        if not isinstance(row, dict):
+            errors.append((line, {'__all__': ['Expected an object']}))
+            continue
+        form = ClientBulkForm(data=row, instance=Client(user=user))
+        if not form.is_valid():
+            errors.append((line, {field: list(messages) for field, messages in form.errors.items()}))
+            continue
+        client = form.instance
+        client.search_name = normalize(f'{client.first_name} {client.last_name}')
+        candidates.append((line, client))
+    # Earlier chunks are already inserted, so the query sees their numbers too
+    duplicates = duplicate_phone_numbers([client for line, client in candidates], keep_first=True)
+    clients = []
+    for position, (line, client) in enumerate(candidates):
+        if position in duplicates:
+            errors.append((line, {'phone_number': ['Client with this Phone number already exists.']}))
+        else:
+            clients.append(client)
+    errors.sort(key=lambda error: error[0])
+    return clients, errors
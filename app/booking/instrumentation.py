@@ -0,0 +1,113 @@
+"""
+Measurement of the queries, database time, booking.stats counters and wall time of a block of code.
+
+Queries are seen through an execute wrapper installed on every database connection. Running measurements
+are kept in a context variable, so queries an async view runs in sync_to_async threads are counted too.
+"""
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+_running = ContextVar('measurements', default=())
+
+# Queries managing transactions, their savepoint names differ every time
+TRANSACTION_SQL = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT', 'BEGIN', 'COMMIT', 'ROLLBACK')
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def sql_shape(sql):
+    """
+    `sql` with lists of IN placeholders collapsed, so the same query with a different number of pks has one shape.
+    """
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class Measurement:
+    """
+    Context manager measuring the code run inside it. Nested measurements all count the queries.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.wall_time = 0.0
+        self.shapes = Counter()
+        self.counters = Counter()
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        # Connections of this thread opened before the signal handler was connected
+        for alias in connections:
+            install(connections[alias])
+        self.token = _running.set(_running.get() + (self,))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _running.reset(self.token)
+        self.wall_time = time.perf_counter() - self.start
+
+    def add_query(self, sql, duration):
+        self.db_time += duration
+        self.queries += 1
+        if not sql.startswith(TRANSACTION_SQL):
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated_queries(self):
+        """
+        `(sql, count)` of query shapes run at least NPLUSONE_THRESHOLD times, most repeated first.
+        """
+        return [
+            (sql, count) for sql, count in self.shapes.most_common()
+            if count >= settings.NPLUSONE_THRESHOLD
+        ]
+
+    def server_timing(self):
+        """
+        Value of the Server-Timing header describing the measurement.
+        """
+        hits = sum(count for name, count in self.counters.items() if name.endswith('_hits'))
+        misses = sum(count for name, count in self.counters.items() if name.endswith('_misses'))
+        timings = [
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'cache;desc="{hits} hits, {misses} misses"',
+            f'total;dur={self.wall_time * 1000:.1f}',
+        ]
+        repeated = self.repeated_queries()
+        if repeated:
+            timings.append(f'nplusone;desc="{len(repeated)} repeated queries"')
+        return ', '.join(timings)
+
+
+def count(name, delta=1):
+    """
+    Add `delta` to the counter `name` of the innermost running measurement.
+    """
+    running = _running.get()
+    if running:
+        running[-1].counters[name] += delta
+
+
+def execute(execute, sql, params, many, context):
+    running = _running.get()
+    if not running:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - start
+        for measurement in running:
+            measurement.add_query(sql, duration)
+
+
+def install(connection, **kwargs):
+    if execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute)
+
+
+connection_created.connect(install, dispatch_uid='booking.instrumentation.install')
@@ -0,0 +1,84 @@
+"""
+Django command running the benchmark suite and writing its JSON report.
+"""
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import benchmarks
+from booking.seeding import DAY_MINUTES, seed
+
+
+class Command(BaseCommand):
+    """Django command to run the benchmark suite."""
+    help = (
+        'Seed tenants with clients and visits, measure every url, the sms tasks and the cancellation '
+        'and write a JSON report. With --compare, fail on regressions against an earlier report.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=10)
+        parser.add_argument('--clients', type=int, default=200, help='Clients per tenant.')
+        parser.add_argument('--visits', type=int, default=10, help='Visits per client.')
+        parser.add_argument('--days', type=int, default=30, help='Days the visits are spread over.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--rounds', type=int, default=20, help='Runs of every benchmark.')
+        parser.add_argument('--sms-latency', type=float, default=0, help='Stub gateway response time in seconds.')
+        parser.add_argument('--only', help='Run the benchmarks whose name contains this text.')
+        parser.add_argument('--output', help='File the JSON report is written to.')
+        parser.add_argument('--compare', help='Earlier JSON report to compare with.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Slowdown of the median counted as a regression, as a fraction.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        visits = options['clients'] * options['visits']
+        if visits > options['days'] * DAY_MINUTES:
+            raise CommandError(f'{visits} visits per tenant don\'t fit in {options["days"]} days')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        self.stdout.write('Seeding...')
+        users = seed(
+            users=options['tenants'],
+            clients_per_user=options['clients'],
+            visits_per_client=options['visits'],
+            days=options['days'],
+            seed=options['seed'],
+            prefix='benchmark-suite',
+        )
+        try:
+            context = benchmarks.Context(
+                users[0], options['rounds'], sms_latency=options['sms_latency'], only=options['only']
+            )
+            report = benchmarks.run(context)
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
+        report['meta'].update(
+            tenants=options['tenants'], clients=options['clients'], visits=options['visits'], seed=options['seed']
+        )
+
+        self.stdout.write(
+            f'{"benchmark":<40} {"ops/s":>9} {"mean ms":>9} {"p50 ms":>9} {"p99 ms":>9} {"queries":>7}'
+        )
+        for name, result in report['results'].items():
+            self.stdout.write(
+                f'{name:<40} {result["ops_per_sec"]:>9.1f} {result["mean_ms"]:>9.2f} '
+                f'{result["p50_ms"]:>9.2f} {result["p99_ms"]:>9.2f} {result["queries"]:>7}'
+            )
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2)
+
+        if baseline is not None:
+            regressions = benchmarks.compare(baseline, report, options['threshold'])
+            for name, metric, old, new in regressions:
+                self.stdout.write(self.style.ERROR(f'{name}: {metric} {old} -> {new}'))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {options["compare"]}'))
@@ -0,0 +1,40 @@
+"""
+Django command timing client searches of a user with many clients.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from booking.models import Client
+from booking.search import search_clients
+from booking.seeding import seed
+
+
+class Command(BaseCommand):
+    """Django command to benchmark client search."""
+    help = 'Seed a user with many clients and time searches by name, several words and phone digits.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=10)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stdout.write('Seeding...')
+        users = seed(users=1, clients_per_user=options['clients'], visits_per_client=0, prefix='search-benchmark')
+        try:
+            clients = Client.objects.filter(user=users[0]).order_by('-first_name')
+            for query in ['nowak', 'wisniewska', 'Anna Wiśniewska', 'Maria Kowalski Nowak', '500 0001', '+48500000123']:
+                queryset = search_clients(clients, query)[:20]
+                self.stdout.write(self.style.MIGRATE_HEADING(query))
+                self.stdout.write(queryset.explain())
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    rows = len(list(queryset.all()))
+                elapsed = (time.perf_counter() - start) / options['repeat'] * 1000
+                self.stdout.write(f'{rows} rows in {elapsed:.2f} ms')
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
@@ -0,0 +1,67 @@
+"""
+Django command comparing memory and time of exporting visits loaded at once and streamed.
+"""
+import csv
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from booking import export
+from booking.models import Visit
+from booking.seeding import DAY_MINUTES, seed
+
+
+class Command(BaseCommand):
+    """Django command to benchmark visit export."""
+    help = 'Seed a user with many visits and compare exporting them from a loaded list and as a stream.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--visits', type=int, default=1000000)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stdout.write('Seeding...')
+        users = seed(
+            users=1,
+            clients_per_user=options['clients'],
+            visits_per_client=options['visits'] // options['clients'],
+            days=options['visits'] // DAY_MINUTES + 1,
+            prefix='export-benchmark',
+        )
+        try:
+            user = users[0]
+            self.stdout.write(f'{"export":<10} {"rows":>10} {"seconds":>8} {"peak MiB":>9}')
+            for name, export_visits in [('loaded', self.loaded), ('streamed', self.streamed)]:
+                tracemalloc.start()
+                start = time.perf_counter()
+                rows = export_visits(user)
+                elapsed = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+                tracemalloc.stop()
+                self.stdout.write(f'{name:<10} {rows:>10} {elapsed:>8.2f} {peak:>9.1f}')
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def loaded(self, user):
+        # What dumping through the admin amounts to: every visit and client instance in memory at once
+        visits = list(Visit.objects.filter(owner=user).select_related('client').order_by('date', 'time', 'pk'))
+        writer = csv.writer(export.Echo())
+        writer.writerow(export.VISIT_COLUMNS)
+        for visit in visits:
+            writer.writerow([
+                visit.pk, visit.date, visit.time, visit.duration, visit.client_id, visit.client.first_name,
+                visit.client.last_name, visit.client.phone_number, visit.notes,
+            ])
+        return len(visits)
+
+    def streamed(self, user):
+        # Lines are dropped as soon as they are produced, like a response sent to the client
+        rows = 0
+        for _ in export.render('csv', export.VISIT_COLUMNS, export.visit_rows(user)):
+            rows += 1
+        return rows - 1
@@ -0,0 +1,58 @@
+"""
+Django command printing plans and timings of the hot visit and client queries.
+"""
+import datetime
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from booking.models import Client, Visit
+from booking.seeding import seed
+
+
+class Command(BaseCommand):
+    """Django command to benchmark view queries."""
+    help = 'Seed a dataset and compare the join-based queries with the ones using the owner indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--clients', type=int, default=500, help='Clients per user.')
+        parser.add_argument('--visits', type=int, default=20, help='Visits per client.')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        start_date = datetime.date.today()
+        self.stdout.write('Seeding...')
+        users = seed(
+            users=options['users'],
+            clients_per_user=options['clients'],
+            visits_per_client=options['visits'],
+            start_date=start_date,
+            prefix='benchmark',
+        )
+        try:
+            user = users[0]
+            week_end = start_date + datetime.timedelta(days=6)
+            queries = [
+                ('index', 'client join', Visit.objects.filter(client__user=user, date=start_date).order_by('time')),
+                ('index', 'owner', Visit.objects.filter(owner=user, date=start_date).order_by('time')),
+                ('cancel range', 'client join',
+                 Visit.objects.filter(client__user=user, date__gte=start_date, date__lte=week_end)),
+                ('cancel range', 'owner', Visit.objects.filter(owner=user, date__gte=start_date, date__lte=week_end)),
+                ('clients', 'user', Client.objects.filter(user=user).order_by('-first_name')[:20]),
+                ('clients', 'user, name', Client.objects.filter(user=user).order_by('last_name', 'first_name')[:20]),
+            ]
+            for name, variant, queryset in queries:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name} ({variant})'))
+                self.stdout.write(queryset.explain())
+                start = time.perf_counter()
+                for _ in range(options['repeat']):
+                    rows = len(list(queryset.all()))
+                elapsed = (time.perf_counter() - start) / options['repeat'] * 1000
+                self.stdout.write(f'{rows} rows in {elapsed:.2f} ms')
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
@@ -0,0 +1,140 @@
+"""
+Django command load testing the read-heavy pages under a WSGI and an ASGI server.
+"""
+import os
+import shlex
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from booking.benchmarks import percentile
+from booking.seeding import seed
+
+SERVERS = {
+    'wsgi': 'gunicorn app.wsgi:application --bind 127.0.0.1:{port} --workers {workers} --threads {concurrency} '
+            '--log-level warning',
+    'asgi': 'uvicorn app.asgi:application --host 127.0.0.1 --port {port} --workers {workers} --log-level warning',
+}
+
+
+class Command(BaseCommand):
+    """Django command to load test the schedule, clients and account pages."""
+    help = (
+        'Seed a user, start each server against the same database and measure requests per second and '
+        'latency of concurrent clients loading the schedule, clients and account pages.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', choices=sorted(SERVERS),
+                            help='Server to test, all of them by default.')
+        parser.add_argument('--concurrency', type=int, default=20, help='Clients sending requests at once.')
+        parser.add_argument('--requests', type=int, default=2000, help='Requests per page and server.')
+        parser.add_argument('--workers', type=int, default=1, help='Server processes.')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--visits', type=int, default=10)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded data.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        self.stdout.write('Seeding...')
+        users = seed(
+            users=1,
+            clients_per_user=options['clients'],
+            visits_per_client=options['visits'],
+            prefix='server-benchmark',
+        )
+        try:
+            # The session is saved in the database the servers share
+            client = Client()
+            client.force_login(users[0])
+            cookies = {settings.SESSION_COOKIE_NAME: client.cookies[settings.SESSION_COOKIE_NAME].value}
+            paths = [
+                reverse('booking:index'),
+                reverse('booking:clients'),
+                reverse('booking:clients') + '?page=10',
+                reverse('booking:clients') + '?mode=cursor',
+                reverse('booking:account'),
+            ]
+            self.stdout.write(
+                f'{"server":<6} {"page":<24} {"req/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"errors":>6}'
+            )
+            for server in options['server'] or sorted(SERVERS):
+                with self.serve(server, options):
+                    for path in paths:
+                        self.load(server, path, cookies, options)
+        finally:
+            if not options['keep']:
+                get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
+
+    def serve(self, server, options):
+        command = SERVERS[server].format(**options)
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'app.settings')}
+        process = subprocess.Popen(shlex.split(command), env=env)
+        url = f'http://127.0.0.1:{options["port"]}{reverse("booking:login")}'
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.ConnectionError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    process.kill()
+                    raise CommandError(f'{server} server did not start: {command}')
+                time.sleep(0.2)
+        return Server(process)
+
+    def load(self, server, path, cookies, options):
+        url = f'http://127.0.0.1:{options["port"]}{path}'
+        per_client = options['requests'] // options['concurrency']
+
+        def run_client(_):
+            session = requests.Session()
+            session.cookies.update(cookies)
+            latencies = []
+            errors = 0
+            for _ in range(per_client):
+                start = time.perf_counter()
+                try:
+                    response = session.get(url, allow_redirects=False, timeout=30)
+                    errors += response.status_code != 200
+                except requests.RequestException:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+            return latencies, errors
+
+        # One round first, so connections and caches are warm when timing starts
+        run_client(None)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            results = list(executor.map(run_client, range(options['concurrency'])))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(latency for client_latencies, _ in results for latency in client_latencies)
+        errors = sum(client_errors for _, client_errors in results)
+        self.stdout.write(
+            f'{server:<6} {path:<24} {len(latencies) / elapsed:>8.1f} '
+            f'{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} {errors:>6}'
+        )
+
+
+class Server:
+    """
+    Context manager stopping a started server process.
+    """
+
+    def __init__(self, process):
+        self.process = process
+
+    def __enter__(self):
+        return self.process
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.process.terminate()
+        self.process.wait()
@@ -0,0 +1,44 @@
+"""
+Django command comparing SMS sending throughput against a local stand-in of the SMS api.
+"""
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from booking.sms import SmsGateway
+from booking.sms_stub import StubSmsGateway
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the SMS api client."""
+    help = 'Measure messages per second sent by the SMS api client against a local stub gateway.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--latency', type=float, default=0.02, help='Stub response time in seconds.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 8, 16])
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        messages = [(f'48600{i:06d}', 'Benchmark message') for i in range(options['messages'])]
+        with StubSmsGateway(latency=options['latency']) as stub:
+            # Baseline: a new connection for every message, one message at a time
+            start = time.perf_counter()
+            for to, text in messages:
+                requests.post(
+                    url=f'{stub.url}/sms',
+                    json={'from': 'Benchmark', 'to': to, 'text': text},
+                    headers={'Authorization': f'Bearer {stub.token}'},
+                )
+            self._report('requests.post', len(messages), time.perf_counter() - start)
+
+            for concurrency in options['concurrency']:
+                gateway = SmsGateway(base_url=stub.url, sender='Benchmark', concurrency=concurrency)
+                start = time.perf_counter()
+                gateway.send_many(stub.token, messages)
+                self._report(f'SmsGateway concurrency={concurrency}', len(messages), time.perf_counter() - start)
+                gateway.close()
+
+    def _report(self, name, count, elapsed):
+        self.stdout.write(f'{name:<32} {count} messages in {elapsed:.2f}s ({count / elapsed:.0f} msg/s)')
@@ -0,0 +1,40 @@
+"""
+Django command exporting visits or clients of a user.
+"""
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booking import export
+
+
+class Command(BaseCommand):
+    """Django command to export visits or clients."""
+    help = 'Stream visits or clients of a user as CSV or NDJSON to stdout or a file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('kind', choices=['visits', 'clients'])
+        parser.add_argument('--format', choices=list(export.FORMATS), default='csv')
+        parser.add_argument('--from', dest='from_date', type=datetime.date.fromisoformat)
+        parser.add_argument('--to', dest='to_date', type=datetime.date.fromisoformat)
+        parser.add_argument('--output', help='File to write to instead of stdout.')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["username"]} does not exist')
+        if options['kind'] == 'visits':
+            columns, rows = export.VISIT_COLUMNS, export.visit_rows(user, options['from_date'], options['to_date'])
+        else:
+            columns, rows = export.CLIENT_COLUMNS, export.client_rows(user)
+        lines = export.render(options['format'], columns, rows)
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,35 @@
+"""
+Django command importing clients of a user from a file.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from booking.imports import FORMATS, ClientImportError, import_clients, read_rows
+
+
+class Command(BaseCommand):
+    """Django command to import clients."""
+    help = 'Import clients of a user from a CSV or JSON file, reporting the rows which were skipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('file')
+        parser.add_argument('--format', choices=FORMATS, help='Format of the file, by default its extension.')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        try:
+            user = get_user_model().objects.get(username=options['username'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'User {options["username"]} does not exist')
+        file_format = options['format'] or ('csv' if options['file'].lower().endswith('.csv') else 'json')
+        with open(options['file'], 'rb') as file:
+            try:
+                result = import_clients(user, read_rows(file, file_format), options['chunk_size'])
+            except ClientImportError as error:
+                raise CommandError(str(error))
+        for line, errors in result.errors:
+            messages = '; '.join(f'{field}: {" ".join(field_errors)}' for field, field_errors in errors.items())
+            self.stderr.write(f'Line {line}: {messages}')
+        self.stdout.write(self.style.SUCCESS(f'Imported {result.created} clients, skipped {len(result.errors)} rows'))
@@ -0,0 +1,91 @@
+"""
+Django command seeding the database with synthetic users, clients and visits.
+"""
+import datetime
+import multiprocessing
+import time
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from booking.seeding import DAY_MINUTES, MAX_PHONE_NUMBERS, phone_numbers_taken, seed_tenant
+
+
+def seed_tenant_pk(tenant, **options):
+    """
+    Seed a tenant in a worker process and return the user's pk, model instances don't need to travel back.
+    """
+    return seed_tenant(tenant, **options).pk
+
+
+class Command(BaseCommand):
+    """Django command to seed the database."""
+    help = (
+        'Create users (tenants) with clients and visits spread over a date range. Tenants are seeded in '
+        'parallel processes, and the same seed always produces the same data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tenants', type=int, default=100)
+        parser.add_argument('--clients', type=int, default=100, help='Clients per tenant.')
+        parser.add_argument('--visits', type=int, default=10, help='Visits per client.')
+        parser.add_argument('--start-date', type=datetime.date.fromisoformat, help='First day, today by default.')
+        parser.add_argument('--days', type=int, default=365, help='Days the visits are spread over.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--first-tenant', type=int, default=0,
+                            help='Number of the first tenant, to add tenants to an earlier run. Runs on the same '
+                                 'database need disjoint tenant numbers, whatever their seed or prefix.')
+        parser.add_argument('--prefix', default='seed', help='Prefix of the usernames.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+        parser.add_argument('--copy', action='store_true', help='Load visits with COPY (PostgreSQL only).')
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        tenants = range(options['first_tenant'], options['first_tenant'] + options['tenants'])
+        visits = options['clients'] * options['visits']
+        if visits > options['days'] * DAY_MINUTES:
+            raise CommandError(f'{visits} visits per tenant don\'t fit in {options["days"]} days')
+        if tenants.stop * options['clients'] > MAX_PHONE_NUMBERS:
+            raise CommandError(f'Only {MAX_PHONE_NUMBERS} distinct phone numbers can be seeded')
+        if phone_numbers_taken(tenants, options['clients']):
+            raise CommandError(
+                f'Phone numbers of tenants {tenants.start}-{tenants.stop - 1} are already used, '
+                f'pass a --first-tenant past earlier runs'
+            )
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs PostgreSQL')
+        if connection.vendor == 'sqlite' and options['processes'] > 1:
+            self.stdout.write('SQLite has a single writer, seeding in one process')
+            options['processes'] = 1
+
+        seed = partial(
+            seed_tenant_pk,
+            clients_per_user=options['clients'],
+            visits_per_client=options['visits'],
+            start_date=options['start_date'] or datetime.date.today(),
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            copy=options['copy'],
+        )
+        start = time.perf_counter()
+        if options['processes'] > 1:
+            # Forked workers must not share the parent's database connections, each opens its own
+            connections.close_all()
+            with multiprocessing.get_context('fork').Pool(options['processes']) as pool:
+                self.report(pool.imap_unordered(seed, tenants), len(tenants), visits, start)
+        else:
+            self.report(map(seed, tenants), len(tenants), visits, start)
+
+    def report(self, seeded, tenants, visits, start):
+        done = 0
+        for done, _ in enumerate(seeded, start=1):
+            if done % max(tenants // 20, 1) == 0:
+                self.stdout.write(f'{done} tenants, {done * visits / (time.perf_counter() - start):.0f} visits/s')
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {done} tenants with {done * visits} visits in {elapsed:.1f}s'
+        ))
@@ -0,0 +1,147 @@
+"""
+Totals of the measured requests and celery tasks, kept per view and task with booking.stats so they
+add up across processes, and their exposition in the Prometheus text format. Each process buffers its
+totals and adds them to the shared cache every METRICS_FLUSH_INTERVAL seconds, so requests don't wait
+for the cache and are still served while it is down.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from booking import stats
+from booking.instrumentation import Measurement
+
+logger = logging.getLogger(__name__)
+
+# Key of the total, its Prometheus name, description and the divisor turning it into the exposed unit
+METRICS = (
+    ('total', 'booking_{kind}s_total', 'Number of {kind}s', 1),
+    ('queries', 'booking_{kind}_queries_total', 'Database queries run by {kind}s', 1),
+    ('db_ms', 'booking_{kind}_db_seconds_total', 'Time {kind}s spent in the database', 1000),
+    ('wall_ms', 'booking_{kind}_seconds_total', 'Wall time of {kind}s', 1000),
+    ('n_plus_one', 'booking_{kind}_n_plus_one_total', 'Query shapes repeated within one {kind}', 1),
+)
+
+# Measurements of the tasks running in this process, by task id
+_tasks = {}
+# Totals recorded in this process which aren't in the shared cache yet
+_pending = Counter()
+_pending_lock = threading.Lock()
+_flushed_at = time.monotonic()
+_cache_failing = False
+
+
+def metric_key(kind, name, metric):
+    return f'{kind}:{name}:{metric}'
+
+
+def totals(kind, name, measurement):
+    """
+    Totals added by `measurement` of the view or task `name`, logging its repeated queries.
+    """
+    repeated = measurement.repeated_queries()
+    for sql, times in repeated:
+        logger.warning('Possible N+1 in %s %s, query run %d times: %s', kind, name, times, sql)
+    values = {
+        'total': 1,
+        'queries': measurement.queries,
+        'db_ms': round(measurement.db_time * 1000),
+        'wall_ms': round(measurement.wall_time * 1000),
+        'n_plus_one': len(repeated),
+    }
+    return {metric_key(kind, name, metric): value for metric, value in values.items() if value}
+
+
+def record(kind, name, measurement):
+    """
+    Add `measurement` of the view or task `name` to the totals and log its repeated queries.
+    `kind` is 'request' or 'task'.
+    """
+    if buffer(totals(kind, name, measurement)):
+        flush()
+
+
+async def arecord(kind, name, measurement):
+    """
+    `record()` for the event loop, the totals are flushed from a thread.
+    """
+    if buffer(totals(kind, name, measurement)):
+        await sync_to_async(flush, thread_sensitive=False)()
+
+
+def buffer(values):
+    """
+    Add `values` to the totals of this process. Returns whether they are due to be flushed.
+    """
+    with _pending_lock:
+        _pending.update(values)
+        return time.monotonic() - _flushed_at >= settings.METRICS_FLUSH_INTERVAL
+
+
+def flush():
+    """
+    Add the totals buffered in this process to the shared cache. Totals the cache doesn't take stay
+    buffered for the next flush, a cache failure is logged once until the cache works again.
+    """
+    global _flushed_at, _cache_failing
+    with _pending_lock:
+        pending = list(_pending.items())
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    for position, (key, value) in enumerate(pending):
+        try:
+            stats.incr(key, value)
+        except Exception:
+            with _pending_lock:
+                _pending.update(dict(pending[position:]))
+            if not _cache_failing:
+                logger.exception('Adding metrics to the cache failed, keeping them in this process')
+            _cache_failing = True
+            return
+    _cache_failing = False
+
+
+def worker_process_shutdown(**kwargs):
+    flush()
+
+
+def render_metrics(views, tasks, counters):
+    """
+    Totals of `views`, `tasks` and the booking.stats `counters` in the Prometheus text format.
+    """
+    groups = (('request', 'view', views), ('task', 'task', tasks))
+    values = stats.get_counters([
+        *[metric_key(kind, name, metric) for kind, label, names in groups for name in names for metric, *_ in METRICS],
+        *counters,
+    ])
+    lines = []
+    for kind, label, names in groups:
+        for metric, prometheus_name, description, divisor in METRICS:
+            prometheus_name = prometheus_name.format(kind=kind)
+            lines.append(f'# HELP {prometheus_name} {description.format(kind=kind)}')
+            lines.append(f'# TYPE {prometheus_name} counter')
+            for name in names:
+                value = values[metric_key(kind, name, metric)]
+                lines.append(f'{prometheus_name}{{{label}="{name}"}} {value / divisor if divisor > 1 else value}')
+    for name in counters:
+        lines.append(f'# TYPE booking_{name}_total counter')
+        lines.append(f'booking_{name}_total {values[name]}')
+    return '\n'.join(lines) + '\n'
+
+
+def task_prerun(task_id, task, **kwargs):
+    measurement = Measurement()
+    measurement.__enter__()
+    _tasks[task_id] = measurement
+
+
+def task_postrun(task_id, task, **kwargs):
+    measurement = _tasks.pop(task_id, None)
+    if measurement is None:
+        return
+    measurement.__exit__(None, None, None)
+    record('task', task.name, measurement)
@@ -0,0 +1,43 @@
+"""
+Middleware measuring every request.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from booking import metrics
+from booking.instrumentation import Measurement
+
+
+class InstrumentationMiddleware:
+    """
+    Adds the queries, database time, cache hits and wall time of the request to the totals of its view
+    and describes them in a Server-Timing header. Runs in the event loop under ASGI, so async views
+    aren't sent through a thread on their way in.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with Measurement() as measurement:
+            response = self.get_response(request)
+        if request.resolver_match is not None:
+            metrics.record('request', request.resolver_match.view_name, measurement)
+        return self.add_server_timing(response, measurement)
+
+    async def __acall__(self, request):
+        with Measurement() as measurement:
+            response = await self.get_response(request)
+        # The totals are flushed to the shared cache from a thread, it must not block the event loop
+        if request.resolver_match is not None:
+            await metrics.arecord('request', request.resolver_match.view_name, measurement)
+        return self.add_server_timing(response, measurement)
+
+    def add_server_timing(self, response, measurement):
+        response['Server-Timing'] = measurement.server_timing()
+        return response
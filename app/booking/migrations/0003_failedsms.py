@@ -0,0 +1,26 @@
+# Generated by Django 4.0 on 2026-10-18 12:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0002_user_business_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FailedSms',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to', models.CharField(max_length=20)),
+                ('text', models.TextField()),
+                ('error', models.CharField(max_length=200)),
+                ('attempts', models.PositiveSmallIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('owner', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='booking.user')),
+            ],
+        ),
+    ]
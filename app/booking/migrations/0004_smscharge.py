@@ -0,0 +1,25 @@
+# Generated by Django 4.0 on 2026-10-18 12:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0003_failedsms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SmsCharge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('reservation', 'Reservation'), ('refund', 'Refund')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('messages', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sms_charges', to='booking.user')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0 on 2026-10-18 13:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_smscharge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='owner',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='visits', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['user', 'last_name', 'first_name'], name='client_user_name_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0 on 2026-10-18 13:02
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+def set_visit_owner(apps, schema_editor):
+    Client = apps.get_model('booking', 'Client')
+    Visit = apps.get_model('booking', 'Visit')
+    Visit.objects.update(
+        owner=Subquery(Client.objects.filter(pk=OuterRef('client')).values('user')[:1])
+    )
+
+
+class Migration(migrations.Migration):
+    """
+    Fill the owner of existing visits. Kept apart from adding and constraining the column, PostgreSQL
+    can't alter a table with pending foreign key checks of the same transaction.
+    """
+
+    dependencies = [
+        ('booking', '0005_visit_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_visit_owner, migrations.RunPython.noop),
+    ]
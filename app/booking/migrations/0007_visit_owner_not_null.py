@@ -0,0 +1,24 @@
+# Generated by Django 4.0 on 2026-10-18 13:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_visit_owner_fill'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='visit',
+            name='owner',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='visits', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['owner', 'date', 'time'], name='visit_owner_date_time_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.0 on 2026-10-18 13:20
+
+from django.db import migrations, models
+
+
+def set_search_name(apps, schema_editor):
+    from booking.search import normalize
+
+    Client = apps.get_model('booking', 'Client')
+    clients = []
+    for client in Client.objects.only('first_name', 'last_name').iterator(chunk_size=2000):
+        client.search_name = normalize(f'{client.first_name} {client.last_name}')
+        clients.append(client)
+        if len(clients) == 2000:
+            Client.objects.bulk_update(clients, ['search_name'])
+            clients = []
+    Client.objects.bulk_update(clients, ['search_name'])
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # GIN indexes exist on PostgreSQL only, other databases fall back to scanning the user's clients
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX client_search_name_trgm_idx ON booking_client USING gin (search_name gin_trgm_ops)'
+    )
+    schema_editor.execute(
+        'CREATE INDEX client_phone_number_trgm_idx ON booking_client USING gin (phone_number gin_trgm_ops)'
+    )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS client_search_name_trgm_idx')
+    schema_editor.execute('DROP INDEX IF EXISTS client_phone_number_trgm_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_visit_owner_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='client',
+            name='search_name',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(set_search_name, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0 on 2026-10-18 12:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_client_search_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='client',
+            index=models.Index(fields=['user', 'first_name', 'last_name', 'id'], name='client_user_list_idx'),
+        ),
+    ]
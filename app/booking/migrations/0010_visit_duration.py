@@ -0,0 +1,76 @@
+# Generated by Django 4.0 on 2026-10-18 15:10
+
+import datetime
+
+from django.db import migrations, models
+
+
+def set_end_time(apps, schema_editor):
+    # Existing visits last 30 minutes, cut short where the owner's next visit that day starts earlier,
+    # so double bookings made before durations existed don't violate the overlap constraint
+    Visit = apps.get_model('booking', 'Visit')
+    visits = []
+    for visit in Visit.objects.only('owner', 'date', 'time').order_by('owner', 'date', 'time', 'pk').iterator(
+            chunk_size=2000):
+        end = datetime.datetime.combine(visit.date, visit.time) + datetime.timedelta(minutes=30)
+        visit.end_time = datetime.time.max if end.date() != visit.date else end.time()
+        if visits and (visits[-1].owner_id, visits[-1].date) == (visit.owner_id, visit.date):
+            visits[-1].end_time = min(visits[-1].end_time, visit.time)
+        visits.append(visit)
+        if len(visits) > 2000:
+            save_durations(Visit, visits[:-1])
+            visits = visits[-1:]
+    save_durations(Visit, visits)
+
+
+def save_durations(Visit, visits):
+    for visit in visits:
+        visit.duration = (
+            datetime.datetime.combine(visit.date, visit.end_time) - datetime.datetime.combine(visit.date, visit.time)
+        ).seconds // 60
+    Visit.objects.bulk_update(visits, ['duration', 'end_time'])
+
+
+def create_overlap_constraint(apps, schema_editor):
+    # Exclusion constraints exist on PostgreSQL only, other databases rely on VisitForm's check.
+    # The columns are naive, so the range is a tsrange; its GiST index also serves the overlap lookups
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE booking_visit ADD CONSTRAINT visit_owner_no_overlap EXCLUDE USING gist '
+        '(owner_id WITH =, tsrange(date + time, date + end_time) WITH &&)'
+    )
+
+
+def drop_overlap_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE booking_visit DROP CONSTRAINT IF EXISTS visit_owner_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_client_user_list_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='visit',
+            name='duration',
+            field=models.PositiveSmallIntegerField(default=30, help_text='Minutes'),
+        ),
+        migrations.AddField(
+            model_name='visit',
+            name='end_time',
+            field=models.TimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(set_end_time, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='visit',
+            name='end_time',
+            field=models.TimeField(editable=False),
+        ),
+        migrations.RunPython(create_overlap_constraint, drop_overlap_constraint),
+    ]
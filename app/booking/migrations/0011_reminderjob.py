@@ -0,0 +1,32 @@
+# Generated by Django 4.1 on 2026-10-18 13:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0010_visit_duration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReminderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visit_date', models.DateField()),
+                ('visit_time', models.TimeField()),
+                ('send_at', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('done', 'Done'), ('skipped', 'Skipped')], default='pending', max_length=10)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('visit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reminder_job', to='booking.visit')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='reminderjob',
+            index=models.Index(fields=['status', 'send_at'], name='reminderjob_due_idx'),
+        ),
+    ]
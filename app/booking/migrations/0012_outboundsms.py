@@ -0,0 +1,38 @@
+# Generated by Django 4.1 on 2026-10-18 13:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0011_reminderjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundSms',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('reminder', 'Reminder'), ('cancellation', 'Cancellation')], max_length=20)),
+                ('key', models.CharField(max_length=50, unique=True)),
+                ('to', models.CharField(max_length=20)),
+                ('text', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('send_after', models.DateTimeField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboundsms',
+            index=models.Index(fields=['status', 'send_after'], name='outboundsms_due_idx'),
+        ),
+    ]
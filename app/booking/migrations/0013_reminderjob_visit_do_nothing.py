@@ -0,0 +1,19 @@
+# Generated by Django 4.1 on 2026-10-18 14:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0012_outboundsms'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reminderjob',
+            name='visit',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.DO_NOTHING, related_name='reminder_job', to='booking.visit'),
+        ),
+    ]
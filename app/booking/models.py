@@ -1,8 +1,11 @@
-from django.db import models
+from django.db import models, transaction
+from django.dispatch import Signal
 from phonenumber_field.modelfields import PhoneNumberField
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from decimal import Decimal
+import datetime
+from booking.search import normalize
 
 
 class User(AbstractUser):
@@ -16,21 +19,265 @@ class User(AbstractUser):
         return self.username
 
 
+# Sent with the (owner pk, date) days of deleted visits, which are deleted without post_delete signals
+visits_deleted = Signal()
+
+
+class ClientQuerySet(models.QuerySet):
+
+    def owned_by(self, user):
+        return self.filter(user=user)
+
+    def delete(self):
+        """
+        Delete the clients, their visits first through VisitQuerySet.delete so their reminder jobs go too.
+        """
+        with transaction.atomic(using=self.db, savepoint=False):
+            visits, visit_counts = Visit.objects.using(self.db).filter(client__in=self).delete()
+            deleted, per_model = super().delete()
+        return deleted + visits, {**per_model, **visit_counts}
+
+
 class Client(models.Model):
     first_name = models.CharField(max_length=20)
     last_name = models.CharField(max_length=20)
     phone_number = PhoneNumberField(unique=True, blank=True)
     user = models.ForeignKey(get_user_model(), on_delete=models.deletion.CASCADE, related_name='clients')
+    # Lowercase, accent-free full name searched by booking.search. Unbounded, as normalizing can make
+    # names longer: 'ß' becomes 'ss' and NFKD splits ligatures and fractions
+    search_name = models.TextField(blank=True, editable=False)
+
+    objects = ClientQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'last_name', 'first_name'], name='client_user_name_idx'),
+            models.Index(fields=['user', 'first_name', 'last_name', 'id'], name='client_user_list_idx'),
+        ]
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        self.search_name = normalize(f'{self.first_name} {self.last_name}')
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'first_name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'search_name'}
+        super().save(*args, **kwargs)
+        if not adding:
+            # Keep owner of the client's visits in sync if the client was moved to another user
+            self.visits.exclude(owner=self.user_id).update(owner=self.user_id)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            Visit.objects.filter(client=self).delete()
+            return super().delete(*args, **kwargs)
+
+
+def visit_end_time(date, time, duration):
+    """
+    Time a visit starting at `time` and lasting `duration` minutes ends, or None when it ends after midnight.
+    """
+    end = datetime.datetime.combine(date, time) + datetime.timedelta(minutes=duration)
+    if end.date() != date:
+        return None
+    return end.time()
+
+
+class VisitQuerySet(models.QuerySet):
+
+    def owned_by(self, user):
+        return self.filter(owner=user)
+
+    def overlapping(self, owner, date, time, end_time):
+        """
+        Visits of `owner` on `date` that overlap the time from `time` to `end_time`.
+        """
+        return self.owned_by(owner).filter(date=date, time__lt=end_time, end_time__gt=time)
+
+    def delete(self):
+        """
+        Delete the visits and their reminder jobs without fetching the visits, then send `visits_deleted`
+        with the days they were on.
+        """
+        days = set(self.values_list('owner', 'date').distinct())
+        if not days:
+            return 0, {}
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Reminder jobs don't cascade, so the visits are deleted in a single query
+            jobs, job_counts = ReminderJob.objects.using(self.db).filter(visit__in=self).delete()
+            deleted, per_model = super().delete()
+        visits_deleted.send(sender=Visit, days=days)
+        return deleted + jobs, {**per_model, **job_counts}
+
 
 class Visit(models.Model):
+    DEFAULT_DURATION = 30
+
     date = models.DateField()
     time = models.TimeField()
+    duration = models.PositiveSmallIntegerField(default=DEFAULT_DURATION, help_text='Minutes')
+    # Derived from time and duration, so overlaps can be found by comparing columns
+    end_time = models.TimeField(editable=False)
     client = models.ForeignKey(Client, on_delete=models.deletion.CASCADE, related_name='visits')
     notes = models.TextField(max_length=200, blank=True)
+    # Copy of client.user, so visits of a user can be filtered and ordered without joining clients
+    owner = models.ForeignKey(
+        get_user_model(), on_delete=models.deletion.CASCADE, related_name='visits', editable=False
+    )
+
+    objects = VisitQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['owner', 'date', 'time'], name='visit_owner_date_time_idx'),
+        ]
+        # On PostgreSQL the visit_owner_no_overlap exclusion constraint (migration 0010) also
+        # rejects overlapping visits of the same owner
 
     def __str__(self):
         return f'{self.time} {self.client}'
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember whose schedule the visit was on, so moving it to another user invalidates both
+        instance._loaded_owner = instance.__dict__.get('owner_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.owner_id = self.client.user_id
+        self.end_time = visit_end_time(self.date, self.time, self.duration) or datetime.time.max
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'client' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'owner'}
+        if update_fields is not None and {'date', 'time', 'duration'} & set(update_fields):
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'end_time'}
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            ReminderJob.objects.filter(visit=self).delete()
+            deleted = super().delete(*args, **kwargs)
+        visits_deleted.send(sender=Visit, days={(self.owner_id, self.date)})
+        return deleted
+
+
+class FailedSms(models.Model):
+    """
+    Message which could not be delivered after all retries.
+    """
+    owner = models.ForeignKey(get_user_model(), on_delete=models.deletion.SET_NULL, null=True, related_name='+')
+    to = models.CharField(max_length=20)
+    text = models.TextField()
+    error = models.CharField(max_length=200)
+    attempts = models.PositiveSmallIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.to} {self.error}'
+
+
+class SmsCharge(models.Model):
+    """
+    Append-only ledger of balance changes made for sms. Debits are negative.
+    """
+    RESERVATION = 'reservation'
+    REFUND = 'refund'
+    KIND_CHOICES = [
+        (RESERVATION, 'Reservation'),
+        (REFUND, 'Refund'),
+    ]
+
+    user = models.ForeignKey(get_user_model(), on_delete=models.deletion.CASCADE, related_name='sms_charges')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    messages = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.user} {self.kind} {self.amount}'
+
+
+class ReminderJob(models.Model):
+    """
+    Reminder of a visit, due at `send_at`. Planned ahead by booking.reminders and claimed by dispatching
+    workers in batches, so reminders go out spread over the day instead of all at once.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    DONE = 'done'
+    SKIPPED = 'skipped'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (DONE, 'Done'),
+        (SKIPPED, 'Skipped'),
+    ]
+
+    # Deleted explicitly with their visits by Visit.delete and VisitQuerySet.delete, so visits can be
+    # deleted without fetching them
+    visit = models.OneToOneField(Visit, on_delete=models.deletion.DO_NOTHING, related_name='reminder_job')
+    owner = models.ForeignKey(get_user_model(), on_delete=models.deletion.CASCADE, related_name='+')
+    # When the visit was when the reminder was planned, a moved visit gets planned again
+    visit_date = models.DateField()
+    visit_time = models.TimeField()
+    send_at = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'send_at'], name='reminderjob_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.send_at} {self.visit_id} {self.status}'
+
+
+class OutboundSms(models.Model):
+    """
+    Sms waiting to be sent, written in the same transaction which decides to send it and with its price
+    already held. Drained by booking.outbox workers, a message for a visit is queued at most once per kind.
+    """
+    REMINDER = 'reminder'
+    CANCELLATION = 'cancellation'
+    KIND_CHOICES = [
+        (REMINDER, 'Reminder'),
+        (CANCELLATION, 'Cancellation'),
+    ]
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    owner = models.ForeignKey(get_user_model(), on_delete=models.deletion.CASCADE, related_name='+')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # Kind and a reference like the visit pk, visits are not referenced as cancelled ones are gone
+    # before their sms is sent
+    key = models.CharField(max_length=50, unique=True)
+    to = models.CharField(max_length=20)
+    text = models.TextField()
+    price = models.DecimalField(max_digits=5, decimal_places=2)
+    send_after = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.CharField(max_length=200, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'send_after'], name='outboundsms_due_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.key} {self.to} {self.status}'
@@ -0,0 +1,122 @@
+"""
+Outbox of sms. Code deciding to send sms writes OutboundSms rows with `enqueue()` inside its own
+transaction, so a message is queued exactly when the change causing it commits, with its price held.
+Messages carry a key of their kind and a reference of what they are about, usually a visit, and one
+already queued is never queued again.
+
+Any number of workers drain the outbox with `drain()`, claiming batches with SELECT ... FOR UPDATE
+SKIP LOCKED. A claim is only taken over once it is SMS_OUTBOX_CLAIM_TIMEOUT old, when its worker is
+presumed dead, so a message is sent twice only if a worker dies between sending and marking it sent.
+"""
+import datetime
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from booking.billing import Reservation, release, reserve
+from booking.delivery import deliver_each
+from booking.models import OutboundSms
+
+
+def outbox_key(kind, ref):
+    return f'{kind}:{ref}'
+
+
+def enqueue(kind, messages, send_after=None):
+    """
+    Queue `(owner_pk, ref, to, text)` messages of `kind`, holding their price from the owners' balances.
+    Nothing is queued for owners whose balance does not cover all their messages. Returns a `Reservation`
+    of the queued messages of every other owner.
+    """
+    send_after = send_after or timezone.now()
+    by_owner = defaultdict(list)
+    for owner_pk, ref, to, text in messages:
+        by_owner[owner_pk].append((outbox_key(kind, ref), to, text))
+    with transaction.atomic():
+        # The owners stay locked until the transaction ends, so a concurrent enqueue for the same owner
+        # waits here and then sees the keys written by this one
+        reservations = reserve({owner_pk: len(owner_messages) for owner_pk, owner_messages in by_owner.items()})
+        keys = [key for owner_pk in reservations for key, to, text in by_owner[owner_pk]]
+        queued = set(OutboundSms.objects.filter(key__in=keys).values_list('key', flat=True))
+        rows = []
+        for owner_pk, (count, amount) in reservations.items():
+            rows.extend(
+                OutboundSms(
+                    owner_id=owner_pk, kind=kind, key=key, to=to, text=text, price=amount / count,
+                    send_after=send_after,
+                )
+                for key, to, text in by_owner[owner_pk]
+                if key not in queued
+            )
+        OutboundSms.objects.bulk_create(rows)
+        counts = defaultdict(int)
+        for row in rows:
+            counts[row.owner_id] += 1
+        # Messages which were already queued hold no funds
+        release(reservations, counts)
+    return {
+        owner_pk: Reservation(counts[owner_pk], amount / count * counts[owner_pk])
+        for owner_pk, (count, amount) in reservations.items()
+    }
+
+
+def claim(now, batch_size):
+    """
+    Mark up to `batch_size` messages due at `now` as being sent and return their pks.
+    """
+    # Claims are stamped with the current time, a long drain keeps an old `now` for its later batches
+    claimed_at = timezone.now()
+    expired = claimed_at - datetime.timedelta(seconds=settings.SMS_OUTBOX_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        pks = list(OutboundSms.objects.select_for_update(skip_locked=True).filter(
+            Q(status=OutboundSms.PENDING) | Q(status=OutboundSms.SENDING, claimed_at__lt=expired),
+            send_after__lte=now,
+        ).order_by('send_after').values_list('pk', flat=True)[:batch_size])
+        OutboundSms.objects.filter(pk__in=pks).update(status=OutboundSms.SENDING, claimed_at=claimed_at)
+    return pks
+
+
+def drain(gateway, now=None, batch_size=None):
+    """
+    Send the messages due at `now` through `gateway`, a batch at a time, until none are left.
+    Returns the number of sent sms.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.SMS_OUTBOX_BATCH_SIZE
+    sent = 0
+    while True:
+        pks = claim(now, batch_size)
+        if not pks:
+            return sent
+        sent += send_claimed(gateway, pks)
+
+
+def send_claimed(gateway, pks):
+    """
+    Send the claimed messages with pks `pks`, mark them sent or failed and refund the failed ones.
+    """
+    messages = defaultdict(list)
+    for pk, owner_pk, to, text, price in OutboundSms.objects.filter(pk__in=pks).values_list(
+            'pk', 'owner', 'to', 'text', 'price'):
+        messages[owner_pk].append((pk, to, text, price))
+    sent = []
+    failed = []
+    refunds = {}
+    for owner_pk, owner_messages in messages.items():
+        results = deliver_each(gateway, [(to, text) for pk, to, text, price in owner_messages])
+        for (pk, to, text, price), (error, attempts) in zip(owner_messages, results):
+            if not error:
+                sent.append(pk)
+                continue
+            failed.append(OutboundSms(pk=pk, status=OutboundSms.FAILED, error=error[:200], attempts=attempts))
+            count, amount = refunds.get(owner_pk, (0, 0))
+            refunds[owner_pk] = Reservation(count + 1, amount + price)
+    with transaction.atomic():
+        OutboundSms.objects.filter(pk__in=sent).update(status=OutboundSms.SENT, sent_at=timezone.now())
+        OutboundSms.objects.bulk_update(failed, ['status', 'error', 'attempts'])
+        # Nothing of a reservation is spent when none of its messages were sent
+        release(refunds, {})
+    return len(sent)
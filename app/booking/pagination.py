@@ -0,0 +1,137 @@
+"""
+Keyset (cursor) pagination. Pages continue from the ordering values of the last row seen,
+so there is no COUNT query and deep pages cost the same as the first one. Async views page with
+KeysetPaginator.apage, or apaginate for page numbers.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.http import Http404
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate `queryset` by `ordering`, which must end with a unique field such as '-pk'.
+    Values of the ordering fields end up in the cursor, so they must be JSON serializable.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = [(field.lstrip('-'), field.startswith('-')) for field in ordering]
+
+    def page(self, cursor=None):
+        values, backwards, queryset = self._page_queryset(cursor)
+        return self._page(list(queryset), values, backwards)
+
+    async def apage(self, cursor=None):
+        values, backwards, queryset = self._page_queryset(cursor)
+        return self._page([row async for row in queryset], values, backwards)
+
+    def _page_queryset(self, cursor):
+        values, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+        queryset = self._ordered(reverse=backwards)
+        if values is not None:
+            queryset = queryset.filter(self._after(values, reverse=backwards))
+        # One extra row tells whether there is anything beyond this page
+        return values, backwards, queryset[:self.per_page + 1]
+
+    def _page(self, rows, values, backwards):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+        has_next = True if backwards else more
+        has_previous = more if backwards else values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(self._values(rows[-1]), False) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(self._values(rows[0]), True) if rows and has_previous else None,
+        )
+
+    def encode_cursor(self, values, backwards):
+        payload = json.dumps({'v': values, 'b': backwards}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            values, backwards = payload['v'], payload['b']
+        except (ValueError, TypeError, KeyError):
+            raise Http404('Invalid cursor')
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise Http404('Invalid cursor')
+        # Cursors come from the client, values of the wrong type would only fail once filtered on
+        try:
+            values = [self._field(field).to_python(value) for (field, _), value in zip(self.ordering, values)]
+        except (ValidationError, ValueError, TypeError):
+            raise Http404('Invalid cursor')
+        if None in values:
+            raise Http404('Invalid cursor')
+        return values, bool(backwards)
+
+    def _field(self, name):
+        opts = self.queryset.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def _values(self, row):
+        return [getattr(row, field) for field, descending in self.ordering]
+
+    def _ordered(self, reverse):
+        return self.queryset.order_by(*[
+            f'-{field}' if descending != reverse else field for field, descending in self.ordering
+        ])
+
+    def _after(self, values, reverse):
+        """
+        Condition selecting rows which come after `values` in the (possibly reversed) ordering.
+        """
+        condition = Q()
+        for i, (field, descending) in enumerate(self.ordering):
+            lookup = 'lt' if descending != reverse else 'gt'
+            equal = {name: value for (name, _), value in zip(self.ordering[:i], values)}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+        return condition
+
+
+async def apaginate(paginator, number):
+    """
+    Page `number` of a Django Paginator over a queryset, counted and loaded with the async ORM.
+    """
+    paginator.count = await paginator.object_list.acount()
+    try:
+        number = paginator.validate_number(paginator.num_pages if number == 'last' else number)
+    except InvalidPage as error:
+        raise Http404(f'Invalid page ({number}): {error}')
+    bottom = (number - 1) * paginator.per_page
+    top = bottom + paginator.per_page
+    if top + paginator.orphans >= paginator.count:
+        top = paginator.count
+    rows = [row async for row in paginator.object_list[bottom:top]]
+    return paginator._get_page(rows, number, paginator)
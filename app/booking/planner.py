@@ -0,0 +1,63 @@
+"""
+Set-based planning of the SMS reminders sent for a day's visits.
+"""
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import CharField, Count, Q
+from django.db.models.functions import Cast
+
+from booking.models import Visit
+
+# `visits` holds `(visit_pk, time, to)` tuples, `to` being the E.164 number without the leading '+'
+UserReminders = namedtuple('UserReminders', 'user_pk business_name sms_price balance visits')
+
+
+def eligible_users(date):
+    """
+    Users with sms reminders enabled, some balance and visits of clients with a phone number on `date`.
+    Annotated with `visits_count`.
+    """
+    return get_user_model().objects.filter(
+        sms_remainder=True,
+        balance__gt=0
+    ).annotate(
+        visits_count=Count(
+            'visits',
+            filter=Q(visits__date=date) & ~Q(visits__client__phone_number='')
+        )
+    ).filter(visits_count__gt=0)
+
+
+def with_recipient(visits):
+    """
+    Annotate `visits` with `to`, the client's stored E.164 number, skipping clients without one.
+    Reading the raw string saves parsing every number into a PhoneNumber.
+    """
+    return visits.exclude(client__phone_number='').annotate(
+        to=Cast('client__phone_number', output_field=CharField())
+    )
+
+
+def plan_reminders(date, user_pks=None, chunk_size=2000):
+    """
+    Return `UserReminders` of every user who should remind clients about visits on `date`,
+    limited to `user_pks` if given. Runs two queries no matter how many users and visits there are.
+    """
+    users = eligible_users(date)
+    if user_pks is not None:
+        users = users.filter(pk__in=user_pks)
+    plans = {
+        user_pk: UserReminders(user_pk, business_name, sms_price, balance, [])
+        for user_pk, business_name, sms_price, balance in users.order_by('pk').values_list(
+            'pk', 'business_name', 'sms_price', 'balance'
+        )
+    }
+    if not plans:
+        return []
+    visits = with_recipient(
+        Visit.objects.filter(date=date, owner__in=list(plans))
+    ).order_by('time', 'pk').values_list('pk', 'owner', 'time', 'to')
+    for visit_pk, user_pk, time, to in visits.iterator(chunk_size=chunk_size):
+        plans[user_pk].visits.append((visit_pk, time, to.lstrip('+')))
+    return list(plans.values())
@@ -0,0 +1,172 @@
+"""
+Reminders planned per visit. Every upcoming visit of a user with reminders enabled gets a ReminderJob due
+REMINDER_LEAD_HOURS before it, and dispatching workers send the due ones in batches. The load follows the
+visits through the day instead of peaking once a day.
+
+Workers claim batches with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can dispatch at once,
+and queue the due reminders in the sms outbox (booking.outbox) which sends them. A claim is only taken
+over once it is REMINDER_CLAIM_TIMEOUT old, when its worker is presumed dead; the outbox keeps a reminder
+queued by both workers from being sent twice.
+"""
+import datetime
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from booking.models import OutboundSms, ReminderJob, Visit
+from booking.outbox import enqueue
+from booking.planner import with_recipient
+
+
+def reminder_text(business_name, date, time):
+    return (
+        f'Hello! \n'
+        f'We would like to remind you about the visit on {time.strftime("%H:%M")},'
+        f' {date.day}.{date.month} in the {business_name}'
+    )
+
+
+def reminder_send_at(visit_pk, date, time):
+    """
+    When the reminder of the visit at `time` on `date` is due. Reminders which would fall outside of the
+    sending window are moved to the end of the window before them, and reminders of visits starting at the
+    same time are spread over the REMINDER_SPREAD_MINUTES before.
+    """
+    send_at = datetime.datetime.combine(date, time) - datetime.timedelta(hours=settings.REMINDER_LEAD_HOURS)
+    window_start = datetime.time.fromisoformat(settings.REMINDER_WINDOW_START)
+    window_end = datetime.time.fromisoformat(settings.REMINDER_WINDOW_END)
+    if send_at.time() > window_end:
+        send_at = datetime.datetime.combine(send_at.date(), window_end)
+    elif send_at.time() < window_start:
+        send_at = datetime.datetime.combine(send_at.date() - datetime.timedelta(days=1), window_end)
+    spread = settings.REMINDER_SPREAD_MINUTES * 60
+    if spread:
+        send_at -= datetime.timedelta(seconds=visit_pk % spread)
+    return timezone.make_aware(send_at)
+
+
+def visit_start(date, time):
+    return timezone.make_aware(datetime.datetime.combine(date, time))
+
+
+def reminder_ref(visit_pk, date, time):
+    """
+    Outbox reference of the reminder of a visit at `time` on `date`, a moved visit is reminded again.
+    """
+    return f'{visit_pk}@{date.isoformat()}T{time.isoformat("minutes")}'
+
+
+def schedule_reminders(now=None, batch_size=None):
+    """
+    Create the missing ReminderJobs of visits starting from `now` until a day past the lead time.
+    Returns the number of created jobs. Planning twice is harmless, a visit has at most one job.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    local_now = timezone.localtime(now)
+    until = (local_now + datetime.timedelta(hours=settings.REMINDER_LEAD_HOURS, days=1)).date()
+    # Visits moved after their reminder was sent or skipped are planned again for their new time,
+    # pending reminders of moved visits are dropped by the dispatching worker
+    ReminderJob.objects.filter(
+        visit__date__gte=local_now.date(),
+        visit__date__lte=until,
+        status__in=[ReminderJob.DONE, ReminderJob.SKIPPED],
+    ).exclude(visit_date=F('visit__date'), visit_time=F('visit__time')).delete()
+    visits = with_recipient(Visit.objects.filter(
+        date__gte=local_now.date(),
+        date__lte=until,
+        owner__sms_remainder=True,
+        reminder_job__isnull=True,
+    )).values_list('pk', 'owner', 'date', 'time').iterator(chunk_size=batch_size)
+    jobs = (
+        ReminderJob(
+            visit_id=visit_pk, owner_id=owner_pk, visit_date=date, visit_time=time,
+            send_at=reminder_send_at(visit_pk, date, time),
+        )
+        for visit_pk, owner_pk, date, time in visits
+        if visit_start(date, time) > now
+    )
+    created = 0
+    while True:
+        batch = list(islice(jobs, batch_size))
+        if not batch:
+            return created
+        # A concurrent planner may have created some of the jobs in the meantime
+        ReminderJob.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+
+
+def claim(now, batch_size):
+    """
+    Mark up to `batch_size` reminders due at `now` as being sent and return their pks.
+    """
+    # Claims are stamped with the current time, a long dispatch keeps an old `now` for its later batches
+    claimed_at = timezone.now()
+    expired = claimed_at - datetime.timedelta(seconds=settings.REMINDER_CLAIM_TIMEOUT)
+    with transaction.atomic():
+        pks = list(ReminderJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ReminderJob.PENDING) | Q(status=ReminderJob.SENDING, claimed_at__lt=expired),
+            send_at__lte=now,
+        ).order_by('send_at').values_list('pk', flat=True)[:batch_size])
+        ReminderJob.objects.filter(pk__in=pks).update(status=ReminderJob.SENDING, claimed_at=claimed_at)
+    return pks
+
+
+def dispatch_reminders(now=None, batch_size=None):
+    """
+    Queue the reminders due at `now` in the sms outbox, a batch at a time, until none are left.
+    Returns the number of queued sms.
+    """
+    now = now or timezone.now()
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    queued = 0
+    while True:
+        pks = claim(now, batch_size)
+        if not pks:
+            return queued
+        queued += queue_claimed(pks, now)
+
+
+def queue_claimed(pks, now):
+    """
+    Queue the claimed reminders with pks `pks` and mark them done, in one transaction. Reminders of moved
+    visits are dropped, so they get planned again, and reminders which can't be sent any more are skipped.
+    """
+    rows = with_recipient(Visit.objects.filter(reminder_job__in=pks)).values_list(
+        'reminder_job', 'pk', 'owner', 'owner__business_name', 'owner__sms_remainder', 'date', 'time',
+        'reminder_job__visit_date', 'reminder_job__visit_time', 'to'
+    )
+    # Reminders of visits whose client lost the phone number are skipped too
+    skipped = set(pks)
+    moved = []
+    messages = defaultdict(list)
+    for job_pk, visit_pk, owner_pk, business_name, sms_remainder, date, time, visit_date, visit_time, to in rows:
+        if (date, time) != (visit_date, visit_time):
+            skipped.discard(job_pk)
+            moved.append(job_pk)
+        elif sms_remainder and visit_start(date, time) > now:
+            skipped.discard(job_pk)
+            messages[owner_pk].append(
+                (job_pk, (owner_pk, reminder_ref(visit_pk, date, time), to.lstrip('+'),
+                          reminder_text(business_name, date, time)))
+            )
+
+    with transaction.atomic():
+        # Owners without enough balance to send all their reminders of the batch get none queued
+        reservations = enqueue(OutboundSms.REMINDER, [
+            message for owner_messages in messages.values() for job_pk, message in owner_messages
+        ], send_after=now)
+        done = []
+        for owner_pk, owner_messages in messages.items():
+            if owner_pk in reservations:
+                done.extend(job_pk for job_pk, message in owner_messages)
+            else:
+                skipped.update(job_pk for job_pk, message in owner_messages)
+        ReminderJob.objects.filter(pk__in=moved).delete()
+        ReminderJob.objects.filter(pk__in=done).update(status=ReminderJob.DONE)
+        ReminderJob.objects.filter(pk__in=skipped).update(status=ReminderJob.SKIPPED)
+    return sum(reservation.messages for reservation in reservations.values())
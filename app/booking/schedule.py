@@ -0,0 +1,109 @@
+"""
+Cache of the visits a user has on a given day, as shown by IndexView, and of the time the user's
+visits last changed. Both are updated by the signal handlers in booking.signals and by the bulk API.
+Cached days are keyed by that time, so a change makes all of the user's cached days stale at once,
+including one being filled from visits read before the change.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from booking import stats
+from booking.models import Visit
+
+COUNTERS = ('schedule_cache_hits', 'schedule_cache_misses')
+
+
+def schedule_cache_key(user_pk, changed_at, date):
+    return f'schedule:{user_pk}:{changed_at}:{date.isoformat()}'
+
+
+def changed_at_cache_key(user_pk):
+    return f'schedule:{user_pk}:changed'
+
+
+def get_schedule(user, date):
+    """
+    Visits of `user` on `date` ordered by time, with their clients loaded.
+    """
+    key = schedule_cache_key(user.pk, schedule_changed_at(user.pk), date)
+    visits = cache.get(key)
+    if visits is not None:
+        stats.incr('schedule_cache_hits')
+        return visits
+    stats.incr('schedule_cache_misses')
+    visits = list(schedule_queryset(user, date))
+    cache.set(key, visits, settings.SCHEDULE_CACHE_TIMEOUT)
+    return visits
+
+
+async def aget_schedule(user, date):
+    """
+    Async version of get_schedule, sharing its cache.
+    """
+    key = schedule_cache_key(user.pk, await aschedule_changed_at(user.pk), date)
+    visits = await cache.aget(key)
+    if visits is not None:
+        await stats.aincr('schedule_cache_hits')
+        return visits
+    await stats.aincr('schedule_cache_misses')
+    visits = [visit async for visit in schedule_queryset(user, date)]
+    await cache.aset(key, visits, settings.SCHEDULE_CACHE_TIMEOUT)
+    return visits
+
+
+def schedule_queryset(user, date):
+    return Visit.objects.owned_by(user).filter(
+        date=date
+    ).select_related('client').only(
+        'date', 'time', 'owner', 'client__first_name', 'client__last_name'
+    ).order_by('time')
+
+
+def invalidate_schedule(user_pk):
+    cache.set(changed_at_cache_key(user_pk), time.time(), timeout=None)
+
+
+def schedule_changed_at(user_pk):
+    """
+    Timestamp of the last change to visits of the user. When it isn't known, it starts now.
+    """
+    key = changed_at_cache_key(user_pk)
+    changed_at = cache.get(key)
+    if changed_at is None:
+        cache.add(key, time.time(), timeout=None)
+        changed_at = cache.get(key)
+    return changed_at
+
+
+async def aschedule_changed_at(user_pk):
+    """
+    Async version of schedule_changed_at.
+    """
+    key = changed_at_cache_key(user_pk)
+    changed_at = await cache.aget(key)
+    if changed_at is None:
+        await cache.aadd(key, time.time(), timeout=None)
+        changed_at = await cache.aget(key)
+    return changed_at
+
+
+def get_visits_by_day(user, from_date, to_date):
+    """
+    Return `(date, visits)` pairs for every day from `from_date` to `to_date`, loading visits in a single query.
+    """
+    days = {
+        from_date + datetime.timedelta(days=day): []
+        for day in range((to_date - from_date).days + 1)
+    }
+    visits = Visit.objects.owned_by(user).filter(
+        date__gte=from_date,
+        date__lte=to_date
+    ).select_related('client').only(
+        'date', 'time', 'end_time', 'owner', 'client__first_name', 'client__last_name'
+    ).order_by('date', 'time')
+    for visit in visits:
+        days[visit.date].append(visit)
+    return list(days.items())
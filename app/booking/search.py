@@ -0,0 +1,56 @@
+"""
+Client search. Names are matched against `Client.search_name`, a lowercase, accent-free copy of
+the full name, and digits against the stored E.164 phone number. On PostgreSQL both columns have
+trigram GIN indexes and results are ranked by trigram similarity.
+"""
+import re
+import unicodedata
+
+from django.db import connections
+
+# Letters which don't decompose into a base letter and a combining accent
+EXTRA_ACCENTS = str.maketrans({'ł': 'l', 'Ł': 'l', 'đ': 'd', 'Đ': 'd', 'ø': 'o', 'Ø': 'o', 'ß': 'ss'})
+PHONE_CHARACTERS = re.compile(r'[\s+()\-./]')
+
+
+def normalize(text):
+    """
+    Lowercase `text` and strip accents, so that 'Łukasz Wiśniewski' becomes 'lukasz wisniewski'.
+    """
+    text = unicodedata.normalize('NFKD', text.translate(EXTRA_ACCENTS))
+    return ''.join(character for character in text if not unicodedata.combining(character)).lower()
+
+
+def parse_query(query):
+    """
+    Split `query` into normalized name words and the digits of a phone number.
+    Words made of digits and phone punctuation only are taken as parts of the number.
+    """
+    words, digits = [], ''
+    for word in query.split():
+        stripped = PHONE_CHARACTERS.sub('', word)
+        if stripped.isdigit():
+            digits += stripped
+        elif stripped:
+            words.append(normalize(word))
+    return words, digits
+
+
+def search_clients(queryset, query):
+    """
+    Filter `queryset` to clients whose name contains every word of `query` and whose number contains its digits.
+    On PostgreSQL the result is annotated with `rank` and ordered by it.
+    """
+    words, digits = parse_query(query or '')
+    if not words and not digits:
+        return queryset
+    for word in words:
+        queryset = queryset.filter(search_name__contains=word)
+    if digits:
+        queryset = queryset.filter(phone_number__contains=digits)
+    if words and connections[queryset.db].vendor == 'postgresql':
+        from django.contrib.postgres.search import TrigramSimilarity
+        queryset = queryset.annotate(
+            rank=TrigramSimilarity('search_name', ' '.join(words))
+        ).order_by('-rank', *queryset.query.order_by)
+    return queryset
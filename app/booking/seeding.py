@@ -0,0 +1,148 @@
+"""
+Generation of synthetic users, clients and visits for benchmarks and the seed_booking command.
+"""
+import csv
+import datetime
+import io
+import random
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+
+from booking.models import Client, Visit
+from booking.search import normalize
+
+FIRST_NAMES = ['Anna', 'Piotr', 'Maria', 'Jan', 'Katarzyna', 'Tomasz', 'Zofia', 'Michał', 'Agnieszka', 'Paweł']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewska', 'Wójcik', 'Kowalczyk', 'Kamińska', 'Lewandowski', 'Zieliński']
+# Visits are booked between 8:00 and 18:00
+DAY_MINUTES = 10 * 60
+# Seeded numbers are +48 500 000 000 onwards, all valid Polish mobile numbers
+MAX_PHONE_NUMBERS = 100000000
+VISIT_COLUMNS = ('date', 'time', 'duration', 'end_time', 'client_id', 'owner_id', 'notes')
+
+
+def phone_number(tenant, client, clients_per_user):
+    """
+    Unique Polish mobile number of the `client`-th client of the `tenant`-th seeded user. It doesn't depend
+    on the seed or prefix, so runs on the same database need disjoint tenant numbers.
+    """
+    return f'+48{500000000 + tenant * clients_per_user + client}'
+
+
+def phone_numbers_taken(tenants, clients_per_user):
+    """
+    Whether a client already has one of the phone numbers of the `tenants` range, e.g. from an earlier run.
+    """
+    # Seeded numbers all have the same length, so they compare as strings
+    return Client.objects.filter(
+        phone_number__gte=phone_number(tenants.start, 0, clients_per_user),
+        phone_number__lt=phone_number(tenants.stop, 0, clients_per_user),
+    ).exists()
+
+
+def seed(users=10, clients_per_user=100, visits_per_client=10, start_date=None, days=30, seed=0,
+         batch_size=5000, prefix='seed', first_tenant=0):
+    """
+    Create `users` users with their clients and visits spread over `days` days from `start_date`.
+    A user can have at most `days * 600` visits. The same arguments always produce the same data.
+    Returns the created users.
+    """
+    return [
+        seed_tenant(
+            tenant, clients_per_user, visits_per_client, start_date=start_date, days=days, seed=seed,
+            batch_size=batch_size, prefix=prefix
+        )
+        for tenant in range(first_tenant, first_tenant + users)
+    ]
+
+
+def seed_tenant(tenant, clients_per_user, visits_per_client, start_date=None, days=30, seed=0, batch_size=5000,
+                prefix='seed', copy=False):
+    """
+    Create the `tenant`-th user with their clients and visits and return the user. Every tenant has its own
+    random generator, so tenants can be seeded in any order or in parallel and still get the same data.
+    With `copy`, visits are loaded with PostgreSQL COPY instead of INSERT.
+    """
+    rng = random.Random(f'{seed}:{tenant}')
+    start_date = start_date or datetime.date.today()
+    # A tenant is seeded whole or not at all
+    with transaction.atomic():
+        user = get_user_model().objects.create(
+            username=f'{prefix}-{seed}-{tenant}',
+            password=make_password(None),
+            sms_remainder=True,
+            balance=1000,
+            business_name=f'Business {tenant}',
+        )
+        clients = Client.objects.bulk_create([
+            Client(
+                first_name=first_name,
+                last_name=last_name,
+                search_name=normalize(f'{first_name} {last_name}'),
+                phone_number=phone_number(tenant, client, clients_per_user),
+                user=user,
+            )
+            for client in range(clients_per_user)
+            for first_name, last_name in [(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES))]
+        ], batch_size=batch_size)
+        # Rows of VISIT_COLUMNS
+        visits = (
+            (
+                start_date + datetime.timedelta(days=day),
+                minute_time(minute),
+                duration,
+                minute_time(minute + duration),
+                rng.choice(clients).pk,
+                user.pk,
+                '',
+            )
+            for day, minute, duration in visit_slots(rng, days, len(clients) * visits_per_client)
+        )
+        if copy:
+            copy_visits(visits, batch_size)
+        else:
+            Visit.objects.bulk_create(
+                (Visit(**dict(zip(VISIT_COLUMNS, row))) for row in visits), batch_size=batch_size
+            )
+    return user
+
+
+def copy_visits(rows, batch_size):
+    """
+    Load visit `rows` of VISIT_COLUMNS with COPY in batches of `batch_size`. Skips building model
+    instances and INSERT statements, which makes it several times faster for millions of rows. PostgreSQL only.
+    """
+    rows = iter(rows)
+    sql = f'COPY {Visit._meta.db_table} ({", ".join(VISIT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)'
+    with connection.cursor() as cursor:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(batch)
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+
+
+def visit_slots(rng, days, count):
+    """
+    `(day, minute, duration)` of `count` visits starting on distinct minutes of the opening hours.
+    Visits last 30 minutes, cut short by the next visit or the closing time, so they never overlap.
+    """
+    starts = sorted(rng.sample(range(days * DAY_MINUTES), count))
+    slots = []
+    for start, next_start in zip(starts, starts[1:] + [days * DAY_MINUTES]):
+        day, minute = divmod(start, DAY_MINUTES)
+        end = min(start + Visit.DEFAULT_DURATION, (day + 1) * DAY_MINUTES, next_start)
+        slots.append((day, minute, end - start))
+    return slots
+
+
+def minute_time(minute):
+    """
+    Time of the `minute`-th minute of the opening hours.
+    """
+    return datetime.time(8 + minute // 60, minute % 60)
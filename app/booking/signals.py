@@ -0,0 +1,40 @@
+"""
+Signal handlers keeping the schedule cache in sync with visits and clients, and measuring celery tasks.
+"""
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from booking import metrics
+from booking.models import Client, Visit, visits_deleted
+from booking.schedule import invalidate_schedule
+
+task_prerun.connect(metrics.task_prerun, weak=False)
+task_postrun.connect(metrics.task_postrun, weak=False)
+# Totals of an idle worker would stay buffered otherwise
+worker_process_shutdown.connect(metrics.worker_process_shutdown, weak=False)
+
+
+@receiver(post_save, sender=Visit)
+def visit_saved(sender, instance, **kwargs):
+    invalidate_schedule(instance.owner_id)
+    # The visit may have been moved from another user
+    loaded_owner = getattr(instance, '_loaded_owner', None)
+    if loaded_owner and loaded_owner != instance.owner_id:
+        invalidate_schedule(loaded_owner)
+    instance._loaded_owner = instance.owner_id
+
+
+@receiver(visits_deleted, sender=Visit)
+def visit_deleted(sender, days, **kwargs):
+    # A post_delete receiver would make Django fetch every visit before deleting it
+    for owner_pk in {owner_pk for owner_pk, date in days}:
+        invalidate_schedule(owner_pk)
+
+
+@receiver(post_save, sender=Client)
+def client_saved(sender, instance, created, **kwargs):
+    # Names of the client's visits are part of the cached schedules
+    if not created:
+        for owner_pk in instance.visits.values_list('owner', flat=True).distinct():
+            invalidate_schedule(owner_pk)
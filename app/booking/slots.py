@@ -0,0 +1,38 @@
+"""
+Free periods between the visits of a user within working hours.
+"""
+import datetime
+
+from django.conf import settings
+
+from booking.models import Visit
+
+
+def find_free_slots(user, from_date, to_date, duration, day_start=None, day_end=None):
+    """
+    Return `(date, start, end)` free periods of at least `duration` minutes for every day from `from_date`
+    to `to_date`, between `day_start` and `day_end`. Visits of the whole range are loaded in a single query.
+    """
+    day_start = day_start or datetime.time.fromisoformat(settings.BOOKING_DAY_START)
+    day_end = day_end or datetime.time.fromisoformat(settings.BOOKING_DAY_END)
+    busy = {
+        from_date + datetime.timedelta(days=day): []
+        for day in range((to_date - from_date).days + 1)
+    }
+    visits = Visit.objects.owned_by(user).filter(
+        date__gte=from_date,
+        date__lte=to_date,
+        time__lt=day_end,
+        end_time__gt=day_start,
+    ).order_by('date', 'time').values_list('date', 'time', 'end_time')
+    for date, time, end_time in visits:
+        busy[date].append((time, end_time))
+    length = datetime.timedelta(minutes=duration)
+    slots = []
+    for date, periods in busy.items():
+        free_from = day_start
+        for time, end_time in periods + [(day_end, day_end)]:
+            if datetime.datetime.combine(date, time) - datetime.datetime.combine(date, free_from) >= length:
+                slots.append((date, free_from, time))
+            free_from = max(free_from, end_time)
+    return slots
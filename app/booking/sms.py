@@ -0,0 +1,166 @@
+"""
+Client for the external SMS api (https://callapi.pl/docs/).
+"""
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from django.core.cache import cache
+
+from booking import stats
+
+logger = logging.getLogger(__name__)
+
+class SmsGateway:
+    """
+    Sends messages through one pooled keep-alive session, so connections are set up once per worker process
+    instead of once per message. Batches are sent with bounded concurrency.
+    """
+
+    def __init__(self, base_url=None, sender=None, concurrency=None, pool_size=None, timeout=None):
+        self.base_url = (base_url or settings.SMS_API_URL).rstrip('/')
+        self.sender = sender if sender is not None else settings.SMS_API_SENDER
+        self.concurrency = concurrency or settings.SMS_GATEWAY_CONCURRENCY
+        self.timeout = timeout or settings.SMS_GATEWAY_TIMEOUT
+        self.session = requests.Session()
+        # All requests go to a single host, so one pool with a connection per concurrent sender is enough
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def authenticate(self, username=None, password=None):
+        response = self.session.post(
+            url=f'{self.base_url}/login',
+            json={
+                'username': username if username is not None else settings.SMS_API_USER,
+                'password': password if password is not None else settings.SMS_API_PASSWORD,
+            },
+            timeout=self.timeout,
+        )
+        return response.json()['token']
+
+    def send(self, token, to, text):
+        """
+        Send `text` to `to` (E.164 number without the leading '+').
+        """
+        return self.session.post(
+            url=f'{self.base_url}/sms',
+            json={'from': self.sender, 'to': to, 'text': text},
+            headers={'Authorization': f'Bearer {token}'},
+            timeout=self.timeout,
+        )
+
+    def send_many(self, token, messages):
+        """
+        Send `(to, text)` messages concurrently and return the responses in the same order.
+        A message whose request failed gets the raised `requests.RequestException` instead of a response.
+        """
+        messages = list(messages)
+        if len(messages) <= 1 or self.concurrency == 1:
+            return [self._send_or_error(token, message) for message in messages]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(messages))) as executor:
+            return list(executor.map(lambda message: self._send_or_error(token, message), messages))
+
+    def _send_or_error(self, token, message):
+        try:
+            return self.send(token, *message)
+        except requests.RequestException as error:
+            return error
+
+    def close(self):
+        self.session.close()
+
+
+class SmsTokenManager:
+    """
+    Keeps the api bearer token in the shared cache. The token is refreshed `SMS_TOKEN_REFRESH_MARGIN` seconds
+    before it expires by the single worker holding the refresh lock; everybody else keeps using the cached one.
+    """
+    cache_key = 'sms:token'
+    lock_key = 'sms:token:lock'
+    counters = ('sms_token_hits', 'sms_token_misses', 'sms_token_refreshes')
+
+    def __init__(self, gateway, ttl=None, refresh_margin=None, lock_timeout=30, poll_interval=0.1):
+        self.gateway = gateway
+        self.ttl = ttl or settings.SMS_TOKEN_TTL
+        self.refresh_margin = refresh_margin if refresh_margin is not None else settings.SMS_TOKEN_REFRESH_MARGIN
+        self.lock_timeout = lock_timeout
+        self.poll_interval = poll_interval
+
+    def get_token(self):
+        entry = cache.get(self.cache_key)
+        if entry:
+            stats.incr('sms_token_hits')
+            if time.time() >= entry['refresh_at'] and self._acquire_lock():
+                try:
+                    return self.refresh()
+                except (requests.RequestException, ValueError, KeyError, TypeError) as error:
+                    # The cached token is still valid until the margin runs out, the next call tries again
+                    logger.warning('Refreshing the sms api token failed: %r', error)
+                finally:
+                    self._release_lock()
+            return entry['token']
+
+        stats.incr('sms_token_misses')
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            if self._acquire_lock():
+                try:
+                    # Another worker may have logged in between our cache miss and taking the lock
+                    entry = cache.get(self.cache_key)
+                    return entry['token'] if entry else self.refresh()
+                finally:
+                    self._release_lock()
+            time.sleep(self.poll_interval)
+            entry = cache.get(self.cache_key)
+            if entry:
+                return entry['token']
+        # The lock holder is stuck, log in without it
+        return self.refresh()
+
+    def refresh(self):
+        token = self.gateway.authenticate()
+        now = time.time()
+        cache.set(
+            self.cache_key,
+            {'token': token, 'refresh_at': now + self.ttl - self.refresh_margin},
+            timeout=self.ttl,
+        )
+        stats.incr('sms_token_refreshes')
+        return token
+
+    def invalidate(self, token):
+        """
+        Drop `token` after the api rejected it, unless another worker has already replaced it.
+        """
+        entry = cache.get(self.cache_key)
+        if entry and entry['token'] == token:
+            cache.delete(self.cache_key)
+
+    def stats(self):
+        return stats.get_counters(self.counters)
+
+    def _acquire_lock(self):
+        return cache.add(self.lock_key, os.getpid(), timeout=self.lock_timeout)
+
+    def _release_lock(self):
+        cache.delete(self.lock_key)
+
+
+_gateway = None
+_gateway_pid = None
+
+
+def get_gateway():
+    """
+    Return the gateway of the current process. Sessions are not shared with forked worker processes.
+    """
+    global _gateway, _gateway_pid
+    if _gateway is None or _gateway_pid != os.getpid():
+        _gateway = SmsGateway()
+        _gateway_pid = os.getpid()
+    return _gateway
@@ -0,0 +1,92 @@
+"""
+Local stand-in for the SMS api, used by tests and benchmarks.
+"""
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubSmsGateway:
+    """
+    HTTP server answering like the SMS api. Usable as a context manager:
+
+        with StubSmsGateway(latency=0.01) as stub:
+            SmsGateway(base_url=stub.url).send_many(...)
+    """
+
+    def __init__(self, latency=0, token='stub-token'):
+        self.latency = latency
+        self.token = token
+        self.messages = []
+        self.logins = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately, don't let Nagle's algorithm delay keep-alive replies
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with stub._lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if self.path.endswith('/login'):
+                    with stub._lock:
+                        stub.logins += 1
+                    self._reply({'token': stub.token})
+                elif self.path.endswith('/sms'):
+                    if self.headers.get('Authorization') != f'Bearer {stub.token}':
+                        self._reply({'result': 'error'})
+                        return
+                    with stub._lock:
+                        stub.messages.append(body)
+                    self._reply({'result': 'OK'})
+                else:
+                    self._reply({'result': 'error'}, status=404)
+
+            def _reply(self, payload, status=200):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -0,0 +1,36 @@
+"""
+Counters kept in the shared cache, so they add up across web and worker processes.
+"""
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+
+from booking import instrumentation
+
+KEY_PREFIX = 'stats:'
+
+
+def incr(name, delta=1):
+    instrumentation.count(name, delta)
+    key = KEY_PREFIX + name
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # First hit of the counter; add() keeps a concurrent first hit from being overwritten
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, delta)
+
+
+async def aincr(name, delta=1):
+    """
+    `incr()` for the event loop. Runs in a thread, the cache's own aincr() is a get and a set in Django 4.2.
+    """
+    await sync_to_async(incr, thread_sensitive=False)(name, delta)
+
+
+def get_counters(names):
+    values = cache.get_many([KEY_PREFIX + name for name in names])
+    return {name: values.get(KEY_PREFIX + name, 0) for name in names}
+
+
+def reset(names):
+    cache.delete_many([KEY_PREFIX + name for name in names])
@@ -1,79 +1,114 @@
-import requests
-from celery import shared_task
-from booking.models import Visit
+from celery import shared_task, chord
+from celery.utils.log import get_task_logger
+from booking.sms import get_gateway
+from booking.models import OutboundSms
+from booking.planner import eligible_users, plan_reminders
+from booking import outbox, reminders
 import datetime
-import os
-from django.db.models import Count
-from django.contrib.auth import get_user_model
+from decimal import Decimal
+from django.conf import settings
 
+logger = get_task_logger(__name__)
 
-def sms_authenticate_token():
-    auth_response = requests.post(
-        url='https://api.vpbx.pl/api/v1/login',
-        json={"username": os.environ.get('SMS_API_USER'), "password": os.environ.get('SMS_API_PASSWORD')}
-    )
-    return auth_response.json()['token']
 
-
-def send_sms(client, token, text):
-    headers = {'Authorization': f'Bearer {token}'}
-    sms_data = {
-        'from': os.environ.get('SMS_API_SENDER'),
-        'to': client.phone_number.as_e164.strip('+'),
-        'text': text
-    }
-    return requests.post(url='https://api.vpbx.pl/api/v1/sms', json=sms_data, headers=headers)
+def chunk_users(user_visits, chunk_size):
+    """
+    Split `(user_pk, visits_count)` pairs into lists of user pks holding at most `chunk_size` visits.
+    A user is never split between chunks, so one with more visits than `chunk_size` gets a chunk alone.
+    """
+    chunks = []
+    chunk, chunk_visits = [], 0
+    for user_pk, visits_count in user_visits:
+        if chunk and chunk_visits + visits_count > chunk_size:
+            chunks.append(chunk)
+            chunk, chunk_visits = [], 0
+        chunk.append(user_pk)
+        chunk_visits += visits_count
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
 
 @shared_task(name='send_sms_remainder')
 def send_sms_remainder():
+    """
+    Dispatch reminders for tomorrow's visits as independent chunk subtasks and report totals when all finish.
+    No longer scheduled, reminders are planned per visit by plan_reminder_jobs. Sending a whole day at once
+    stays available for catching up by hand, visits already reminded are not reminded again.
+    """
     tomorrow = datetime.date.today() + datetime.timedelta(days=1)
-    users = get_user_model().objects.filter(sms_remainder=True, balance__gt=0)
-    # Check if user has visits tomorrow and if he has enough balance to send sms
-    for user in users:
-        visits = Visit.objects.filter(date=tomorrow, client__user=user)
-        total_cost = visits.aggregate(total_visits=Count('pk'))['total_visits'] * user.sms_price
-        if user.balance >= total_cost:
-            success_sms_counter = 0
-            # Authorization
-            token = sms_authenticate_token()
-            if token:
-                for tomorrow_visit in visits:
-                    text = f'Hello! \n' \
-                           f'We would like to remind you about the visit on {tomorrow_visit.time.strftime("%H:%M")},' \
-                           f' {tomorrow.day}.{tomorrow.month} in the {user.business_name}'
-                    while True:
-                        # Sending sms to clients
-                        sms_send_response = send_sms(client=tomorrow_visit.client, token=token, text=text)
-                        # If token expired
-                        if sms_send_response.json()['result'] == 'error':
-                            # Refresh token
-                            token = sms_authenticate_token()
-                        if sms_send_response.json()['result'] == 'OK':
-                            success_sms_counter += 1
-                            break
-            user.balance -= success_sms_counter * user.sms_price
-            user.save(update_fields=['balance'])
-
-
-@shared_task
-def send_sms_visit_cancelled(visits_pk, text, user):
-    if user.sms_remainder and user.balance >= user.sms_price * len(visits_pk):
-        visits = Visit.objects.filter(pk__in=visits_pk)
-        if visits:
-            success_sms_counter = 0
-            # Authorization
-            token = sms_authenticate_token()
-            if token:
-                for visit in visits:
-                    while True:
-                        # Sending sms to clients
-                        sms_send_response = send_sms(client=visit.client, token=token, text=text)
-                        if sms_send_response.json()['result'] == 'error':
-                            token = sms_authenticate_token()
-                        if sms_send_response.json()['result'] == 'OK':
-                            success_sms_counter += 1
-                            break
-            user.balance -= success_sms_counter * user.sms_price
-            user.save(update_fields=['balance'])
+    user_visits = eligible_users(tomorrow).order_by('pk').values_list('pk', 'visits_count')
+    chunks = chunk_users(user_visits, settings.SMS_REMAINDER_CHUNK_SIZE)
+    if not chunks:
+        return summarize_sms_remainder([])
+    header = [send_sms_remainder_chunk.s(user_pks=chunk, date=tomorrow.isoformat()) for chunk in chunks]
+    return chord(header)(summarize_sms_remainder.s())
+
+
+@shared_task(name='send_sms_remainder_chunk')
+def send_sms_remainder_chunk(user_pks, date):
+    """
+    Queue reminders for visits on `date` to clients of the given users in the sms outbox and start draining it.
+    Reminders get the outbox keys of ReminderJob reminders, so visits already reminded are skipped.
+    """
+    date = datetime.date.fromisoformat(date)
+    plans = plan_reminders(date, user_pks=user_pks)
+    # Users without enough balance to remind about all their visits get none queued
+    reservations = outbox.enqueue(OutboundSms.REMINDER, [
+        (plan.user_pk, reminders.reminder_ref(visit_pk, date, time), to,
+         reminders.reminder_text(plan.business_name, date, time))
+        for plan in plans
+        for visit_pk, time, to in plan.visits
+    ])
+    queued = sum(reservation.messages for reservation in reservations.values())
+    if queued:
+        drain_sms_outbox.delay()
+    return {
+        'queued': queued,
+        'skipped': sum(len(plan.visits) for plan in plans) - queued,
+        'held': str(sum((reservation.amount for reservation in reservations.values()), Decimal('0.00'))),
+    }
+
+
+@shared_task(name='summarize_sms_remainder')
+def summarize_sms_remainder(results):
+    """
+    Sum up the totals returned by the chunk subtasks.
+    """
+    totals = {'queued': 0, 'skipped': 0, 'held': Decimal('0.00')}
+    for result in results:
+        totals['queued'] += result['queued']
+        totals['skipped'] += result['skipped']
+        totals['held'] += Decimal(result['held'])
+    totals['held'] = str(totals['held'])
+    logger.info('SMS reminders: %(queued)s queued, %(skipped)s skipped, %(held)s held', totals)
+    return totals
+
+
+@shared_task(name='plan_reminder_jobs')
+def plan_reminder_jobs():
+    """
+    Plan reminders of the upcoming visits which don't have one yet.
+    """
+    return {'planned': reminders.schedule_reminders()}
+
+
+@shared_task(name='dispatch_reminder_jobs')
+def dispatch_reminder_jobs():
+    """
+    Queue the reminders which are due in the sms outbox and start draining it.
+    Runs overlapping with other dispatching workers share the work.
+    """
+    queued = reminders.dispatch_reminders()
+    if queued:
+        drain_sms_outbox.delay()
+    return {'queued': queued}
+
+
+@shared_task(name='drain_sms_outbox')
+def drain_sms_outbox():
+    """
+    Send the sms waiting in the outbox. Any number of runs may overlap, on any nodes, each sends its own batches.
+    """
+    return {'sent': outbox.drain(get_gateway())}
 
@@ -0,0 +1,193 @@
+import datetime
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from booking.models import Client, Visit
+from booking.pagination import KeysetPaginator
+from booking.schedule import get_schedule
+
+
+class ApiTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.client.force_login(self.user)
+        self.visit_client = Client.objects.create(
+            first_name='Test', last_name='Doe', phone_number='+48600000000', user=self.user
+        )
+        other_user = get_user_model().objects.create_user(username='other', password='test')
+        self.other_client = Client.objects.create(
+            first_name='Other', last_name='Doe', phone_number='+48700000000', user=other_user
+        )
+        self.other_visit = Visit.objects.create(
+            date=datetime.date(2022, 1, 12), time=datetime.time(10), client=self.other_client
+        )
+
+    def send(self, method, url, data):
+        return getattr(self.client, method)(url, json.dumps(data), content_type='application/json')
+
+
+class VisitsApiTestCase(ApiTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.url = reverse('booking:api-visits')
+        self.visits = [
+            Visit.objects.create(date=datetime.date(2022, 1, 12), time=datetime.time(8 + i), client=self.visit_client)
+            for i in range(3)
+        ]
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_list_with_fields(self):
+        with self.assertNumQueries(3):  # session, user, visits
+            response = self.client.get(self.url, {'fields': 'id,time', 'limit': 2})
+        data = response.json()
+        self.assertEqual(data['results'], [
+            {'id': self.visits[0].pk, 'time': '08:00:00'},
+            {'id': self.visits[1].pk, 'time': '09:00:00'},
+        ])
+        response = self.client.get(self.url, {'fields': 'id', 'cursor': data['next']})
+        self.assertEqual(response.json(), {'results': [{'id': self.visits[2].pk}], 'next': None})
+
+    def test_list_invalid_cursor(self):
+        for cursor in ('not-a-cursor', KeysetPaginator(Visit.objects.all(), 1, ['pk']).encode_cursor(['x'], False)):
+            response = self.client.get(self.url, {'cursor': cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'error': 'Invalid cursor'})
+
+    def test_list_unknown_field(self):
+        response = self.client.get(self.url, {'fields': 'id,owner'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_create(self):
+        get_schedule(self.user, datetime.date(2022, 1, 13))
+        rows = [
+            {'client': self.visit_client.pk, 'date': '2022-01-13', 'time': f'{8 + i}:00', 'notes': 'Bulk'}
+            for i in range(10)
+        ]
+        # session, user, clients, overlaps, savepoint, insert, release
+        with self.assertNumQueries(7):
+            response = self.send('post', self.url, rows)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['results']), len(rows))
+        self.assertEqual(Visit.objects.filter(owner=self.user, date=datetime.date(2022, 1, 13)).count(), len(rows))
+        self.assertEqual(len(get_schedule(self.user, datetime.date(2022, 1, 13))), len(rows))
+
+    def test_bulk_create_errors_save_nothing(self):
+        response = self.send('post', self.url, [
+            {'client': self.visit_client.pk, 'date': '2022-01-13', 'time': '10:00'},
+            {'client': self.other_client.pk, 'date': '2022-01-13', 'time': '12:00'},
+            {'client': self.visit_client.pk, 'date': 'tomorrow', 'time': '12:00'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'1', '2'})
+        self.assertFalse(Visit.objects.filter(date=datetime.date(2022, 1, 13)).exists())
+
+    def test_bulk_create_overlapping(self):
+        response = self.send('post', self.url, [
+            {'client': self.visit_client.pk, 'date': '2022-01-12', 'time': '11:00'},
+            {'client': self.visit_client.pk, 'date': '2022-01-12', 'time': '11:15'},
+            {'client': self.visit_client.pk, 'date': '2022-01-12', 'time': '08:15'},
+            # Visits of other users don't count
+            {'client': self.visit_client.pk, 'date': '2022-01-12', 'time': '10:30'},
+            {'client': self.visit_client.pk, 'date': '2022-01-12', 'time': '12:00'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'0', '1', '2'})
+        self.assertFalse(Visit.objects.filter(owner=self.user, time=datetime.time(12)).exists())
+
+    def test_bulk_update(self):
+        rows = [
+            {'id': self.visits[0].pk, 'time': '08:30'},
+            {'id': self.visits[1].pk, 'date': '2022-01-13', 'notes': 'Moved'},
+        ]
+        # session, user, visits, clients, overlaps, savepoint, update, release
+        with self.assertNumQueries(8):
+            response = self.send('patch', self.url, rows)
+        self.assertEqual(response.status_code, 200)
+        self.visits[0].refresh_from_db()
+        self.visits[1].refresh_from_db()
+        self.assertEqual((self.visits[0].time, self.visits[0].end_time), (datetime.time(8, 30), datetime.time(9)))
+        self.assertEqual((self.visits[1].date, self.visits[1].notes), (datetime.date(2022, 1, 13), 'Moved'))
+
+    def test_bulk_update_other_user_visit(self):
+        response = self.send('patch', self.url, [{'id': self.other_visit.pk, 'notes': 'Mine'}])
+        self.assertEqual(response.status_code, 404)
+        self.other_visit.refresh_from_db()
+        self.assertEqual(self.other_visit.notes, '')
+
+    def test_bulk_update_overlapping(self):
+        response = self.send('patch', self.url, [{'id': self.visits[0].pk, 'time': '08:45'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Visit.objects.get(pk=self.visits[0].pk).time, datetime.time(8))
+
+    def test_bulk_delete(self):
+        self.assertEqual(len(get_schedule(self.user, datetime.date(2022, 1, 12))), 3)
+        response = self.send('delete', self.url, [self.visits[0].pk, self.visits[1].pk, self.other_visit.pk])
+        self.assertEqual(response.json(), {'deleted': 2})
+        self.assertTrue(Visit.objects.filter(pk=self.other_visit.pk).exists())
+        self.assertEqual(len(get_schedule(self.user, datetime.date(2022, 1, 12))), 1)
+
+
+class ClientsApiTestCase(ApiTestCase):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.url = reverse('booking:api-clients')
+
+    def test_list(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.json()['results'], [{
+            'id': self.visit_client.pk, 'first_name': 'Test', 'last_name': 'Doe', 'phone_number': '+48600000000'
+        }])
+
+    def test_bulk_create(self):
+        rows = [
+            {'first_name': 'Zoë', 'last_name': f'Doe{i}', 'phone_number': f'+48600{i:06d}'}
+            for i in range(1, 21)
+        ]
+        # session, user, phone numbers, savepoint, insert, release
+        with self.assertNumQueries(6):
+            response = self.send('post', self.url, rows)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Client.objects.filter(user=self.user, search_name__startswith='zoe doe').count(), 20)
+
+    def test_bulk_create_duplicate_phone_numbers(self):
+        response = self.send('post', self.url, [
+            {'first_name': 'A', 'last_name': 'Doe', 'phone_number': '+48700000000'},
+            {'first_name': 'B', 'last_name': 'Doe', 'phone_number': '+48600000001'},
+            {'first_name': 'C', 'last_name': 'Doe', 'phone_number': '+48600000001'},
+            {'first_name': 'D', 'last_name': 'Doe', 'phone_number': '123'},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'3'})
+        response = self.send('post', self.url, [
+            {'first_name': 'A', 'last_name': 'Doe', 'phone_number': '+48700000000'},
+            {'first_name': 'B', 'last_name': 'Doe', 'phone_number': '+48600000001'},
+            {'first_name': 'C', 'last_name': 'Doe', 'phone_number': '+48600000001'},
+        ])
+        self.assertEqual(set(response.json()['errors']), {'0', '1', '2'})
+        self.assertEqual(Client.objects.count(), 2)
+
+    def test_bulk_update(self):
+        Visit.objects.create(date=datetime.date(2022, 1, 12), time=datetime.time(8), client=self.visit_client)
+        self.assertEqual(get_schedule(self.user, datetime.date(2022, 1, 12))[0].client.first_name, 'Test')
+        response = self.send('patch', self.url, [{'id': self.visit_client.pk, 'first_name': 'Renamed'}])
+        self.assertEqual(response.status_code, 200)
+        self.visit_client.refresh_from_db()
+        self.assertEqual(self.visit_client.search_name, 'renamed doe')
+        self.assertEqual(get_schedule(self.user, datetime.date(2022, 1, 12))[0].client.first_name, 'Renamed')
+
+    def test_bulk_delete(self):
+        response = self.send('delete', self.url, [self.visit_client.pk, self.other_client.pk])
+        self.assertEqual(response.json(), {'deleted': 1})
+        self.assertTrue(Client.objects.filter(pk=self.other_client.pk).exists())
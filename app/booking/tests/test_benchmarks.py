@@ -0,0 +1,61 @@
+import json
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from booking.benchmarks import SKIPPED_URLS, compare
+from booking.urls import urlpatterns
+
+
+class BenchmarkSuiteTestCase(TestCase):
+
+    def run_suite(self, *args):
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as file:
+            call_command(
+                'benchmark', '--tenants=2', '--clients=5', '--visits=2', '--days=1', '--rounds=2',
+                f'--output={file.name}', *args, stdout=StringIO()
+            )
+            return json.load(file)
+
+    def test_report(self):
+        report = self.run_suite()
+        names = {f'url {pattern.name}' for pattern in urlpatterns if pattern.name not in SKIPPED_URLS}
+        names |= {'task send_sms_remainder_chunk', 'task drain_sms_outbox', 'cancel_visits'}
+        self.assertEqual(set(report['results']), names)
+        self.assertEqual(report['results']['url index']['rounds'], 2)
+        self.assertEqual(report['meta']['tenants'], 2)
+
+    def test_only(self):
+        report = self.run_suite('--only=url client')
+        self.assertEqual(
+            set(report['results']),
+            {'url clients', 'url client-create', 'url client-import', 'url client-edit', 'url client-delete'}
+        )
+
+    def test_compare(self):
+        result = {'rounds': 2, 'mean_ms': 10, 'min_ms': 9, 'p50_ms': 10, 'p99_ms': 12, 'ops_per_sec': 100, 'queries': 3}
+        baseline = {'results': {'url index': result, 'url clients': result}}
+        report = {'results': {
+            'url index': {**result, 'p50_ms': 11},
+            'url clients': {**result, 'p50_ms': 13, 'queries': 4},
+            'url account': result,
+        }}
+        self.assertEqual(compare(baseline, report, threshold=0.2), [
+            ('url clients', 'p50_ms', 10, 13),
+            ('url clients', 'queries', 3, 4),
+        ])
+
+    def test_compare_fails_on_regression(self):
+        baseline = self.run_suite('--only=url account')
+        baseline['results']['url account']['queries'] = 0
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as file:
+            json.dump(baseline, file)
+            file.flush()
+            with self.assertRaisesMessage(CommandError, '1 regressions'):
+                call_command(
+                    'benchmark', '--tenants=1', '--clients=5', '--visits=2', '--days=1', '--rounds=2',
+                    '--only=url account', f'--compare={file.name}', '--threshold=100', stdout=StringIO()
+                )
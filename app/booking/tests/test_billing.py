@@ -0,0 +1,66 @@
+# Tests of the billing module
+
+from django.test import TestCase
+from booking.billing import reserve, release, Reservation
+from booking.models import SmsCharge
+from django.contrib.auth import get_user_model
+from decimal import Decimal
+
+
+class BillingTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.rich_user = get_user_model().objects.create_user(username='rich', password='test', balance=10)
+        self.poor_user = get_user_model().objects.create_user(username='poor', password='test', balance='0.20')
+        self.other_user = get_user_model().objects.create_user(
+            username='other', password='test', balance=5, sms_price='0.25'
+        )
+
+    def test_reserve(self):
+        reservations = reserve({self.rich_user.pk: 3, self.poor_user.pk: 3, self.other_user.pk: 4})
+        self.assertEqual(reservations, {
+            self.rich_user.pk: Reservation(3, Decimal('0.30')),
+            self.other_user.pk: Reservation(4, Decimal('1.00')),
+        })
+        self.rich_user.refresh_from_db()
+        self.poor_user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.rich_user.balance, Decimal('9.70'))
+        self.assertEqual(self.poor_user.balance, Decimal('0.20'))
+        self.assertEqual(self.other_user.balance, Decimal('4.00'))
+        self.assertEqual(
+            sorted(SmsCharge.objects.values_list('user', 'kind', 'amount', 'messages')),
+            sorted([
+                (self.rich_user.pk, SmsCharge.RESERVATION, Decimal('-0.30'), 3),
+                (self.other_user.pk, SmsCharge.RESERVATION, Decimal('-1.00'), 4),
+            ])
+        )
+
+    def test_reserve_query_count(self):
+        # Lock and read balances, one batched update, one ledger insert, plus savepoint and release
+        with self.assertNumQueries(5):
+            reserve({self.rich_user.pk: 3, self.other_user.pk: 4})
+
+    def test_reserve_does_not_overwrite_concurrent_change(self):
+        get_user_model().objects.filter(pk=self.rich_user.pk).update(balance=20)
+        reserve({self.rich_user.pk: 10})
+        self.rich_user.refresh_from_db()
+        self.assertEqual(self.rich_user.balance, Decimal('19.00'))
+
+    def test_release(self):
+        reservations = reserve({self.rich_user.pk: 3, self.other_user.pk: 4})
+        with self.assertNumQueries(4):
+            charged = release(reservations, {self.rich_user.pk: 1, self.other_user.pk: 4})
+        self.assertEqual(charged, Decimal('1.10'))
+        self.rich_user.refresh_from_db()
+        self.other_user.refresh_from_db()
+        self.assertEqual(self.rich_user.balance, Decimal('9.90'))
+        self.assertEqual(self.other_user.balance, Decimal('4.00'))
+        refund = SmsCharge.objects.get(kind=SmsCharge.REFUND)
+        self.assertEqual((refund.user, refund.amount, refund.messages), (self.rich_user, Decimal('0.20'), 2))
+
+    def test_release_nothing_sent(self):
+        reservations = reserve({self.rich_user.pk: 3})
+        self.assertEqual(release(reservations, {}), Decimal('0.00'))
+        self.rich_user.refresh_from_db()
+        self.assertEqual(self.rich_user.balance, Decimal('10.00'))
@@ -1,9 +1,11 @@
 from django.test import TestCase
 from django.urls import reverse
-from booking.models import Visit, Client
+from booking.models import Visit, Client, OutboundSms
 from django.contrib.auth import get_user_model
 import datetime
 from unittest.mock import patch
+from django.core.cache import cache
+from decimal import Decimal
 
 
 def create_visit(client, date, time, notes):
@@ -28,6 +30,7 @@ def create_client(user, first_name, last_name, phone_number,):
 class VisitsViewTestCase(TestCase):
 
     def setUp(self) -> None:
+        cache.clear()
         user_details = {
             'username': 'Test Name',
             'password': 'test-user-password123'
@@ -167,6 +170,61 @@ class VisitsViewTestCase(TestCase):
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Visit.objects.filter(client__user=self.user).count(), 1)
 
+    def test_create_overlapping_visit_view(self):
+        """
+        A visit overlapping another visit of the user should not be created.
+        """
+        client = create_client(user=self.user, first_name='Test', last_name='Client', phone_number='+48123456789')
+        create_visit(client=client, date=datetime.date.today(), time=datetime.time(11, 0), notes='')
+
+        with self.assertNumQueries(6):  # session, user, client choice, overlap check, 2 savepoints
+            response = self.client.post(reverse('booking:visit-create'), {
+                'date': datetime.date.today(),
+                'time': datetime.time(10, 45),
+                'duration': 30,
+                'client': client.id,
+                'notes': ''
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertFormError(response, 'form', None, 'This time overlaps another visit')
+
+        # Back to back visits and visits of other users don't overlap
+        response = self.client.post(reverse('booking:visit-create'), {
+            'date': datetime.date.today(),
+            'time': datetime.time(10, 0),
+            'client': client.id,
+            'notes': ''
+        })
+        self.assertEqual(response.status_code, 302)
+        visit = Visit.objects.get(client=client, time=datetime.time(10, 0))
+        self.assertEqual((visit.duration, visit.end_time), (30, datetime.time(10, 30)))
+
+    def test_update_visit_does_not_overlap_itself(self):
+        """
+        Moving a visit within its own time should be allowed, onto another visit not.
+        """
+        client = create_client(user=self.user, first_name='Test', last_name='Client', phone_number='+48123456789')
+        visit = create_visit(client=client, date=datetime.date.today(), time=datetime.time(10, 0), notes='')
+        create_visit(client=client, date=datetime.date.today(), time=datetime.time(11, 0), notes='')
+
+        data = {'date': datetime.date.today(), 'time': datetime.time(10, 15), 'client': client.id, 'notes': ''}
+        response = self.client.post(reverse('booking:visit-edit', args=[visit.id]), data)
+        self.assertEqual(response.status_code, 302)
+
+        response = self.client.post(reverse('booking:visit-edit', args=[visit.id]), {**data, 'duration': 60})
+        self.assertFormError(response, 'form', None, 'This time overlaps another visit')
+        self.assertEqual(Visit.objects.get(id=visit.id).duration, 30)
+
+    def test_visit_ending_after_midnight(self):
+        client = create_client(user=self.user, first_name='Test', last_name='Client', phone_number='+48123456789')
+        response = self.client.post(reverse('booking:visit-create'), {
+            'date': datetime.date.today(),
+            'time': datetime.time(23, 45),
+            'client': client.id,
+            'notes': ''
+        })
+        self.assertFormError(response, 'form', None, 'Visit must end before midnight')
+
     def test_delete_visit_view(self):
         """
         If a visit exists, it should be deleted.
@@ -203,6 +261,110 @@ class VisitsViewTestCase(TestCase):
         self.assertEqual(Visit.objects.filter(client__user=self.other_user_visit.client.user).count(), 1)
 
 
+class CalendarViewTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='Test Name', password='test-user-password123')
+        self.client.force_login(user=self.user)
+        self.visit_client = create_client(
+            user=self.user, first_name='Test', last_name='Client', phone_number='+48123456789')
+        # 2022-01-12 is a Wednesday
+        self.visit = create_visit(self.visit_client, datetime.date(2022, 1, 12), datetime.time(9, 0), '')
+        create_visit(self.visit_client, datetime.date(2022, 1, 12), datetime.time(8, 0), '')
+        create_visit(self.visit_client, datetime.date(2022, 1, 20), datetime.time(8, 0), '')
+        self.url = reverse('booking:calendar') + '?start=2022-01-12'
+
+    def test_week_view(self):
+        with self.assertNumQueries(3):  # session, user, visits of the week
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        days = response.context['days']
+        self.assertEqual([date for date, visits in days][0], datetime.date(2022, 1, 10))
+        self.assertEqual(len(days), 7)
+        self.assertEqual([visit.time for visit in dict(days)[datetime.date(2022, 1, 12)]],
+                         [datetime.time(8, 0), datetime.time(9, 0)])
+        self.assertEqual(response.context['next_start'], datetime.date(2022, 1, 17))
+
+    def test_month_view(self):
+        response = self.client.get(self.url + '&span=month')
+        days = response.context['days']
+        self.assertEqual(len(days), 31)
+        self.assertEqual(sum(len(visits) for date, visits in days), 3)
+        self.assertEqual(response.context['previous_start'], datetime.date(2021, 12, 1))
+
+    def test_out_of_range_start(self):
+        for start in ('9999-12-31', '0001-01-01'):
+            for span in ('week', 'month'):
+                response = self.client.get(reverse('booking:calendar'), {'start': start, 'span': span})
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['from_date'], datetime.date(1, 2, 1))
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        with self.assertNumQueries(2):  # session, user
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_changes_after_visit_changes(self):
+        etag = self.client.get(self.url)['ETag']
+        self.visit.time = datetime.time(10, 0)
+        self.visit.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.visit.delete()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_other_user_visits_are_not_shown(self):
+        other_user = get_user_model().objects.create_user(username='other_user', password='test-user-password123')
+        create_visit(create_client(user=other_user, first_name='Other', last_name='User', phone_number='+48123457666'),
+                     datetime.date(2022, 1, 12), datetime.time(11, 0), '')
+        response = self.client.get(self.url)
+        self.assertEqual(len(dict(response.context['days'])[datetime.date(2022, 1, 12)]), 2)
+
+
+class FreeSlotsViewTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='Test Name', password='test-user-password123')
+        self.client.force_login(user=self.user)
+        visit_client = create_client(user=self.user, first_name='Test', last_name='Client', phone_number='+48123456789')
+        create_visit(visit_client, datetime.date(2022, 1, 12), datetime.time(8, 30), '')
+        create_visit(visit_client, datetime.date(2022, 1, 12), datetime.time(9, 0), '')
+        create_visit(visit_client, datetime.date(2022, 1, 12), datetime.time(12, 0), '')
+        create_visit(visit_client, datetime.date(2022, 1, 13), datetime.time(19, 45), '')
+
+    def test_free_slots_of_a_day(self):
+        with self.assertNumQueries(3):  # session, user, visits
+            response = self.client.get(reverse('booking:free-slots'), {'date': '2022-01-12', 'duration': 60})
+        self.assertEqual(response.json()['slots'], [
+            {'date': '2022-01-12', 'start': '09:30', 'end': '12:00'},
+            {'date': '2022-01-12', 'start': '12:30', 'end': '20:00'},
+        ])
+
+    def test_free_slots_of_a_week(self):
+        response = self.client.get(reverse('booking:free-slots'), {'date': '2022-01-12', 'span': 'week'})
+        slots = response.json()['slots']
+        self.assertEqual(len(slots), 3 + 1 + 5)
+        self.assertIn({'date': '2022-01-13', 'start': '08:00', 'end': '19:45'}, slots)
+
+    def test_invalid_duration(self):
+        response = self.client.get(reverse('booking:free-slots'), {'duration': 'long'})
+        self.assertEqual(response.status_code, 400)
+        for duration in (0, 721, 99999999999999):
+            response = self.client.get(reverse('booking:free-slots'), {'duration': duration})
+            self.assertEqual(response.json(), {'error': 'duration must be between 1 and 720 minutes'})
+        response = self.client.get(reverse('booking:free-slots'), {'duration': 720})
+        self.assertEqual(response.status_code, 200)
+
+    def test_last_week(self):
+        response = self.client.get(reverse('booking:free-slots'), {'date': '9999-12-31', 'span': 'week'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['slots'][-1]['date'], '9999-12-31')
+
+
 class ClientViewsTestCase(TestCase):
 
     def setUp(self) -> None:
@@ -436,7 +598,7 @@ class LogoutViewTestCase(TestCase):
         self.assertNotIn('_auth_user_id', self.client.session)
 
 
-@patch('booking.views.send_sms_visit_cancelled.delay')
+@patch('booking.cancellation.drain_sms_outbox.delay')
 class CancelVisitsViewTestCase(TestCase):
 
     def setUp(self):
@@ -458,24 +620,35 @@ class CancelVisitsViewTestCase(TestCase):
         self.visits = \
             [create_visit(date=today, time=datetime.time(11, 11), client=self.visit_client, notes='') for i in range(3)]
 
-    def test_cancel_visits_view_with_send_sms_with_text(self, mock_send_sms_visit_cancelled):
+    def test_cancel_visits_view_with_send_sms_with_text(self, mock_drain_sms_outbox):
         """
         If visits exist, they should be cancelled.
         """
         response = self.client.get(reverse('booking:cancel-visits'))
         self.assertEqual(response.status_code, 200)
 
-        response = self.client.post(reverse('booking:cancel-visits'), {
-            'from_date': datetime.date.today(),
-            'to_date': datetime.date.today(),
-            'send_sms': True,
-            'text_message': 'Test message'
-        })
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('booking:cancel-visits'), {
+                'from_date': datetime.date.today(),
+                'to_date': datetime.date.today(),
+                'send_sms': True,
+                'text_message': 'Test message'
+            })
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Visit.objects.count(), 0)
-        self.assertEqual(mock_send_sms_visit_cancelled.call_count, 1)
+        self.assertEqual(mock_drain_sms_outbox.call_count, 1)
+        # Numbers are taken before the visits are deleted, one sms per visit
+        self.assertQuerysetEqual(
+            OutboundSms.objects.order_by('pk').values_list('key', 'to', 'text', 'status'),
+            [(f'cancellation:{visit.pk}', '48123456789', 'Test message', OutboundSms.PENDING)
+             for visit in self.visits],
+            transform=tuple
+        )
+        # Funds for the sms are held until they are sent
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('9.70'))
 
-    def test_cancel_visits_view_with_send_sms_without_text(self, mock_send_sms_visit_cancelled):
+    def test_cancel_visits_view_with_send_sms_without_text(self, mock_drain_sms_outbox):
         """
         If visits exist, they should be cancelled.
         """
@@ -491,9 +664,9 @@ class CancelVisitsViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('This field is required', response.context['form'].errors['text_message'])
         self.assertEqual(Visit.objects.count(), 3)
-        self.assertEqual(mock_send_sms_visit_cancelled.call_count, 0)
+        self.assertEqual(mock_drain_sms_outbox.call_count, 0)
 
-    def test_cancel_visits_view_without_send_sms(self, mock_send_sms_visit_cancelled):
+    def test_cancel_visits_view_without_send_sms(self, mock_drain_sms_outbox):
         """
         If visits exist, they should be cancelled.
         """
@@ -508,9 +681,9 @@ class CancelVisitsViewTestCase(TestCase):
         })
         self.assertEqual(response.status_code, 302)
         self.assertEqual(Visit.objects.count(), 0)
-        self.assertEqual(mock_send_sms_visit_cancelled.call_count, 0)
+        self.assertEqual(mock_drain_sms_outbox.call_count, 0)
 
-    def test_cancel_visits_view_with_wrong_dates(self, mock_send_sms_visit_cancelled):
+    def test_cancel_visits_view_with_wrong_dates(self, mock_drain_sms_outbox):
         """
         If visits exist, they should be cancelled.
         """
@@ -526,13 +699,13 @@ class CancelVisitsViewTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('No visits found for this period', response.context['form'].errors['__all__'])
         self.assertEqual(Visit.objects.count(), 3)
-        self.assertEqual(mock_send_sms_visit_cancelled.call_count, 0)
+        self.assertEqual(mock_drain_sms_outbox.call_count, 0)
 
 
-@patch('booking.views.send_sms_visit_cancelled.delay')
+@patch('booking.cancellation.drain_sms_outbox.delay')
 class CancelVisitViewBadRequestTestCase(TestCase):
 
-    def test_user_with_no_sms_reminder(self, mock_send_sms_visit_cancelled):
+    def test_user_with_no_sms_reminder(self, mock_drain_sms_outbox):
         self.user_details = {
             'username': 'testname',
             'password': 'qwe123',
@@ -563,9 +736,9 @@ class CancelVisitViewBadRequestTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('You have not set up sms remainder', response.context['form'].errors['__all__'])
         self.assertEqual(Visit.objects.count(), 3)
-        self.assertEqual(mock_send_sms_visit_cancelled.call_count, 0)
+        self.assertEqual(mock_drain_sms_outbox.call_count, 0)
 
-    def test_user_with_no_balance(self, mock_send_sms_visit_cancelled):
+    def test_user_with_no_balance(self, mock_drain_sms_outbox):
         self.user_details = {
             'username': 'testname',
             'password': 'qwe123',
@@ -596,7 +769,7 @@ class CancelVisitViewBadRequestTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertIn('Not enough money on your account', response.context['form'].errors['__all__'])
         self.assertEqual(Visit.objects.count(), 3)
-        self.assertEqual(mock_send_sms_visit_cancelled.call_count, 0)
+        self.assertEqual(mock_drain_sms_outbox.call_count, 0)
 
 
 class AccountViewTestCase(TestCase):
@@ -633,6 +806,12 @@ class AccountViewTestCase(TestCase):
         self.assertEqual(payload['business_name'], self.user.business_name)
         self.assertEqual(payload['email'], self.user.email)
 
+    def test_account_view_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('booking:account'))
+
+        self.assertRedirects(response, f"{reverse('booking:login')}?next={reverse('booking:account')}")
+
     def test_account_view_with_invalid_data(self):
         payload = {
             'sms_remainder': False,
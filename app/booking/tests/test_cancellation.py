@@ -0,0 +1,94 @@
+# Tests of the cancellation module
+
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase
+from booking.cancellation import cancel_visits, CancellationError
+from booking.models import Visit, Client, SmsCharge, OutboundSms
+from django.contrib.auth import get_user_model
+from decimal import Decimal
+import datetime
+import math
+
+
+def insert_queries(count):
+    """
+    INSERTs of `count` outbox rows, one on PostgreSQL while SQLite splits them by its parameter limit.
+    """
+    fields = [field for field in OutboundSms._meta.concrete_fields if not field.primary_key]
+    return math.ceil(count / connection.ops.bulk_batch_size(fields, []))
+
+
+@patch('booking.cancellation.drain_sms_outbox.delay')
+class CancelVisitsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.today = datetime.date.today()
+        self.user = get_user_model().objects.create_user(
+            username='test', password='test', sms_remainder=True, balance=Decimal('2000.00')
+        )
+        clients = Client.objects.bulk_create([
+            Client(first_name='Test', last_name='Doe', phone_number=f'+48600{i:06d}', user=self.user)
+            for i in range(100)
+        ])
+        # 10 000 visits spread over 30 days, without duration so they don't overlap
+        Visit.objects.bulk_create([
+            Visit(
+                date=self.today + datetime.timedelta(days=i % 30),
+                time=time,
+                duration=0,
+                end_time=time,
+                client=client,
+                owner=self.user
+            )
+            for i in range(100)
+            for time in [datetime.time(8 + i % 10)]
+            for client in clients
+        ])
+        other_user = get_user_model().objects.create_user(username='other', password='test')
+        other_client = Client.objects.create(first_name='Other', last_name='Doe', phone_number='+48700000000',
+                                             user=other_user)
+        Visit.objects.create(date=self.today, time=datetime.time(10), client=other_client)
+
+    def test_cancel_visits_query_count(self, mock_delay):
+        # Days of the visits, delete reminder jobs and visits, plus savepoint and release
+        with self.assertNumQueries(5):
+            cancelled = cancel_visits(self.user, self.today, self.today + datetime.timedelta(days=29))
+        self.assertEqual(cancelled, 10000)
+        self.assertEqual(Visit.objects.count(), 1)
+
+    def test_cancel_visits_with_sms_query_count(self, mock_delay):
+        # Recipients snapshot, balance lock, debit, ledger row, queued keys, the outbox rows, days of the
+        # visits, two deletes, plus savepoints and releases
+        with self.assertNumQueries(14 + insert_queries(10000)), self.captureOnCommitCallbacks(execute=True):
+            cancelled = cancel_visits(self.user, self.today, self.today + datetime.timedelta(days=29), text='Sorry')
+        self.assertEqual(cancelled, 10000)
+        self.assertEqual(OutboundSms.objects.filter(kind=OutboundSms.CANCELLATION, price='0.10').count(), 10000)
+        mock_delay.assert_called_once_with()
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('1000.00'))
+
+    def test_cancel_visits_range(self, mock_delay):
+        with self.captureOnCommitCallbacks(execute=True):
+            cancelled = cancel_visits(self.user, self.today, self.today, text='Sorry')
+        self.assertEqual(cancelled, 400)
+        self.assertEqual(OutboundSms.objects.count(), 400)
+        self.assertFalse(Visit.objects.filter(client__user=self.user, date=self.today).exists())
+        self.assertEqual(Visit.objects.filter(client__user=self.user).count(), 9600)
+
+    def test_no_visits(self, mock_delay):
+        next_year = self.today + datetime.timedelta(days=365)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaisesMessage(CancellationError, 'No visits found for this period'):
+                cancel_visits(self.user, next_year, next_year, text='Sorry')
+        mock_delay.assert_not_called()
+
+    def test_not_enough_money(self, mock_delay):
+        get_user_model().objects.filter(pk=self.user.pk).update(balance=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaisesMessage(CancellationError, 'Not enough money on your account'):
+                cancel_visits(self.user, self.today, self.today, text='Sorry')
+        mock_delay.assert_not_called()
+        self.assertEqual(Visit.objects.count(), 10001)
+        self.assertFalse(SmsCharge.objects.exists())
+        self.assertFalse(OutboundSms.objects.exists())
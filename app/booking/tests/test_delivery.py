@@ -0,0 +1,104 @@
+# Tests of the delivery module
+
+from unittest.mock import Mock, patch
+import requests
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from booking.delivery import deliver, classify, backoff_delay, SENT, RETRY, EXPIRED_TOKEN, PERMANENT
+from booking.models import FailedSms
+
+
+def response(result=None, status_code=200):
+    response = Mock(status_code=status_code)
+    if result is None:
+        response.json.side_effect = ValueError
+    else:
+        response.json.return_value = {'result': result}
+    return response
+
+
+class ClassifyTestCase(TestCase):
+
+    def test_classify(self):
+        self.assertEqual(classify(response('OK'))[0], SENT)
+        self.assertEqual(classify(response('error'))[0], EXPIRED_TOKEN)
+        self.assertEqual(classify(response(status_code=401))[0], EXPIRED_TOKEN)
+        self.assertEqual(classify(response(status_code=503))[0], RETRY)
+        self.assertEqual(classify(response(status_code=429))[0], RETRY)
+        self.assertEqual(classify(requests.ConnectionError('refused'))[0], RETRY)
+        self.assertEqual(classify(requests.Timeout('timed out'))[0], RETRY)
+        self.assertEqual(classify(response(status_code=400))[0], PERMANENT)
+        self.assertEqual(classify(response('invalid number', status_code=422))[0], PERMANENT)
+
+    def test_backoff_delay(self):
+        with patch('booking.delivery.random.uniform', side_effect=lambda low, high: high):
+            self.assertEqual([backoff_delay(attempt, 1, 5) for attempt in range(1, 6)], [1, 2, 4, 5, 5])
+
+
+@override_settings(SMS_MAX_ATTEMPTS=3)
+@patch('booking.delivery.time.sleep')
+class DeliverTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.gateway = Mock(**{'authenticate.side_effect': ['first', 'second']})
+        self.messages = [('48123456780', 'Hello'), ('48123456781', 'Hello')]
+
+    def test_deliver(self, mock_sleep):
+        self.gateway.send_many.return_value = [response('OK'), response('OK')]
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 2)
+        self.assertEqual(self.gateway.send_many.call_count, 1)
+        mock_sleep.assert_not_called()
+
+    def test_retry_only_failed_messages(self, mock_sleep):
+        self.gateway.send_many.side_effect = [
+            [response('OK'), response(status_code=502)],
+            [requests.ConnectionError('refused')],
+            [response('OK')],
+        ]
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 2)
+        self.assertEqual(self.gateway.send_many.call_args.args[1], [self.messages[1]])
+        self.assertEqual(mock_sleep.call_count, 2)
+        self.assertFalse(FailedSms.objects.exists())
+
+    def test_refresh_expired_token(self, mock_sleep):
+        self.gateway.send_many.side_effect = [
+            [response('error'), response('error')],
+            [response('OK'), response('OK')],
+        ]
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 2)
+        self.assertEqual(self.gateway.send_many.call_args.args[0], 'second')
+
+    def test_dead_letter_after_max_attempts(self, mock_sleep):
+        self.gateway.send_many.side_effect = lambda token, messages: [response(status_code=503) for _ in messages]
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 0)
+        self.assertEqual(self.gateway.send_many.call_count, 3)
+        self.assertEqual(
+            list(FailedSms.objects.values_list('owner', 'to', 'error', 'attempts')),
+            [(self.user.pk, '48123456780', 'HTTP 503', 3), (self.user.pk, '48123456781', 'HTTP 503', 3)]
+        )
+
+    def test_permanent_error_is_not_retried(self, mock_sleep):
+        self.gateway.send_many.return_value = [response('OK'), response('invalid number', status_code=422)]
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 1)
+        self.assertEqual(self.gateway.send_many.call_count, 1)
+        failed = FailedSms.objects.get()
+        self.assertEqual((failed.to, failed.attempts), ('48123456781', 1))
+
+    def test_login_failure_is_retried(self, mock_sleep):
+        self.gateway.authenticate.side_effect = [requests.ConnectionError('refused'), 'second']
+        self.gateway.send_many.return_value = [response('OK'), response('OK')]
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 2)
+        self.assertEqual(self.gateway.send_many.call_args.args[0], 'second')
+        self.assertEqual(mock_sleep.call_count, 1)
+
+    def test_login_failure_dead_letters(self, mock_sleep):
+        self.gateway.authenticate.side_effect = requests.ConnectionError('refused')
+        self.assertEqual(deliver(self.gateway, self.messages, owner_id=self.user.pk), 0)
+        self.gateway.send_many.assert_not_called()
+        self.assertEqual(
+            list(FailedSms.objects.values_list('to', 'error', 'attempts')),
+            [('48123456780', 'Login ConnectionError: refused', 3), ('48123456781', 'Login ConnectionError: refused', 3)]
+        )
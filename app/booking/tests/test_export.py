@@ -0,0 +1,107 @@
+import datetime
+import io
+import json
+import warnings
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections
+from django.test import TestCase
+from django.urls import reverse
+
+from app.asgi import application
+
+from booking.models import Client, Visit
+
+
+class ExportTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.client.force_login(self.user)
+        self.visit_client = Client.objects.create(
+            first_name='Zoë', last_name='Doe', phone_number='+48600000000', user=self.user
+        )
+        self.visits = [
+            Visit.objects.create(date=datetime.date(2022, 1, 10 + i), time=datetime.time(10), client=self.visit_client,
+                                 notes='Say "hi", please')
+            for i in range(3)
+        ]
+        other_user = get_user_model().objects.create_user(username='other', password='test')
+        other_client = Client.objects.create(
+            first_name='Other', last_name='Doe', phone_number='+48700000000', user=other_user
+        )
+        Visit.objects.create(date=datetime.date(2022, 1, 11), time=datetime.time(10), client=other_client)
+
+    def test_export_visits_csv(self):
+        response = self.client.get(reverse('booking:export-visits'), {'from': '2022-01-11'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="visits.csv"')
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), [
+            'id,date,time,duration,client_id,first_name,last_name,phone_number,notes',
+            f'{self.visits[1].pk},2022-01-11,10:00:00,30,{self.visit_client.pk},Zoë,Doe,+48600000000,"Say ""hi"", please"',
+            f'{self.visits[2].pk},2022-01-12,10:00:00,30,{self.visit_client.pk},Zoë,Doe,+48600000000,"Say ""hi"", please"',
+        ])
+
+    def test_export_visits_ndjson(self):
+        response = self.client.get(reverse('booking:export-visits'), {'format': 'ndjson', 'to': '2022-01-10'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual(rows, [{
+            'id': self.visits[0].pk, 'date': '2022-01-10', 'time': '10:00:00', 'duration': 30,
+            'client_id': self.visit_client.pk, 'first_name': 'Zoë', 'last_name': 'Doe',
+            'phone_number': '+48600000000', 'notes': 'Say "hi", please',
+        }])
+
+    def test_export_clients(self):
+        response = self.client.get(reverse('booking:export-clients'))
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines(), [
+            'id,first_name,last_name,phone_number',
+            f'{self.visit_client.pk},Zoë,Doe,+48600000000',
+        ])
+
+    def test_export_invalid_parameters(self):
+        self.assertEqual(self.client.get(reverse('booking:export-visits'), {'format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('booking:export-visits'), {'from': 'monday'}).status_code, 400)
+
+    def test_export_command(self):
+        output = io.StringIO()
+        call_command('export_booking', 'test', 'visits', '--format', 'ndjson', '--from', '2022-01-12', stdout=output)
+        self.assertEqual([json.loads(line)['id'] for line in output.getvalue().splitlines()], [self.visits[2].pk])
+
+    def test_export_over_asgi(self):
+        # Like the test client, keep the handler from closing the test transaction's connection
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.serve_asgi(receive, send)
+        # Served as it is read, a sync iterator would be loaded whole by the handler first
+        self.assertFalse([warning for warning in caught if 'StreamingHttpResponse' in str(warning.message)])
+        self.assertEqual(messages[0]['status'], 200)
+        # Rows are read from the database after the view returned, outside of the event loop
+        content = b''.join(message.get('body', b'') for message in messages[1:]).decode()
+        self.assertEqual(len(content.splitlines()), 4)
+
+    def serve_asgi(self, receive, send):
+        async_to_sync(application)({
+            'type': 'http', 'method': 'GET', 'path': reverse('booking:export-visits'), 'query_string': b'',
+            'root_path': '', 'http_version': '1.1', 'scheme': 'http', 'server': ('testserver', 80),
+            'headers': [
+                (b'host', b'testserver'),
+                (b'cookie', f'sessionid={self.client.cookies["sessionid"].value}'.encode()),
+            ],
+        }, receive, send)
@@ -0,0 +1,93 @@
+import io
+import json
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from booking.imports import import_clients, read_rows
+from booking.models import Client
+
+CSV = '''first_name,last_name,phone_number
+Zoë,Doe,+48600000001
+Jan,Nowak,+48 600-000-002
+Bad,Phone,123
+Twin,Doe,+48600000001
+Taken,Doe,+48700000000
+,Nameless,+48600000003
+Anna,Kowalska,+48 600 000 004
+'''
+
+
+class ImportClientsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        other_user = get_user_model().objects.create_user(username='other', password='test')
+        Client.objects.create(first_name='Other', last_name='Doe', phone_number='+48700000000', user=other_user)
+
+    def test_import_csv(self):
+        # Savepoint, a duplicate check and an insert per chunk of 3 rows, nothing to insert in the second one
+        with self.assertNumQueries(2 + 2 + 1 + 2):
+            result = import_clients(self.user, read_rows(io.BytesIO(CSV.encode()), 'csv'), chunk_size=3)
+        self.assertEqual(result.created, 3)
+        self.assertEqual([line for line, errors in result.errors], [4, 5, 6, 7])
+        self.assertEqual(list(result.errors[0][1]), ['phone_number'])
+        self.assertEqual(result.errors[1][1], {'phone_number': ['Client with this Phone number already exists.']})
+        self.assertEqual(
+            set(Client.objects.filter(user=self.user).values_list('search_name', 'phone_number')),
+            {('zoe doe', '+48600000001'), ('jan nowak', '+48600000002'), ('anna kowalska', '+48600000004')}
+        )
+
+    def test_duplicates_across_chunks(self):
+        rows = [(line, {'first_name': 'A', 'last_name': 'B', 'phone_number': '+48600000001'}) for line in range(4)]
+        result = import_clients(self.user, rows, chunk_size=2)
+        self.assertEqual(result.created, 1)
+        self.assertEqual([line for line, errors in result.errors], [1, 2, 3])
+
+    def test_import_json(self):
+        lines = [
+            json.dumps({'first_name': 'Zoë', 'last_name': 'Doe', 'phone_number': '+48600000001'}),
+            '{"first_name": ',
+            json.dumps(['not', 'an', 'object']),
+            json.dumps({'first_name': 'Jan', 'last_name': 'Nowak', 'phone_number': '+48600000002'}),
+        ]
+        result = import_clients(self.user, read_rows(io.BytesIO('\n'.join(lines).encode()), 'json'))
+        self.assertEqual(result.created, 2)
+        self.assertEqual([line for line, errors in result.errors], [2, 3])
+
+        rows = [{'first_name': 'Piotr', 'last_name': 'Nowak', 'phone_number': '+48600000005'}]
+        result = import_clients(self.user, read_rows(io.BytesIO(json.dumps(rows).encode()), 'json'))
+        self.assertEqual(result.created, 1)
+
+    def test_import_view(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('booking:client-import'), {
+            'file': SimpleUploadedFile('clients.csv', CSV.encode()),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['result'].created, 3)
+        self.assertContains(response, 'Imported 3 clients, skipped 4 rows')
+
+    def test_import_view_invalid_file(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('booking:client-import'), {
+            'file': SimpleUploadedFile('clients.json', b'[{"first_name": '),
+        })
+        self.assertFormError(response, 'form', 'file', 'Invalid JSON')
+        response = self.client.post(reverse('booking:client-import'), {
+            'file': SimpleUploadedFile('clients.xlsx', b'PK'),
+        })
+        self.assertFormError(response, 'form', None, 'Select the format of the file')
+
+    def test_import_command(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as file:
+            file.write(CSV.encode())
+            file.flush()
+            output, errors = io.StringIO(), io.StringIO()
+            call_command('import_clients', 'test', file.name, stdout=output, stderr=errors)
+        self.assertIn('Imported 3 clients, skipped 4 rows', output.getvalue())
+        self.assertIn('Line 5: phone_number: Client with this Phone number already exists.', errors.getvalue())
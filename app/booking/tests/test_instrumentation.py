@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from booking import metrics, stats
+from booking.instrumentation import Measurement, sql_shape
+from booking.models import Client, Visit
+from booking.tasks import summarize_sms_remainder
+
+
+class InstrumentationTestCase(TestCase):
+
+    def setUp(self) -> None:
+        # Totals buffered by earlier tests go to the cache cleared here
+        metrics.flush()
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+        visit_client = Client.objects.create(
+            first_name='Test', last_name='Doe', phone_number='+48600000000', user=self.user
+        )
+        for hour in range(8, 20):
+            Visit.objects.create(date=datetime.date.today(), time=datetime.time(hour), client=visit_client)
+
+    def test_server_timing(self):
+        response = self.client.get(reverse('booking:index'))
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="3 queries", cache;desc="0 hits, 1 misses", total;dur=[\d.]+$'
+        )
+        response = self.client.get(reverse('booking:index'))
+        self.assertIn('desc="2 queries", cache;desc="1 hits, 0 misses"', response['Server-Timing'])
+
+    async def test_server_timing_async(self):
+        # Queries of async views run in another thread, but within the measurement of the request
+        response = await self.async_client.get(reverse('booking:index'))
+        self.assertIn('desc="3 queries", cache;desc="0 hits, 1 misses"', response['Server-Timing'])
+        response = await self.async_client.get(reverse('booking:clients'))
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    async def test_totals_async(self):
+        threads = []
+        incr = cache.incr
+
+        def incr_outside_event_loop(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                threads.append('event loop')
+            except RuntimeError:
+                threads.append('thread')
+            return incr(*args, **kwargs)
+
+        with patch.object(cache, 'incr', side_effect=incr_outside_event_loop):
+            await self.async_client.get(reverse('booking:clients'))
+        self.assertEqual(set(threads), {'thread'})
+        key = metrics.metric_key('request', 'booking:clients', 'total')
+        self.assertEqual(stats.get_counters([key]), {key: 1})
+
+    def test_metrics(self):
+        self.client.get(reverse('booking:index'))
+        self.client.get(reverse('booking:index'))
+        self.client.get(reverse('booking:clients'))
+        summarize_sms_remainder.apply(args=[[]])
+        self.assertEqual(self.client.get(reverse('booking:metrics')).status_code, 403)
+        get_user_model().objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse('booking:metrics'))
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        content = response.content.decode()
+        self.assertIn('# TYPE booking_requests_total counter\n', content)
+        self.assertIn('booking_requests_total{view="booking:index"} 2\n', content)
+        self.assertIn('booking_requests_total{view="booking:clients"} 1\n', content)
+        self.assertIn('booking_request_queries_total{view="booking:index"} 5\n', content)
+        self.assertRegex(content, r'booking_request_seconds_total\{view="booking:index"\} [\d.]+\n')
+        self.assertIn('booking_tasks_total{task="summarize_sms_remainder"} 1\n', content)
+        self.assertIn('booking_schedule_cache_hits_total 1\n', content)
+
+    def test_totals_buffered(self):
+        key = metrics.metric_key('request', 'booking:clients', 'total')
+        with override_settings(METRICS_FLUSH_INTERVAL=3600):
+            self.client.get(reverse('booking:clients'))
+            self.client.get(reverse('booking:clients'))
+        self.assertEqual(stats.get_counters([key]), {key: 0})
+        metrics.flush()
+        self.assertEqual(stats.get_counters([key]), {key: 2})
+
+    @override_settings(METRICS_FLUSH_INTERVAL=0)
+    def test_cache_down(self):
+        key = metrics.metric_key('request', 'booking:clients', 'total')
+        with patch.object(cache, 'incr', side_effect=ConnectionError('cache down')), \
+                self.assertLogs('booking.metrics', 'ERROR') as logs:
+            for _ in range(2):
+                response = self.client.get(reverse('booking:clients'))
+                self.assertEqual(response.status_code, 200)
+        # Logged once while the cache is down, the totals wait for it
+        self.assertEqual(len(logs.output), 1)
+        metrics.flush()
+        self.assertEqual(stats.get_counters([key]), {key: 2})
+
+    def test_metrics_anonymous(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('booking:metrics')).status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('booking:metrics')).status_code, 401)
+        self.assertEqual(self.client.get(reverse('booking:metrics'), HTTP_AUTHORIZATION='Bearer guess').status_code, 401)
+        response = self.client.get(reverse('booking:metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(NPLUSONE_THRESHOLD=5)
+    def test_n_plus_one(self):
+        with self.assertLogs('booking.metrics', 'WARNING') as logs:
+            response = self.client.get(reverse('booking:calendar'), {'start': datetime.date.today().isoformat()})
+            # The calendar loads clients with the visits, going through them one by one does not
+            with Measurement() as measurement:
+                for visit in Visit.objects.all():
+                    visit.client.first_name
+            self.assertEqual(len(measurement.repeated_queries()), 1)
+            self.assertEqual(measurement.repeated_queries()[0][1], 12)
+            metrics.record('request', 'test', measurement)
+        self.assertNotIn('nplusone', response['Server-Timing'])
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn('Possible N+1 in request test, query run 12 times', logs.output[0])
+
+    def test_sql_shape(self):
+        self.assertEqual(
+            sql_shape('SELECT "id" FROM "booking_visit" WHERE "id" IN (%s, %s, %s) AND "owner_id" IN (%s)'),
+            'SELECT "id" FROM "booking_visit" WHERE "id" IN (...) AND "owner_id" IN (...)'
+        )
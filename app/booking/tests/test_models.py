@@ -1,6 +1,7 @@
 from django.test import TestCase
-from booking.models import Client
+from booking.models import Client, Visit
 from django.contrib.auth import get_user_model
+import datetime
 
 
 class ModelsTestCase(TestCase):
@@ -23,3 +24,34 @@ class ModelsTestCase(TestCase):
 
         for k, v in client_data.items():
             self.assertEqual(getattr(client, k), v)
+
+
+class VisitOwnerTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.other_user = get_user_model().objects.create_user(username='other', password='test')
+        self.client_object = Client.objects.create(
+            first_name='Test', last_name='Name', phone_number='+48600000000', user=self.user
+        )
+
+    def test_owner_set_on_create(self):
+        visit = Visit.objects.create(date=datetime.date.today(), time=datetime.time(10), client=self.client_object)
+        self.assertEqual(visit.owner, self.user)
+
+    def test_owner_follows_client(self):
+        visit = Visit.objects.create(date=datetime.date.today(), time=datetime.time(10), client=self.client_object)
+        self.client_object.user = self.other_user
+        self.client_object.save()
+        visit.refresh_from_db()
+        self.assertEqual(visit.owner, self.other_user)
+
+    def test_owner_follows_changed_visit_client(self):
+        other_client = Client.objects.create(
+            first_name='Other', last_name='Name', phone_number='+48600000001', user=self.other_user
+        )
+        visit = Visit.objects.create(date=datetime.date.today(), time=datetime.time(10), client=self.client_object)
+        visit.client = other_client
+        visit.save(update_fields=['client'])
+        visit.refresh_from_db()
+        self.assertEqual(visit.owner, self.other_user)
@@ -0,0 +1,134 @@
+import datetime
+from decimal import Decimal
+from unittest.mock import Mock, patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from booking.models import OutboundSms, SmsCharge
+from booking.outbox import claim, drain, enqueue
+from booking.tasks import drain_sms_outbox
+
+
+def response(result, status_code=200):
+    return Mock(status_code=status_code, **{'json.return_value': {'result': result}})
+
+
+def gateway_with(*results):
+    """
+    Gateway answering messages with the response args paired with their number in `results`, 'OK' for the rest.
+    """
+    def send_many(token, messages):
+        return [response(*results.get(to, ('OK',))) for to, text in messages]
+
+    results = dict(results)
+    gateway = Mock()
+    gateway.authenticate.return_value = 'token'
+    gateway.send_many.side_effect = send_many
+    return gateway
+
+
+@override_settings(SMS_RETRY_BASE_DELAY=0)
+class OutboxTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.now = timezone.now()
+        self.user = get_user_model().objects.create_user(
+            username='test', password='test', sms_remainder=True, balance=Decimal('1.00')
+        )
+        self.messages = [(self.user.pk, visit_pk, f'4860000000{visit_pk}', 'Hello') for visit_pk in range(3)]
+
+    def test_enqueue(self):
+        reservations = enqueue(OutboundSms.REMINDER, self.messages, send_after=self.now)
+        self.assertEqual(reservations[self.user.pk], (3, Decimal('0.30')))
+        self.assertQuerysetEqual(
+            OutboundSms.objects.order_by('key').values_list('key', 'to', 'price', 'status'),
+            [(f'reminder:{i}', f'4860000000{i}', Decimal('0.10'), OutboundSms.PENDING) for i in range(3)],
+            transform=tuple
+        )
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('0.70'))
+
+    def test_enqueue_once_per_visit(self):
+        enqueue(OutboundSms.REMINDER, self.messages[:2])
+        reservations = enqueue(OutboundSms.REMINDER, self.messages)
+        self.assertEqual(reservations[self.user.pk], (1, Decimal('0.10')))
+        self.assertEqual(OutboundSms.objects.count(), 3)
+        # Another kind of sms for the same visit is queued
+        enqueue(OutboundSms.CANCELLATION, self.messages[:1])
+        self.assertEqual(OutboundSms.objects.count(), 4)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('0.60'))
+
+    def test_enqueue_not_enough_balance(self):
+        get_user_model().objects.filter(pk=self.user.pk).update(balance=Decimal('0.20'))
+        self.assertEqual(enqueue(OutboundSms.REMINDER, self.messages), {})
+        self.assertFalse(OutboundSms.objects.exists())
+
+    def test_drain(self):
+        enqueue(OutboundSms.REMINDER, self.messages, send_after=self.now)
+        later = [(self.user.pk, 9, '48600000009', 'Later')]
+        enqueue(OutboundSms.REMINDER, later, send_after=self.now + datetime.timedelta(hours=1))
+        gateway = gateway_with()
+        self.assertEqual(drain(gateway, now=self.now, batch_size=2), 3)
+        self.assertEqual(gateway.send_many.call_count, 2)
+        self.assertEqual(OutboundSms.objects.filter(status=OutboundSms.SENT, sent_at__isnull=False).count(), 3)
+        self.assertEqual(OutboundSms.objects.get(key='reminder:9').status, OutboundSms.PENDING)
+        self.assertEqual(drain(gateway, now=self.now), 0)
+
+    def test_drain_failed(self):
+        enqueue(OutboundSms.CANCELLATION, self.messages)
+        self.assertEqual(drain(gateway_with(('48600000001', ('invalid number', 400)))), 2)
+        failed = OutboundSms.objects.get(status=OutboundSms.FAILED)
+        self.assertEqual((failed.to, failed.error, failed.attempts), ('48600000001', 'HTTP 400: invalid number', 1))
+        # The failed sms is refunded
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('0.80'))
+        self.assertEqual(
+            list(SmsCharge.objects.order_by('pk').values_list('kind', 'amount')),
+            [(SmsCharge.RESERVATION, Decimal('-0.30')), (SmsCharge.REFUND, Decimal('0.10'))]
+        )
+
+    def test_drain_query_count(self):
+        enqueue(OutboundSms.CANCELLATION, self.messages)
+        with self.assertNumQueries(16):
+            # Claim (lock and update), messages, sent, failed, refund (balance and ledger) and a last
+            # empty claim, plus savepoints and releases
+            drain(gateway_with(('48600000001', ('invalid number', 400))))
+
+    def test_claim(self):
+        enqueue(OutboundSms.REMINDER, self.messages, send_after=self.now)
+        self.assertEqual(len(claim(self.now, 2)), 2)
+        # Claimed messages are left to their worker until the claim expires
+        self.assertEqual(len(claim(self.now, 2)), 1)
+        self.assertEqual(claim(self.now, 2), [])
+        OutboundSms.objects.update(claimed_at=timezone.now() - datetime.timedelta(minutes=2))
+        with override_settings(SMS_OUTBOX_CLAIM_TIMEOUT=60):
+            self.assertEqual(len(claim(self.now, 5)), 3)
+
+    def test_overlapping_drains(self):
+        enqueue(OutboundSms.REMINDER, self.messages, send_after=self.now)
+        gateway = gateway_with()
+        overlapping = []
+
+        def send_many(token, messages):
+            # A drain started much later while the first one is still sending leaves its batch alone
+            if gateway.send_many.call_count == 1:
+                overlapping.append(drain(gateway, now=self.now + datetime.timedelta(minutes=20)))
+            return [response('OK') for _ in messages]
+
+        gateway.send_many.side_effect = send_many
+        with override_settings(SMS_OUTBOX_CLAIM_TIMEOUT=600):
+            self.assertEqual(drain(gateway, now=self.now, batch_size=2), 2)
+        # The later drain only took the message nobody had claimed, every message went out once
+        self.assertEqual(overlapping, [1])
+        self.assertEqual(sum(len(call.args[1]) for call in gateway.send_many.call_args_list), 3)
+
+    @patch('booking.tasks.get_gateway')
+    def test_task(self, mock_gateway):
+        mock_gateway.return_value = gateway_with()
+        enqueue(OutboundSms.REMINDER, self.messages)
+        self.assertEqual(drain_sms_outbox.apply().get(), {'sent': 3})
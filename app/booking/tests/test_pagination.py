@@ -0,0 +1,112 @@
+# Tests of the pagination module
+
+from django.http import Http404
+from django.test import TestCase
+from django.urls import reverse
+from booking.models import Client
+from booking.pagination import KeysetPaginator, apaginate
+from django.core.paginator import Paginator
+from django.contrib.auth import get_user_model
+
+
+class KeysetPaginatorTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        # Duplicate first and last names, the pk keeps the order stable
+        self.clients = [
+            Client.objects.create(
+                first_name=f'Name{i // 4}', last_name=f'Last{i % 2}', phone_number=f'+4860000{i:04d}', user=self.user
+            )
+            for i in range(12)
+        ]
+        self.ordering = ['-first_name', '-last_name', '-pk']
+        self.expected = list(Client.objects.filter(user=self.user).order_by(*self.ordering))
+        self.paginator = KeysetPaginator(Client.objects.filter(user=self.user), 5, self.ordering)
+
+    def test_walk_forward_and_back(self):
+        first = self.paginator.page()
+        self.assertEqual(list(first), self.expected[:5])
+        self.assertFalse(first.has_previous())
+        second = self.paginator.page(first.next_cursor)
+        self.assertEqual(list(second), self.expected[5:10])
+        third = self.paginator.page(second.next_cursor)
+        self.assertEqual(list(third), self.expected[10:])
+        self.assertFalse(third.has_next())
+        back = self.paginator.page(third.previous_cursor)
+        self.assertEqual(list(back), self.expected[5:10])
+        self.assertTrue(back.has_next())
+        back = self.paginator.page(back.previous_cursor)
+        self.assertEqual(list(back), self.expected[:5])
+        self.assertFalse(back.has_previous())
+
+    def test_page_query_count(self):
+        cursor = self.paginator.page().next_cursor
+        # No count query, just the page
+        with self.assertNumQueries(1):
+            list(self.paginator.page(cursor))
+
+    async def test_apage(self):
+        first = await self.paginator.apage()
+        self.assertEqual(list(first), self.expected[:5])
+        second = await self.paginator.apage(first.next_cursor)
+        self.assertEqual(list(second), self.expected[5:10])
+        self.assertTrue(second.has_previous())
+        back = await self.paginator.apage(second.previous_cursor)
+        self.assertEqual(list(back), self.expected[:5])
+
+    async def test_apaginate(self):
+        paginator = Paginator(Client.objects.filter(user=self.user).order_by(*self.ordering), 5)
+        page = await apaginate(paginator, 2)
+        self.assertEqual(list(page), self.expected[5:10])
+        self.assertEqual(paginator.count, 12)
+        page = await apaginate(paginator, 'last')
+        self.assertEqual(page.number, 3)
+        self.assertEqual(list(page), self.expected[10:])
+        with self.assertRaises(Http404):
+            await apaginate(paginator, 4)
+        with self.assertRaises(Http404):
+            await apaginate(paginator, 'first')
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.paginator.page('not-a-cursor')
+        with self.assertRaises(Http404):
+            self.paginator.page(self.paginator.encode_cursor(['Name1'], False))
+        for values in (['a', 'b', 'x'], ['a', 'b', None], ['a', 'b', [1]]):
+            with self.assertRaises(Http404):
+                self.paginator.page(self.paginator.encode_cursor(values, False))
+
+
+class ClientsViewCursorModeTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.client.force_login(user=self.user)
+        for i in range(25):
+            Client.objects.create(first_name='Same', last_name='Name', phone_number=f'+4860000{i:04d}', user=self.user)
+
+    def test_cursor_mode(self):
+        response = self.client.get(reverse('booking:clients'), {'mode': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['clients']), 20)
+        self.assertTrue(response.context['is_paginated'])
+        next_cursor = response.context['page_obj'].next_cursor
+        self.assertContains(response, next_cursor)
+
+        with self.assertNumQueries(3):
+            # Session, user and the page
+            response = self.client.get(reverse('booking:clients'), {'mode': 'cursor', 'cursor': next_cursor})
+        self.assertEqual(len(response.context['clients']), 5)
+        self.assertFalse(response.context['page_obj'].has_next())
+
+    def test_cursor_with_wrong_types(self):
+        cursor = KeysetPaginator(Client.objects.all(), 1, ['pk']).encode_cursor(['a', 'b', 'x'], False)
+        response = self.client.get(reverse('booking:clients'), {'mode': 'cursor', 'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_number_mode(self):
+        response = self.client.get(reverse('booking:clients'), {'page': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['clients']), 5)
+        self.assertEqual(response.context['paginator'].count, 25)
@@ -0,0 +1,63 @@
+# Tests of the planner module
+
+from django.test import TestCase
+from booking.models import Visit, Client
+from booking.planner import plan_reminders, UserReminders
+from django.contrib.auth import get_user_model
+from decimal import Decimal
+import datetime
+
+
+class PlanRemindersTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        self.users = [
+            get_user_model().objects.create_user(
+                username=f'test{i}',
+                password='test',
+                sms_remainder=True,
+                balance=Decimal('10.00'),
+                business_name=f'Business {i}'
+            )
+            for i in range(3)
+        ]
+        for i, user in enumerate(self.users):
+            for j in range(4):
+                client = Client.objects.create(
+                    first_name='Test', last_name='Doe', phone_number=f'+48123456{i}{j}0', user=user
+                )
+                Visit.objects.create(date=self.tomorrow, time=datetime.time(10 + j), client=client)
+                Visit.objects.create(date=datetime.date.today(), time=datetime.time(10 + j), client=client)
+
+    def test_plan_reminders_query_count(self):
+        with self.assertNumQueries(2):
+            plans = plan_reminders(self.tomorrow)
+        self.assertEqual([plan.user_pk for plan in plans], [user.pk for user in self.users])
+        self.assertEqual([len(plan.visits) for plan in plans], [4, 4, 4])
+
+    def test_plan_reminders_values(self):
+        user = self.users[0]
+        plans = plan_reminders(self.tomorrow, user_pks=[user.pk])
+        self.assertEqual(len(plans), 1)
+        self.assertIsInstance(plans[0], UserReminders)
+        self.assertEqual(
+            plans[0][:4],
+            (user.pk, 'Business 0', Decimal('0.10'), Decimal('10.00'))
+        )
+        first_visit = Visit.objects.filter(date=self.tomorrow, client__user=user).order_by('time').first()
+        self.assertEqual(plans[0].visits[0], (first_visit.pk, datetime.time(10), '48123456000'))
+
+    def test_plan_reminders_skips_ineligible(self):
+        self.users[0].sms_remainder = False
+        self.users[0].save()
+        self.users[1].balance = 0
+        self.users[1].save()
+        Client.objects.filter(user=self.users[2], phone_number='+48123456200').update(phone_number='')
+        plans = plan_reminders(self.tomorrow)
+        self.assertEqual([plan.user_pk for plan in plans], [self.users[2].pk])
+        self.assertEqual(len(plans[0].visits), 3)
+
+    def test_plan_reminders_no_visits(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(plan_reminders(self.tomorrow + datetime.timedelta(days=1)), [])
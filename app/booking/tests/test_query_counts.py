@@ -0,0 +1,137 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from booking.models import Client, Visit
+
+
+class ViewQueryCountTestCase(TestCase):
+    """
+    Exact number of queries of each view. Every request starts with loading the session and the user.
+    """
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.client.force_login(self.user)
+        self.clients = [
+            Client.objects.create(first_name='Test', last_name=f'Doe{i}', phone_number=f'+4860000000{i}', user=self.user)
+            for i in range(5)
+        ]
+        self.today = datetime.date.today()
+        self.visits = [
+            Visit.objects.create(date=self.today, time=datetime.time(8 + i), client=client)
+            for i, client in enumerate(self.clients)
+        ]
+        other_user = get_user_model().objects.create_user(username='other', password='test')
+        self.other_client = Client.objects.create(
+            first_name='Other', last_name='Doe', phone_number='+48700000000', user=other_user
+        )
+        self.other_visit = Visit.objects.create(date=self.today, time=datetime.time(10), client=self.other_client)
+
+    def visit_data(self, **data):
+        return {'date': self.today, 'time': datetime.time(18), 'client': self.clients[0].pk, 'notes': '', **data}
+
+    def test_index(self):
+        with self.assertNumQueries(3):  # visits of the day with their clients
+            self.client.get(reverse('booking:index'))
+        with self.assertNumQueries(2):  # cached
+            self.client.get(reverse('booking:index'))
+
+    def test_calendar(self):
+        with self.assertNumQueries(3):  # visits of the week with their clients
+            self.client.get(reverse('booking:calendar'))
+
+    def test_create_visit(self):
+        with self.assertNumQueries(3):  # client choices
+            self.client.get(reverse('booking:visit-create'))
+        # client, overlap check, client validation, savepoint, insert, release
+        with self.assertNumQueries(8):
+            response = self.client.post(reverse('booking:visit-create'), self.visit_data())
+        self.assertEqual(response.status_code, 302)
+
+    def test_create_visit_for_other_user_client(self):
+        with self.assertNumQueries(4):  # client lookup among the user's clients, client choices
+            response = self.client.post(reverse('booking:visit-create'), self.visit_data(client=self.other_client.pk))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Visit.objects.filter(time=datetime.time(18)).exists())
+
+    def test_update_visit(self):
+        url = reverse('booking:visit-edit', args=[self.visits[0].pk])
+        with self.assertNumQueries(4):  # visit, client choices
+            self.client.get(url)
+        # visit, client, overlap check, client validation, savepoint, update, release
+        with self.assertNumQueries(9):
+            response = self.client.post(url, self.visit_data())
+        self.assertEqual(response.status_code, 302)
+
+    def test_delete_visit(self):
+        url = reverse('booking:visit-delete', args=[self.visits[0].pk])
+        with self.assertNumQueries(3):  # visit with its client
+            self.client.get(url)
+        with self.assertNumQueries(5):  # visit with its client, delete its reminder job, delete
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_other_user_visit(self):
+        for name in ('booking:visit-edit', 'booking:visit-delete'):
+            with self.assertNumQueries(4):  # visit among the user's, visit among all
+                response = self.client.get(reverse(name, args=[self.other_visit.pk]))
+            self.assertEqual(response.status_code, 403)
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse(name, args=[self.other_visit.pk + 100]))
+            self.assertEqual(response.status_code, 404)
+
+    def test_clients(self):
+        with self.assertNumQueries(4):  # count, page
+            self.client.get(reverse('booking:clients'))
+        with self.assertNumQueries(3):  # page
+            self.client.get(reverse('booking:clients'), {'mode': 'cursor'})
+
+    def test_create_client(self):
+        # phone number uniqueness, insert
+        with self.assertNumQueries(4):
+            response = self.client.post(reverse('booking:client-create'), {
+                'first_name': 'New', 'last_name': 'Client', 'phone_number': '+48600000099'
+            })
+        self.assertEqual(response.status_code, 302)
+
+    def test_update_client(self):
+        url = reverse('booking:client-edit', args=[self.clients[0].pk])
+        with self.assertNumQueries(3):  # client
+            self.client.get(url)
+        # client, phone number uniqueness, update, dates of visits, owner of visits
+        with self.assertNumQueries(7):
+            response = self.client.post(url, {'first_name': 'New', 'last_name': 'Name', 'phone_number': '+48600000099'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_delete_client(self):
+        url = reverse('booking:client-delete', args=[self.clients[0].pk])
+        with self.assertNumQueries(3):  # client
+            self.client.get(url)
+        # client, days of its visits, delete reminder jobs, delete visits, the cascade deleting no visits,
+        # delete client
+        with self.assertNumQueries(8):
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 302)
+
+    def test_other_user_client(self):
+        for name in ('booking:client-edit', 'booking:client-delete'):
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse(name, args=[self.other_client.pk]))
+            self.assertEqual(response.status_code, 403)
+
+    def test_cancel_visits(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('booking:cancel-visits'))
+        # savepoint, days of the visits, delete reminder jobs, delete visits, release
+        with self.assertNumQueries(7):
+            self.client.post(reverse('booking:cancel-visits'), {'from_date': self.today, 'to_date': self.today})
+        self.assertEqual(Visit.objects.filter(owner=self.user).count(), 0)
+
+    def test_account(self):
+        with self.assertNumQueries(2):
+            self.client.get(reverse('booking:account'))
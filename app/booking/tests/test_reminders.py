@@ -0,0 +1,191 @@
+import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from booking.cancellation import cancel_visits
+from booking.models import Client, OutboundSms, ReminderJob, Visit
+from booking.reminders import claim, dispatch_reminders, queue_claimed, reminder_send_at, schedule_reminders
+from booking.tasks import dispatch_reminder_jobs
+
+
+def local(date, hour, minute=0):
+    return timezone.make_aware(datetime.datetime.combine(date, datetime.time(hour, minute)))
+
+
+@override_settings(
+    REMINDER_LEAD_HOURS=24, REMINDER_WINDOW_START='08:00', REMINDER_WINDOW_END='20:00', REMINDER_SPREAD_MINUTES=0,
+)
+class ReminderTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.today = datetime.date(2022, 3, 14)
+        self.tomorrow = self.today + datetime.timedelta(days=1)
+        self.now = local(self.today, 9)
+        self.user = get_user_model().objects.create_user(
+            username='test', password='test', sms_remainder=True, balance=Decimal('10.00'), business_name='Salon'
+        )
+        self.visit_client = Client.objects.create(
+            first_name='Test', last_name='Doe', phone_number='+48600000000', user=self.user
+        )
+        self.visits = [
+            Visit.objects.create(date=self.tomorrow, time=datetime.time(hour), client=self.visit_client)
+            for hour in (8, 12, 16)
+        ]
+
+    def test_send_at(self):
+        self.assertEqual(reminder_send_at(1, self.tomorrow, datetime.time(12)), local(self.today, 12))
+        # Too late in the evening and too early in the morning move to the end of the window before
+        self.assertEqual(reminder_send_at(1, self.tomorrow, datetime.time(21, 30)), local(self.today, 20))
+        self.assertEqual(
+            reminder_send_at(1, self.tomorrow, datetime.time(7)),
+            local(self.today - datetime.timedelta(days=1), 20)
+        )
+        with override_settings(REMINDER_SPREAD_MINUTES=30):
+            self.assertEqual(reminder_send_at(60, self.tomorrow, datetime.time(12)), local(self.today, 11, 59))
+
+    def test_schedule(self):
+        other_user = get_user_model().objects.create_user(username='other', password='test', sms_remainder=False)
+        other_client = Client.objects.create(first_name='A', last_name='B', phone_number='+48600000001', user=other_user)
+        Visit.objects.create(date=self.tomorrow, time=datetime.time(9), client=other_client)
+        no_phone = Client.objects.create(first_name='No', last_name='Phone', user=self.user)
+        Visit.objects.create(date=self.tomorrow, time=datetime.time(9), client=no_phone)
+        # Already started
+        Visit.objects.create(date=self.today, time=datetime.time(8), client=self.visit_client)
+
+        self.assertEqual(schedule_reminders(self.now), 3)
+        self.assertQuerysetEqual(
+            ReminderJob.objects.order_by('send_at').values_list('visit', 'send_at'),
+            [(visit.pk, reminder_send_at(visit.pk, visit.date, visit.time)) for visit in self.visits],
+            transform=tuple
+        )
+        self.assertEqual(schedule_reminders(self.now), 0)
+
+    def test_dispatch(self):
+        schedule_reminders(self.now)
+        # The 8:00 reminder is due at 8:00 today, the others later
+        self.assertEqual(dispatch_reminders(now=self.now), 1)
+        self.assertQuerysetEqual(
+            OutboundSms.objects.values_list('key', 'to', 'text', 'send_after'),
+            [(f'reminder:{self.visits[0].pk}@2022-03-15T08:00', '48600000000',
+              'Hello! \nWe would like to remind you about the visit on 08:00, 15.3 in the Salon', self.now)],
+            transform=tuple
+        )
+        self.assertEqual(ReminderJob.objects.get(visit=self.visits[0]).status, ReminderJob.DONE)
+        self.assertEqual(ReminderJob.objects.filter(status=ReminderJob.PENDING).count(), 2)
+
+        self.assertEqual(dispatch_reminders(now=local(self.today, 18), batch_size=1), 2)
+        self.assertEqual(ReminderJob.objects.filter(status=ReminderJob.DONE).count(), 3)
+        self.assertEqual(OutboundSms.objects.filter(kind=OutboundSms.REMINDER).count(), 3)
+        # Funds are held until the outbox sends the sms
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('9.70'))
+        self.assertEqual(dispatch_reminders(now=local(self.today, 18)), 0)
+
+    def test_dispatch_query_count(self):
+        schedule_reminders(self.now)
+        with self.assertNumQueries(20):
+            # Claim (lock and update), visits, reservation (lock, debit and ledger), queued keys, outbox rows,
+            # job results and a last empty claim, plus savepoints and releases
+            dispatch_reminders(now=local(self.today, 18))
+
+    def test_queued_once(self):
+        schedule_reminders(self.now)
+        now = local(self.today, 18)
+        pks = claim(now, 5)
+        # A worker taking over an expired claim queues the reminders again
+        queue_claimed(pks, now)
+        queue_claimed(pks, now)
+        self.assertEqual(OutboundSms.objects.count(), 3)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal('9.70'))
+
+    def test_moved_visit(self):
+        schedule_reminders(self.now)
+        visit = self.visits[1]
+        visit.time = datetime.time(13)
+        visit.save()
+        self.assertEqual(dispatch_reminders(now=local(self.today, 12)), 1)
+        # Dropped and planned again for the new time
+        self.assertFalse(ReminderJob.objects.filter(visit=visit).exists())
+        schedule_reminders(local(self.today, 12))
+        self.assertEqual(ReminderJob.objects.get(visit=visit).send_at, local(self.today, 13))
+
+    def test_moved_after_reminder(self):
+        schedule_reminders(self.now)
+        dispatch_reminders(now=local(self.today, 18))
+        visit = self.visits[1]
+        visit.date += datetime.timedelta(days=7)
+        visit.save()
+        # Planned again once the new date comes close, and reminded about the new date
+        self.assertEqual(schedule_reminders(self.now), 0)
+        week_later = local(self.today + datetime.timedelta(days=7), 9)
+        self.assertEqual(schedule_reminders(week_later), 1)
+        self.assertEqual(dispatch_reminders(now=local(self.today + datetime.timedelta(days=7), 18)), 1)
+        self.assertEqual(
+            sorted(OutboundSms.objects.filter(key__startswith=f'reminder:{visit.pk}@').values_list('key', flat=True)),
+            [f'reminder:{visit.pk}@2022-03-15T12:00', f'reminder:{visit.pk}@2022-03-22T12:00']
+        )
+
+    def test_skipped(self):
+        schedule_reminders(self.now)
+        get_user_model().objects.filter(pk=self.user.pk).update(sms_remainder=False)
+        self.assertEqual(dispatch_reminders(now=local(self.today, 18)), 0)
+        self.assertFalse(OutboundSms.objects.exists())
+        self.assertEqual(ReminderJob.objects.filter(status=ReminderJob.SKIPPED).count(), 3)
+
+    def test_not_enough_balance(self):
+        schedule_reminders(self.now)
+        get_user_model().objects.filter(pk=self.user.pk).update(balance=Decimal('0.20'))
+        self.assertEqual(dispatch_reminders(now=local(self.today, 18)), 0)
+        self.assertFalse(OutboundSms.objects.exists())
+        self.assertEqual(ReminderJob.objects.filter(status=ReminderJob.SKIPPED).count(), 3)
+
+    def test_claim(self):
+        schedule_reminders(self.now)
+        now = local(self.today, 18)
+        first = claim(now, 2)
+        self.assertEqual(len(first), 2)
+        # Claimed jobs are left to their worker until the claim expires
+        self.assertEqual(len(claim(now, 2)), 1)
+        self.assertEqual(claim(now, 2), [])
+        # Claims are stamped with the time they were made, not with the `now` of the dispatch
+        self.assertEqual(claim(now + datetime.timedelta(hours=1), 5), [])
+        ReminderJob.objects.update(claimed_at=timezone.now() - datetime.timedelta(minutes=2))
+        with override_settings(REMINDER_CLAIM_TIMEOUT=60):
+            self.assertEqual(len(claim(now, 5)), 3)
+
+    def test_cancel_visits_with_jobs(self):
+        schedule_reminders(self.now)
+        self.assertEqual(cancel_visits(self.user, self.tomorrow, self.tomorrow), 3)
+        self.assertFalse(ReminderJob.objects.exists())
+
+    def test_deleted_with_visits(self):
+        other_client = Client.objects.create(
+            first_name='Other', last_name='Doe', phone_number='+48600000001', user=self.user
+        )
+        Visit.objects.create(date=self.tomorrow, time=datetime.time(10), client=other_client)
+        schedule_reminders(self.now)
+        self.visits[0].delete()
+        self.assertEqual(ReminderJob.objects.count(), 3)
+        Visit.objects.filter(pk=self.visits[1].pk).delete()
+        self.assertEqual(ReminderJob.objects.count(), 2)
+        other_client.delete()
+        self.assertEqual(ReminderJob.objects.count(), 1)
+        deleted, per_model = Client.objects.filter(pk=self.visit_client.pk).delete()
+        self.assertEqual(per_model, {Client._meta.label: 1, Visit._meta.label: 1, ReminderJob._meta.label: 1})
+        self.assertFalse(ReminderJob.objects.exists())
+
+    @patch('booking.tasks.drain_sms_outbox.delay')
+    def test_task(self, mock_delay):
+        schedule_reminders(self.now)
+        ReminderJob.objects.update(send_at=timezone.now() - datetime.timedelta(minutes=1))
+        Visit.objects.update(date=timezone.localdate() + datetime.timedelta(days=1))
+        ReminderJob.objects.update(visit_date=timezone.localdate() + datetime.timedelta(days=1))
+        self.assertEqual(dispatch_reminder_jobs.apply().get(), {'queued': 3})
+        mock_delay.assert_called_once_with()
@@ -0,0 +1,103 @@
+# Tests of the schedule module
+
+from unittest.mock import patch
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from booking.cancellation import cancel_visits
+from booking.models import Visit, Client
+from booking.schedule import aget_schedule, get_schedule, schedule_queryset, COUNTERS
+from booking import stats
+from django.contrib.auth import get_user_model
+import datetime
+
+
+class ScheduleCacheTestCase(TestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.today = datetime.date.today()
+        self.tomorrow = self.today + datetime.timedelta(days=1)
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.visit_client = Client.objects.create(
+            first_name='Test', last_name='Client', phone_number='+48600000000', user=self.user
+        )
+        self.visit = Visit.objects.create(date=self.today, time=datetime.time(10), client=self.visit_client)
+
+    def test_hit_and_miss(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(get_schedule(self.user, self.today), [self.visit])
+        with self.assertNumQueries(0):
+            visits = get_schedule(self.user, self.today)
+            self.assertEqual(visits[0].client.first_name, 'Test')
+        self.assertEqual(stats.get_counters(COUNTERS), {'schedule_cache_hits': 1, 'schedule_cache_misses': 1})
+
+    def test_async_shares_cache(self):
+        self.assertEqual(async_to_sync(aget_schedule)(self.user, self.today), [self.visit])
+        with self.assertNumQueries(0):
+            self.assertEqual(get_schedule(self.user, self.today), [self.visit])
+            visits = async_to_sync(aget_schedule)(self.user, self.today)
+        self.assertEqual(visits[0].client.first_name, 'Test')
+        self.assertEqual(stats.get_counters(COUNTERS), {'schedule_cache_hits': 2, 'schedule_cache_misses': 1})
+
+    def test_invalidated_on_create(self):
+        get_schedule(self.user, self.today)
+        visit = Visit.objects.create(date=self.today, time=datetime.time(9), client=self.visit_client)
+        self.assertEqual(get_schedule(self.user, self.today), [visit, self.visit])
+
+    def test_invalidated_on_move(self):
+        get_schedule(self.user, self.today)
+        get_schedule(self.user, self.tomorrow)
+        visit = Visit.objects.get(pk=self.visit.pk)
+        visit.date = self.tomorrow
+        visit.save()
+        self.assertEqual(get_schedule(self.user, self.today), [])
+        self.assertEqual(get_schedule(self.user, self.tomorrow), [self.visit])
+
+    def test_fill_after_change(self):
+        # A visit saved while a miss is reading the day doesn't leave the stale read cached
+        def save_visit(user, date):
+            visits = list(schedule_queryset(user, date))
+            Visit.objects.create(date=self.today, time=datetime.time(9), client=self.visit_client)
+            return visits
+
+        with patch('booking.schedule.schedule_queryset', save_visit):
+            self.assertEqual(get_schedule(self.user, self.today), [self.visit])
+        self.assertEqual(len(get_schedule(self.user, self.today)), 2)
+
+    def test_invalidated_on_delete(self):
+        get_schedule(self.user, self.today)
+        self.visit.delete()
+        self.assertEqual(get_schedule(self.user, self.today), [])
+
+    def test_invalidated_on_client_rename(self):
+        get_schedule(self.user, self.today)
+        self.visit_client.first_name = 'Renamed'
+        self.visit_client.save()
+        self.assertEqual(get_schedule(self.user, self.today)[0].client.first_name, 'Renamed')
+
+    def test_invalidated_on_client_delete(self):
+        get_schedule(self.user, self.today)
+        self.visit_client.delete()
+        self.assertEqual(get_schedule(self.user, self.today), [])
+
+    @patch('booking.cancellation.drain_sms_outbox.delay')
+    def test_invalidated_on_cancellation(self, mock_delay):
+        get_schedule(self.user, self.today)
+        cancel_visits(self.user, self.today, self.tomorrow)
+        self.assertEqual(get_schedule(self.user, self.today), [])
+
+    def test_index_view_queries(self):
+        for hour in range(11, 16):
+            client = Client.objects.create(
+                first_name='Test', last_name='Client', phone_number=f'+486000000{hour}', user=self.user
+            )
+            Visit.objects.create(date=self.today, time=datetime.time(hour), client=client)
+        self.client.force_login(self.user)
+        # Session and user, plus one query for the whole schedule on a miss
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('booking:index'))
+        self.assertEqual(len(response.context['object_list']), 6)
+        with self.assertNumQueries(2):
+            self.client.get(reverse('booking:index'))
@@ -0,0 +1,63 @@
+# Tests of the search module
+
+from django.test import TestCase
+from booking.models import Client
+from booking.search import normalize, parse_query, search_clients
+from django.contrib.auth import get_user_model
+
+
+class NormalizeTestCase(TestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize('Łukasz Wiśniewski'), 'lukasz wisniewski')
+        self.assertEqual(normalize('ŻANETA Gęś'), 'zaneta ges')
+
+    def test_parse_query(self):
+        self.assertEqual(parse_query('Anna Maria Nowak'), (['anna', 'maria', 'nowak'], ''))
+        self.assertEqual(parse_query('+48 600-100 200'), ([], '48600100200'))
+        self.assertEqual(parse_query('Nowak (600) 100'), (['nowak'], '600100'))
+        self.assertEqual(parse_query('  '), ([], ''))
+
+
+class SearchClientsTestCase(TestCase):
+
+    def setUp(self) -> None:
+        self.user = get_user_model().objects.create_user(username='test', password='test')
+        self.anna = Client.objects.create(
+            first_name='Anna Maria', last_name='Wiśniewska', phone_number='+48600100200', user=self.user
+        )
+        self.lukasz = Client.objects.create(
+            first_name='Łukasz', last_name='Nowak', phone_number='+48600100300', user=self.user
+        )
+        self.queryset = Client.objects.filter(user=self.user).order_by('pk')
+
+    def test_search_name_kept_in_sync(self):
+        self.assertEqual(self.anna.search_name, 'anna maria wisniewska')
+        self.lukasz.last_name = 'Kowalski'
+        self.lukasz.save(update_fields=['last_name'])
+        self.lukasz.refresh_from_db()
+        self.assertEqual(self.lukasz.search_name, 'lukasz kowalski')
+
+    def test_search_name_longer_than_name(self):
+        client = Client.objects.create(
+            first_name='ß' * 20, last_name='ﬀ' * 20, phone_number='+48600100400', user=self.user
+        )
+        client.refresh_from_db()
+        self.assertEqual(client.search_name, f'{"ss" * 20} {"ff" * 20}')
+
+    def test_accent_insensitive(self):
+        self.assertQuerysetEqual(search_clients(self.queryset, 'wisniewska'), [self.anna])
+        self.assertQuerysetEqual(search_clients(self.queryset, 'LUKASZ'), [self.lukasz])
+
+    def test_any_word_count(self):
+        self.assertQuerysetEqual(search_clients(self.queryset, 'Wiśniewska Maria Anna'), [self.anna])
+        self.assertQuerysetEqual(search_clients(self.queryset, 'Anna Nowak'), [])
+
+    def test_phone_digits(self):
+        self.assertQuerysetEqual(search_clients(self.queryset, '600 100'), [self.anna, self.lukasz])
+        self.assertQuerysetEqual(search_clients(self.queryset, '600-100-300'), [self.lukasz])
+        self.assertQuerysetEqual(search_clients(self.queryset, 'Anna 600100'), [self.anna])
+
+    def test_empty_query(self):
+        self.assertQuerysetEqual(search_clients(self.queryset, ''), [self.anna, self.lukasz])
+        self.assertQuerysetEqual(search_clients(self.queryset, None), [self.anna, self.lukasz])
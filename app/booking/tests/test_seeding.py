@@ -0,0 +1,93 @@
+import datetime
+from io import StringIO
+from unittest import skipIf, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase
+from phonenumber_field.phonenumber import PhoneNumber
+
+from booking.models import Client, Visit
+from booking.seeding import seed_tenant
+
+
+def snapshot(prefix):
+    """
+    Seeded data of users with usernames starting with `prefix`, without database ids.
+    """
+    users = get_user_model().objects.filter(username__startswith=prefix)
+    clients = Client.objects.filter(user__in=users).order_by('phone_number').values_list(
+        'user__username', 'first_name', 'last_name', 'phone_number'
+    )
+    visits = Visit.objects.filter(owner__in=users).order_by('owner__username', 'date', 'time').values_list(
+        'owner__username', 'date', 'time', 'end_time', 'client__phone_number'
+    )
+    return list(clients), list(visits)
+
+
+class SeedBookingTestCase(TestCase):
+
+    def seed(self, *args):
+        call_command(
+            'seed_booking', '--tenants=3', '--clients=4', '--visits=5', '--days=2', '--start-date=2022-01-10',
+            '--processes=1', *args, stdout=StringIO()
+        )
+
+    def test_seed(self):
+        self.seed()
+        users = get_user_model().objects.filter(username__startswith='seed-0-')
+        self.assertEqual(users.count(), 3)
+        self.assertEqual(Client.objects.filter(user__in=users).count(), 12)
+        visits = Visit.objects.filter(owner__in=users)
+        self.assertEqual(visits.count(), 60)
+        self.assertEqual(visits.exclude(date__in=[datetime.date(2022, 1, 10), datetime.date(2022, 1, 11)]).count(), 0)
+        for client in Client.objects.filter(user__in=users):
+            self.assertTrue(PhoneNumber.from_string(str(client.phone_number)).is_valid())
+        for visit in visits.select_related('client'):
+            self.assertEqual(visit.client.user_id, visit.owner_id)
+            self.assertFalse(Visit.objects.overlapping(visit.owner_id, visit.date, visit.time, visit.end_time)
+                             .exclude(pk=visit.pk).exists())
+
+    def test_reproducible(self):
+        self.seed()
+        first = snapshot('seed-0-')
+        get_user_model().objects.filter(username__startswith='seed-0-').delete()
+        # Tenants don't depend on each other, seeding them in another order gives the same data
+        for tenant in [2, 0, 1]:
+            seed_tenant(tenant, 4, 5, start_date=datetime.date(2022, 1, 10), days=2)
+        self.assertEqual(snapshot('seed-0-'), first)
+
+    def test_seed_changes_data(self):
+        self.seed()
+        self.seed('--seed=1', '--first-tenant=3')
+        first_clients, first_visits = snapshot('seed-0-')
+        other_clients, other_visits = snapshot('seed-1-')
+        self.assertNotEqual([visit[1:4] for visit in first_visits], [visit[1:4] for visit in other_visits])
+
+    def test_overlapping_tenants(self):
+        self.seed()
+        # Phone numbers only depend on the tenant, another seed or prefix doesn't make them unique
+        with self.assertRaisesMessage(CommandError, 'Phone numbers of tenants 2-4 are already used'):
+            self.seed('--seed=1', '--prefix=other', '--first-tenant=2')
+        self.assertFalse(get_user_model().objects.filter(username__startswith='other-').exists())
+        self.seed('--seed=1', '--prefix=other', '--first-tenant=3')
+        self.assertEqual(get_user_model().objects.filter(username__startswith='other-').count(), 3)
+
+    def test_too_many_visits(self):
+        with self.assertRaisesMessage(CommandError, "20 visits per tenant don't fit in 0 days"):
+            call_command('seed_booking', '--clients=4', '--visits=5', '--days=0', stdout=StringIO())
+
+    @skipUnless(connection.vendor == 'postgresql', 'COPY is PostgreSQL only')
+    def test_copy(self):
+        self.seed('--copy')
+        copied = snapshot('seed-0-')
+        get_user_model().objects.filter(username__startswith='seed-0-').delete()
+        self.seed()
+        self.assertEqual(snapshot('seed-0-'), copied)
+
+    @skipIf(connection.vendor == 'postgresql', 'COPY is available')
+    def test_copy_needs_postgresql(self):
+        with self.assertRaisesMessage(CommandError, '--copy needs PostgreSQL'):
+            call_command('seed_booking', '--copy', '--processes=1', stdout=StringIO())
@@ -0,0 +1,99 @@
+# Tests of the SMS api client
+
+import time
+from unittest.mock import Mock, patch
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase
+from booking.sms import SmsGateway, SmsTokenManager
+from booking.sms_stub import StubSmsGateway
+
+
+class SmsGatewayTestCase(SimpleTestCase):
+
+    def setUp(self) -> None:
+        self.stub = StubSmsGateway(latency=0.01).start()
+        self.addCleanup(self.stub.stop)
+        self.gateway = SmsGateway(base_url=self.stub.url, sender='Test', concurrency=4, timeout=5)
+        self.addCleanup(self.gateway.close)
+
+    def test_authenticate(self):
+        self.assertEqual(self.gateway.authenticate('user', 'password'), 'stub-token')
+        self.assertEqual(self.stub.logins, 1)
+
+    def test_send(self):
+        response = self.gateway.send('stub-token', '48123456789', 'Hello')
+        self.assertEqual(response.json(), {'result': 'OK'})
+        self.assertEqual(self.stub.messages, [{'from': 'Test', 'to': '48123456789', 'text': 'Hello'}])
+
+    def test_send_with_wrong_token(self):
+        response = self.gateway.send('expired', '48123456789', 'Hello')
+        self.assertEqual(response.json(), {'result': 'error'})
+        self.assertEqual(self.stub.messages, [])
+
+    def test_send_many(self):
+        messages = [(f'4812345678{i}', f'Message {i}') for i in range(10)]
+        responses = self.gateway.send_many('stub-token', messages)
+        self.assertEqual([response.json()['result'] for response in responses], ['OK'] * 10)
+        self.assertCountEqual([(message['to'], message['text']) for message in self.stub.messages], messages)
+
+    def test_send_many_reuses_connections(self):
+        messages = [(f'4812345678{i}', 'Hello') for i in range(10)]
+        self.gateway.send_many('stub-token', messages)
+        self.gateway.send_many('stub-token', messages)
+        self.assertEqual(len(self.stub.messages), 20)
+        self.assertLessEqual(self.stub.connections, self.gateway.concurrency)
+
+
+class SmsTokenManagerTestCase(SimpleTestCase):
+
+    def setUp(self) -> None:
+        cache.clear()
+        self.gateway = Mock(**{'authenticate.side_effect': ['first', 'second']})
+        self.tokens = SmsTokenManager(self.gateway, ttl=3600, refresh_margin=300, lock_timeout=1, poll_interval=0.01)
+
+    def test_token_is_cached(self):
+        self.assertEqual(self.tokens.get_token(), 'first')
+        self.assertEqual(self.tokens.get_token(), 'first')
+        self.assertEqual(self.gateway.authenticate.call_count, 1)
+        self.assertEqual(
+            self.tokens.stats(),
+            {'sms_token_hits': 1, 'sms_token_misses': 1, 'sms_token_refreshes': 1}
+        )
+
+    def test_token_refreshed_before_expiry(self):
+        cache.set(SmsTokenManager.cache_key, {'token': 'expiring', 'refresh_at': time.time() - 1})
+        self.assertEqual(self.tokens.get_token(), 'first')
+        self.assertEqual(self.tokens.get_token(), 'first')
+        self.assertEqual(self.gateway.authenticate.call_count, 1)
+
+    def test_failed_refresh_keeps_cached_token(self):
+        cache.set(SmsTokenManager.cache_key, {'token': 'expiring', 'refresh_at': time.time() - 1})
+        self.gateway.authenticate.side_effect = [requests.ConnectionError('refused'), 'second']
+        with self.assertLogs('booking.sms', 'WARNING'):
+            self.assertEqual(self.tokens.get_token(), 'expiring')
+        self.assertIsNone(cache.get(SmsTokenManager.lock_key))
+        self.assertEqual(self.tokens.get_token(), 'second')
+
+    def test_token_not_refreshed_while_other_worker_holds_lock(self):
+        cache.set(SmsTokenManager.cache_key, {'token': 'expiring', 'refresh_at': time.time() - 1})
+        cache.add(SmsTokenManager.lock_key, 'other')
+        self.assertEqual(self.tokens.get_token(), 'expiring')
+        self.gateway.authenticate.assert_not_called()
+
+    def test_waits_for_other_worker_login(self):
+        cache.add(SmsTokenManager.lock_key, 'other')
+
+        def other_worker_login(seconds):
+            cache.set(SmsTokenManager.cache_key, {'token': 'other', 'refresh_at': time.time() + 3000})
+
+        with patch('booking.sms.time.sleep', side_effect=other_worker_login):
+            self.assertEqual(self.tokens.get_token(), 'other')
+        self.gateway.authenticate.assert_not_called()
+
+    def test_invalidate(self):
+        self.tokens.get_token()
+        self.tokens.invalidate('outdated')
+        self.assertEqual(self.tokens.get_token(), 'first')
+        self.tokens.invalidate('first')
+        self.assertEqual(self.tokens.get_token(), 'second')
@@ -1,19 +1,42 @@
 # Tests of the tasks module
 
-from unittest.mock import patch
-from django.test import TestCase
-from booking.tasks import send_sms_remainder, send_sms_visit_cancelled
-from booking.models import Visit, Client
+from unittest.mock import patch, Mock
+from django.test import TestCase, override_settings
+from booking.tasks import (
+    drain_sms_outbox, send_sms_remainder, send_sms_remainder_chunk, summarize_sms_remainder, chunk_users
+)
+from booking.models import Visit, Client, OutboundSms
+from booking.outbox import enqueue
+from booking.reminders import reminder_ref
 import datetime
 from django.contrib.auth import get_user_model
 from decimal import Decimal
+from app.celery import app
+from django.core.cache import cache
 
 
-@patch('booking.tasks.send_sms')
-@patch('booking.tasks.sms_authenticate_token')
+def send_many_ok(token, messages):
+    return [Mock(status_code=200, **{'json.return_value': {'result': 'OK'}}) for _ in messages]
+
+
+def gateway_ok(mock_gateway):
+    mock_gateway.return_value.authenticate.return_value = 'token'
+    mock_gateway.return_value.send_many.side_effect = send_many_ok
+
+
+def sent_messages_count(mock_gateway):
+    return sum(len(call.args[1]) for call in mock_gateway.return_value.send_many.call_args_list)
+
+
+@override_settings(SMS_RETRY_BASE_DELAY=0)
+@patch('booking.tasks.get_gateway')
 class TestTasks(TestCase):
 
     def setUp(self) -> None:
+        # Run the chord of chunk subtasks in process
+        app.conf.task_always_eager = True
+        self.addCleanup(setattr, app.conf, 'task_always_eager', False)
+        cache.clear()
         tomorrow = datetime.date.today() + datetime.timedelta(days=1)
         self.user_with_reminder = get_user_model().objects.create_user(
             username='test',
@@ -46,39 +69,95 @@ class TestTasks(TestCase):
                 first_name='test3', last_name='Doe', phone_number=f'+4812333678{i}', user=self.user_without_balance))
              for i in range(3)]
 
-    def test_send_sms_remainder(self, mock_authenticate_token, mock_send_sms):
-        mock_authenticate_token.return_value = 'token'
-        mock_send_sms.return_value.json.return_value = {'result': 'OK'}
+    def test_send_sms_remainder(self, mock_gateway):
+        gateway_ok(mock_gateway)
         balance_with_reminder = \
             self.user_with_reminder.balance - self.user_with_reminder.sms_price * len(self.visits_user_with_sms_reminder)
         send_sms_remainder()
-        self.assertEqual(mock_send_sms.call_count, 3)
+        self.assertEqual(sent_messages_count(mock_gateway), 3)
         self.user_with_reminder.refresh_from_db()
         self.assertEqual(self.user_with_reminder.balance, balance_with_reminder)
 
-    def test_send_sms_visit_cancelled(self, mock_authenticate_token, mock_send_sms):
-        mock_authenticate_token.return_value = 'token'
-        mock_send_sms.return_value.json.return_value = {'result': 'OK'}
-        send_sms_visit_cancelled(
-            visits_pk=[visit.pk for visit in self.visits_user_with_sms_reminder],
-            text='test',
-            user=self.user_with_reminder)
-        self.assertEqual(mock_send_sms.call_count, 3)
-
-    def test_send_sms_remainder_no_balance(self, mock_authenticate_token, mock_send_sms):
-        mock_authenticate_token.return_value = 'token'
-        mock_send_sms.return_value.json.return_value = {'result': 'OK'}
-        send_sms_visit_cancelled(
-            visits_pk=[visit.pk for visit in self.visits_user_without_balance],
-            text='test',
-            user=self.user_without_balance)
-        self.assertEqual(mock_send_sms.call_count, 0)
-
-    def test_send_sms_remainder_no_sms_reminder(self, mock_authenticate_token, mock_send_sms):
-        mock_authenticate_token.return_value = 'token'
-        mock_send_sms.return_value.json.return_value = {'result': 'OK'}
-        send_sms_visit_cancelled(
-            visits_pk=[visit.pk for visit in self.visits_user_without_sms_reminder],
-            text='test',
-            user=self.user_without_reminder)
-        self.assertEqual(mock_send_sms.call_count, 0)
+    def test_send_sms_remainder_expired_token(self, mock_gateway):
+        mock_gateway.return_value.authenticate.side_effect = ['expired', 'token']
+        mock_gateway.return_value.send_many.side_effect = [
+            [Mock(status_code=200, **{'json.return_value': {'result': 'error'}})] * 3,
+            [Mock(status_code=200, **{'json.return_value': {'result': 'OK'}})] * 3,
+        ]
+        send_sms_remainder()
+        self.assertEqual(mock_gateway.return_value.authenticate.call_count, 2)
+        self.assertEqual(mock_gateway.return_value.send_many.call_args.args[0], 'token')
+        self.user_with_reminder.refresh_from_db()
+        self.assertEqual(self.user_with_reminder.balance, Decimal('9.70'))
+
+    def test_send_sms_remainder_reuses_token(self, mock_gateway):
+        gateway_ok(mock_gateway)
+        send_sms_remainder()
+        enqueue(OutboundSms.CANCELLATION, [(self.user_with_reminder.pk, 1, '48600000000', 'test')])
+        drain_sms_outbox()
+        self.assertEqual(sent_messages_count(mock_gateway), 4)
+        self.assertEqual(mock_gateway.return_value.authenticate.call_count, 1)
+
+    def test_send_sms_remainder_once_per_visit(self, mock_gateway):
+        gateway_ok(mock_gateway)
+        send_sms_remainder()
+        # Catching up again, or a retried chunk, doesn't remind anybody twice
+        self.assertEqual(send_sms_remainder().get(), {'queued': 0, 'skipped': 3, 'held': '0.00'})
+        self.assertEqual(sent_messages_count(mock_gateway), 3)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        self.assertEqual(
+            set(OutboundSms.objects.values_list('key', flat=True)),
+            {f'reminder:{reminder_ref(visit.pk, tomorrow, visit.time)}' for visit in self.visits_user_with_sms_reminder}
+        )
+        self.user_with_reminder.refresh_from_db()
+        self.assertEqual(self.user_with_reminder.balance, Decimal('9.70'))
+
+    def test_send_sms_remainder_totals(self, mock_gateway):
+        gateway_ok(mock_gateway)
+        with self.settings(SMS_REMAINDER_CHUNK_SIZE=1):
+            result = send_sms_remainder()
+        self.assertEqual(result.get(), {'queued': 3, 'skipped': 0, 'held': '0.30'})
+
+    def test_send_sms_remainder_chunk_not_enough_balance(self, mock_gateway):
+        self.user_with_reminder.balance = Decimal('0.20')
+        self.user_with_reminder.save()
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        result = send_sms_remainder_chunk(user_pks=[self.user_with_reminder.pk], date=tomorrow.isoformat())
+        self.assertEqual(result, {'queued': 0, 'skipped': 3, 'held': '0.00'})
+        self.assertEqual(sent_messages_count(mock_gateway), 0)
+
+    def test_send_sms_remainder_chunk_gateway_error(self, mock_gateway):
+        mock_gateway.return_value.authenticate.return_value = 'token'
+        mock_gateway.return_value.send_many.side_effect = RuntimeError('Gateway crashed')
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        send_sms_remainder_chunk(user_pks=[self.user_with_reminder.pk], date=tomorrow.isoformat())
+        # The reminders stay queued with their price held, a later drain sends them once the claim expires
+        self.assertEqual(OutboundSms.objects.filter(status=OutboundSms.SENDING).count(), 3)
+        self.user_with_reminder.refresh_from_db()
+        self.assertEqual(self.user_with_reminder.balance, Decimal('9.70'))
+
+    def test_send_sms_remainder_chunk_not_eligible(self, mock_gateway):
+        gateway_ok(mock_gateway)
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        result = send_sms_remainder_chunk(
+            user_pks=[self.user_without_balance.pk, self.user_without_reminder.pk], date=tomorrow.isoformat()
+        )
+        self.assertEqual(result['queued'], 0)
+        self.assertEqual(sent_messages_count(mock_gateway), 0)
+
+
+class TestChunking(TestCase):
+
+    def test_chunk_users(self):
+        chunks = chunk_users([(1, 2), (2, 2), (3, 1), (4, 5), (5, 1)], chunk_size=4)
+        self.assertEqual(chunks, [[1, 2], [3], [4], [5]])
+
+    def test_chunk_users_empty(self):
+        self.assertEqual(chunk_users([], chunk_size=4), [])
+
+    def test_summarize_sms_remainder(self):
+        totals = summarize_sms_remainder([
+            {'queued': 2, 'skipped': 1, 'held': '0.20'},
+            {'queued': 3, 'skipped': 0, 'held': '0.45'},
+        ])
+        self.assertEqual(totals, {'queued': 5, 'skipped': 1, 'held': '0.65'})
@@ -1,11 +1,13 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.contrib.auth.views import LoginView, LogoutView
 
 app_name = 'booking'
 
 urlpatterns = [
     path('', views.IndexView.as_view(), name='index'),
+    path('calendar/', views.CalendarView.as_view(), name='calendar'),
+    path('free-slots/', views.FreeSlotsView.as_view(), name='free-slots'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('signin/', views.SignInView.as_view(), name='signin'),
     path('login/', LoginView.as_view(template_name='booking/login.html'), name='login'),
@@ -13,6 +15,7 @@ urlpatterns = [
     path('visit-create/', views.CreateVisitView.as_view(), name='visit-create'),
     path('client-create/', views.CreateClientView.as_view(), name='client-create'),
     path('clients/', views.ClientsView.as_view(), name='clients'),
+    path('clients/import/', views.ImportClientsView.as_view(), name='client-import'),
     path('client-edit/<int:pk>/', views.UpdateClientView.as_view(), name='client-edit'),
     path('client-delete/<int:pk>/',
          views.DeleteClientView.as_view(),
@@ -22,4 +25,9 @@ urlpatterns = [
          name='visit-delete'),
     path('cancel-visits/', views.CancelVisitsView.as_view(), name='cancel-visits'),
     path('account/', views.UserAccountView.as_view(), name='account'),
+    path('export/visits/', views.ExportVisitsView.as_view(), name='export-visits'),
+    path('export/clients/', views.ExportClientsView.as_view(), name='export-clients'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+    path('api/visits/', api.VisitsApiView.as_view(), name='api-visits'),
+    path('api/clients/', api.ClientsApiView.as_view(), name='api-clients'),
 ]
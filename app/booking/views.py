@@ -1,92 +1,215 @@
-from django.views.generic import ListView, CreateView, UpdateView, FormView, DeleteView
+from django.views.generic import CreateView, UpdateView, FormView, DeleteView, TemplateView
 from .models import Visit, Client
 import datetime
-from .forms import VisitFilterForm, VisitsCancelForm, UserRegisterForm, UserUpdateForm
+from .forms import VisitFilterForm, VisitForm, VisitsCancelForm, UserRegisterForm, UserUpdateForm, ClientImportForm
 from django.urls import reverse_lazy
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Q
-from django.forms import widgets
-from .tasks import send_sms_visit_cancelled
+from django.db import IntegrityError, transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.views import View
+from .cancellation import cancel_visits, CancellationError
+from .search import search_clients
+from .pagination import KeysetPaginator, apaginate
+from .schedule import COUNTERS as SCHEDULE_COUNTERS, aget_schedule, get_visits_by_day, schedule_changed_at
+from .slots import find_free_slots
+from . import export
+from .imports import ClientImportError, import_clients, read_rows
+from . import metrics
+from .sms import SmsTokenManager
+from celery import current_app
+from django.conf import settings
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import Paginator
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect, render
+from asgiref.sync import sync_to_async
 
 
-class IndexView(ListView):
+async def is_authenticated(request):
+    """
+    Load the lazy `request.user` in a thread, after which async views and their templates can use it.
+    """
+    return await sync_to_async(lambda: request.user.is_authenticated)()
+
+
+class IndexView(View):
     """
     Main view. For managing visits.
     """
     template_name = 'booking/index.html'
-    model = Visit
 
-    def get_context_data(self, *, object_list=None, **kwargs):
+    async def get(self, request, *args, **kwargs):
         today = datetime.date.today()
+        # Filter visits by date specified in form, today's by default
+        form = VisitFilterForm(request.GET or None)
+        date = today
+        if form.is_valid() and form.cleaned_data.get('date'):
+            date = form.cleaned_data['date']
+
+        if await is_authenticated(request):
+            visits = await aget_schedule(request.user, date)
+        else:
+            visits = []
 
-        queryset = object_list if object_list is not None else self.object_list
+        return render(request, self.template_name, {
+            'form': form,
+            'object_list': visits,
+            'display_date': today,
+        })
+
+
+def calendar_range(request):
+    """
+    Span ('week' or 'month') and first and last day of the calendar requested by `?start=&span=`.
+    """
+    try:
+        start = datetime.date.fromisoformat(request.GET.get('start', ''))
+    except ValueError:
+        start = datetime.date.today()
+    # Kept clear of the first and last representable days, so the calendar and its neighbours exist
+    start = min(max(start, datetime.date.min + datetime.timedelta(days=31)),
+                datetime.date.max - datetime.timedelta(days=62))
+    if request.GET.get('span') == 'month':
+        from_date = start.replace(day=1)
+        to_date = (from_date + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+        return 'month', from_date, to_date
+    from_date = start - datetime.timedelta(days=start.weekday())
+    return 'week', from_date, from_date + datetime.timedelta(days=6)
 
-        if self.request.user.is_authenticated:
-            queryset = queryset.filter(client__user=self.request.user)
-        else:
-            queryset = queryset.none()
-        # Filter visits by date specified in form
-        form = VisitFilterForm(self.request.GET or None)
-        if form.is_valid():
-            date = form.cleaned_data.get('date', '')
-            if date:
-                queryset = queryset.filter(
-                    date=date
-                    ).order_by('time')
-        # Default visit filter by today's date if no data in search form
-        if not any(form.data.dict()):
-            queryset = queryset.filter(
-                date=today
-                ).order_by('time')
 
+def calendar_etag(request, *args, **kwargs):
+    span, from_date, to_date = calendar_range(request)
+    return f'{request.user.pk}-{span}-{from_date}-{schedule_changed_at(request.user.pk)}'
+
+
+def calendar_last_modified(request, *args, **kwargs):
+    return datetime.datetime.fromtimestamp(schedule_changed_at(request.user.pk), tz=datetime.timezone.utc)
+
+
+class CalendarView(LoginRequiredMixin, TemplateView):
+    """
+    View for displaying visits of a week or month.
+    """
+    template_name = 'booking/calendar.html'
+
+    @method_decorator(condition(etag_func=calendar_etag, last_modified_func=calendar_last_modified))
+    def get(self, request, *args, **kwargs):
+        # Unchanged calendars are answered with 304 before anything is queried or rendered
+        return super().get(request, *args, **kwargs)
+
+    def get_context_data(self, **kwargs):
+        span, from_date, to_date = calendar_range(self.request)
+        if span == 'month':
+            previous_start = (from_date - datetime.timedelta(days=1)).replace(day=1)
+        else:
+            previous_start = from_date - datetime.timedelta(days=7)
         return super().get_context_data(
-            form=form,
-            object_list=queryset,
-            display_date=today,
+            span=span,
+            from_date=from_date,
+            to_date=to_date,
+            days=get_visits_by_day(self.request.user, from_date, to_date),
+            previous_start=previous_start,
+            next_start=to_date + datetime.timedelta(days=1),
             **kwargs)
 
 
-class UpdateVisitView(LoginRequiredMixin, UpdateView):
+class OwnedObjectMixin:
     """
-    View for updating visits.
+    Looks the object up among the user's own in a single query. Objects of other users are
+    refused with 403, which only costs a query when the lookup fails.
     """
-    model = Visit
-    fields = '__all__'
-    template_name_suffix = '_update_form'
-    success_url = '/'
+
+    def get_queryset(self):
+        return self.model.objects.owned_by(self.request.user)
 
     def get_object(self, queryset=None):
-        # Check if user is owner of visit
-        obj = super().get_object(queryset)
-        if obj.client.user != self.request.user:
-            raise PermissionDenied
-        return obj
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            if self.model.objects.filter(pk=self.kwargs.get(self.pk_url_kwarg)).exists():
+                raise PermissionDenied
+            raise
+
+
+class VisitFormMixin:
+    """
+    Saves visits validated by VisitForm, reporting a visit booked in the meantime as a form error.
+    """
+    form_class = VisitForm
 
     def get_form(self, form_class=None):
         form = super().get_form(form_class)
-        form.fields['date'].widget = widgets.DateInput(attrs={'type': 'date'})
-        form.fields['time'].widget = widgets.TimeInput(attrs={'type': 'time'})
+        form.fields['client'].queryset = Client.objects.owned_by(self.request.user)
         return form
 
+    def form_valid(self, form):
+        try:
+            with transaction.atomic():
+                return super().form_valid(form)
+        except IntegrityError as error:
+            # Raised by the PostgreSQL exclusion constraint when the overlap check raced another request
+            if 'visit_owner_no_overlap' not in str(error):
+                raise
+            form.add_error(None, form.overlap_error)
+            return self.form_invalid(form)
+
+
+class FreeSlotsView(LoginRequiredMixin, View):
+    """
+    JSON list of the free periods of a day (or a week from it) at least `duration` minutes long.
+    """
+
+    def get(self, request, *args, **kwargs):
+        try:
+            from_date = datetime.date.fromisoformat(request.GET.get('date', ''))
+        except ValueError:
+            from_date = datetime.date.today()
+        # Kept clear of the last representable day, so the week from it exists
+        from_date = min(from_date, datetime.date.max - datetime.timedelta(days=6))
+        try:
+            duration = int(request.GET.get('duration', Visit.DEFAULT_DURATION))
+        except ValueError:
+            return JsonResponse({'error': 'duration must be a number of minutes'}, status=400)
+        day_minutes = (
+            datetime.datetime.combine(from_date, datetime.time.fromisoformat(settings.BOOKING_DAY_END))
+            - datetime.datetime.combine(from_date, datetime.time.fromisoformat(settings.BOOKING_DAY_START))
+        ) // datetime.timedelta(minutes=1)
+        if not 1 <= duration <= day_minutes:
+            return JsonResponse({'error': f'duration must be between 1 and {day_minutes} minutes'}, status=400)
+        days = 7 if request.GET.get('span') == 'week' else 1
+        to_date = from_date + datetime.timedelta(days=days - 1)
+        slots = find_free_slots(request.user, from_date, to_date, duration)
+        return JsonResponse({
+            'duration': duration,
+            'slots': [
+                {'date': date.isoformat(), 'start': start.isoformat('minutes'), 'end': end.isoformat('minutes')}
+                for date, start, end in slots
+            ],
+        })
+
+
+class UpdateVisitView(LoginRequiredMixin, OwnedObjectMixin, VisitFormMixin, UpdateView):
+    """
+    View for updating visits.
+    """
+    model = Visit
+    template_name_suffix = '_update_form'
+    success_url = '/'
+
 
-class CreateVisitView(LoginRequiredMixin, CreateView):
+class CreateVisitView(LoginRequiredMixin, VisitFormMixin, CreateView):
     """
     View for creating visits.
     """
     model = Visit
     template_name = 'booking/visit_create_form.html'
-    fields = '__all__'
     success_url = '/'
 
-    def get_form(self, form_class=None):
-        form = super().get_form(form_class)
-        form.fields['date'].widget = widgets.DateInput(attrs={'type': 'date'})
-        form.fields['time'].widget = widgets.TimeInput(attrs={'type': 'time'})
-        return form
 
-
-class DeleteVisitView(LoginRequiredMixin, DeleteView):
+class DeleteVisitView(LoginRequiredMixin, OwnedObjectMixin, DeleteView):
     """
     View for deleting visits.
     """
@@ -94,11 +217,9 @@ class DeleteVisitView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('booking:index')
     template_name = 'booking/generic_delete.html'
 
-    def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        if obj.client.user != self.request.user:
-            raise PermissionDenied
-        return obj
+    def get_queryset(self):
+        # The confirmation page shows the client
+        return super().get_queryset().select_related('client')
 
 
 class CancelVisitsView(LoginRequiredMixin, FormView):
@@ -111,35 +232,24 @@ class CancelVisitsView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         user = self.request.user
-        from_date = form.cleaned_data.get('from_date')
-        to_date = form.cleaned_data.get('to_date')
-        visits = Visit.objects.filter(
-            client__user=self.request.user,
-            date__gte=from_date,
-            date__lte=to_date
+        send_sms = form.cleaned_data['send_sms']
+        if send_sms and not user.sms_remainder:
+            form.add_error(None, 'You have not set up sms remainder')
+            return self.form_invalid(form)
+        if send_sms and form.cleaned_data['text_message'] == '':
+            form.add_error('text_message', 'This field is required')
+            return self.form_invalid(form)
+        try:
+            cancel_visits(
+                user,
+                form.cleaned_data.get('from_date'),
+                form.cleaned_data.get('to_date'),
+                text=form.cleaned_data['text_message'] if send_sms else None
             )
-        if not visits:
-            form.add_error(None, 'No visits found for this period')
+        except CancellationError as error:
+            form.add_error(None, str(error))
             return self.form_invalid(form)
-        else:
-            if form.cleaned_data['send_sms'] and user.sms_remainder:
-                if form.cleaned_data['text_message'] == '':
-                    form.add_error('text_message', 'This field is required')
-                    return self.form_invalid(form)
-                if user.balance >= user.sms_price * visits.count():
-                    send_sms_visit_cancelled.delay(
-                        visits_pk=[visit.pk for visit in visits],
-                        text=form.cleaned_data['text_message'],
-                        user=user
-                        )
-                else:
-                    form.add_error(None, 'Not enough money on your account')
-                    return self.form_invalid(form)
-            if form.cleaned_data['send_sms'] and not user.sms_remainder:
-                form.add_error(None, 'You have not set up sms remainder')
-                return self.form_invalid(form)
-            visits.delete()
-            return super().form_valid(form)
+        return super().form_valid(form)
 
 
 class CreateClientView(LoginRequiredMixin, CreateView):
@@ -156,7 +266,7 @@ class CreateClientView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
 
-class UpdateClientView(LoginRequiredMixin, UpdateView):
+class UpdateClientView(LoginRequiredMixin, OwnedObjectMixin, UpdateView):
     """
     View for updating clients.
     """
@@ -166,14 +276,8 @@ class UpdateClientView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy('booking:clients')
     context_object_name = 'client'
 
-    def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        if obj.user != self.request.user:
-            raise PermissionDenied
-        return obj
 
-
-class DeleteClientView(LoginRequiredMixin, DeleteView):
+class DeleteClientView(LoginRequiredMixin, OwnedObjectMixin, DeleteView):
     """
     View for deleting clients.
     """
@@ -181,36 +285,104 @@ class DeleteClientView(LoginRequiredMixin, DeleteView):
     success_url = reverse_lazy('booking:clients')
     template_name = 'booking/generic_delete.html'
 
-    def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        if obj.user != self.request.user:
-            raise PermissionDenied
-        return obj
+
+class ImportClientsView(LoginRequiredMixin, FormView):
+    """
+    View for importing clients from a file.
+    """
+    form_class = ClientImportForm
+    template_name = 'booking/client_import.html'
+
+    def form_valid(self, form):
+        rows = read_rows(form.cleaned_data['file'], form.cleaned_data['format'])
+        try:
+            result = import_clients(self.request.user, rows)
+        except ClientImportError as error:
+            form.add_error('file', str(error))
+            return self.form_invalid(form)
+        return self.render_to_response(self.get_context_data(form=form, result=result))
 
 
-class ClientsView(LoginRequiredMixin, ListView):
+class ClientsView(View):
     """
     View for displaying clients.
     """
-    model = Client
     template_name = 'booking/clients.html'
-    context_object_name = 'clients'
     paginate_by = 20
-    ordering = ['-first_name']
+    # Last name and pk break ties between equal first names, so the order is stable
+    ordering = ['-first_name', '-last_name', '-pk']
+
+    async def get(self, request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        queryset = search_clients(
+            Client.objects.owned_by(request.user).order_by(*self.ordering),
+            request.GET.get('search')
+        )
+        # Page numbers by default, ?mode=cursor walks the list by keyset without counting it
+        if request.GET.get('mode') == 'cursor':
+            paginator = KeysetPaginator(queryset, self.paginate_by, self.ordering)
+            page = await paginator.apage(request.GET.get('cursor'))
+        else:
+            paginator = Paginator(queryset, self.paginate_by)
+            page = await apaginate(paginator, request.GET.get('page') or 1)
+        return render(request, self.template_name, {
+            'clients': page.object_list,
+            'object_list': page.object_list,
+            'paginator': paginator,
+            'page_obj': page,
+            'is_paginated': page.has_other_pages(),
+        })
+
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    Base view streaming rows of the user as `?format=csv` (default) or `?format=ndjson`.
+    """
+    name = None
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in export.FORMATS:
+            return HttpResponseBadRequest('Unknown format')
+        try:
+            columns, rows = self.get_rows()
+        except ValueError:
+            return HttpResponseBadRequest('Invalid date')
+        lines = export.render(export_format, columns, rows)
+        if isinstance(request, ASGIRequest):
+            # Served from the event loop, which consumes a sync iterator by loading all of it first
+            lines = export.aiter_lines(lines)
+        response = StreamingHttpResponse(lines, content_type=export.FORMATS[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{self.name}.{export_format}"'
+        return response
+
+    def get_rows(self):
+        raise NotImplementedError
+
+
+class ExportVisitsView(ExportView):
+    """
+    View exporting visits, optionally from `?from=` to `?to=`.
+    """
+    name = 'visits'
 
-    def get_queryset(self):
-        queryset = super().get_queryset().filter(user=self.request.user)
-        query = self.request.GET.get("search")
-        if query and len(query.split(' ')) == 1:
-            queryset = queryset.filter(
-                Q(first_name__icontains=query) | Q(last_name__icontains=query) | Q(phone_number__icontains=query)
-            )
-        elif query and len(query.split(' ')) == 2:
-            queryset = queryset.filter(
-                Q(first_name__icontains=query.split(' ')[0]) & Q(last_name__icontains=query.split(' ')[1]) |
-                Q(first_name__icontains=query.split(' ')[1]) & Q(last_name__icontains=query.split(' ')[0])
-            )
-        return queryset
+    def get_rows(self):
+        from_date, to_date = [
+            datetime.date.fromisoformat(self.request.GET[parameter]) if self.request.GET.get(parameter) else None
+            for parameter in ('from', 'to')
+        ]
+        return export.VISIT_COLUMNS, export.visit_rows(self.request.user, from_date, to_date)
+
+
+class ExportClientsView(ExportView):
+    """
+    View exporting clients.
+    """
+    name = 'clients'
+
+    def get_rows(self):
+        return export.CLIENT_COLUMNS, export.client_rows(self.request.user)
 
 
 class SignInView(CreateView):
@@ -222,21 +394,51 @@ class SignInView(CreateView):
     success_url = reverse_lazy('booking:index')
 
 
-class UserAccountView(LoginRequiredMixin, UpdateView):
+class UserAccountView(View):
     """
     View for displaying and updating user account.
     """
-    form_class = UserUpdateForm
     template_name = 'booking/account.html'
-    success_url = reverse_lazy('booking:account')
-
-    def get_object(self, queryset=None):
-        return self.request.user
-
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['balance'] = self.request.user.balance
-        context['sms_remainder'] = self.request.user.sms_remainder
-        return context
 
+    async def get(self, request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        return self.render(request, UserUpdateForm(instance=request.user))
+
+    async def post(self, request, *args, **kwargs):
+        if not await is_authenticated(request):
+            return redirect_to_login(request.get_full_path())
+        form = UserUpdateForm(request.POST, instance=request.user)
+        if await sync_to_async(lambda: form.is_valid() and form.save())():
+            return redirect('booking:account')
+        return self.render(request, form)
+
+    def render(self, request, form):
+        return render(request, self.template_name, {
+            'form': form,
+            'object': request.user,
+            'balance': request.user.balance,
+            'sms_remainder': request.user.sms_remainder,
+        })
+
+
+class MetricsView(View):
+    """
+    Totals of the measured views and tasks in the Prometheus text format. Scrapers authenticate with
+    METRICS_TOKEN, without one configured only staff users get the totals.
+    """
 
+    def get(self, request, *args, **kwargs):
+        if settings.METRICS_TOKEN:
+            if request.headers.get('Authorization') != f'Bearer {settings.METRICS_TOKEN}':
+                return HttpResponse(status=401)
+        elif not request.user.is_staff:
+            return HttpResponse(status=403)
+        # Imported here, the url configuration imports this module
+        from . import urls
+        views = [f'{urls.app_name}:{pattern.name}' for pattern in urls.urlpatterns]
+        tasks = sorted(name for name in current_app.tasks if not name.startswith('celery.'))
+        # Totals of this process are included right away, the other processes add theirs as they flush
+        metrics.flush()
+        content = metrics.render_metrics(views, tasks, [*SCHEDULE_COUNTERS, *SmsTokenManager.counters])
+        return HttpResponse(content, content_type='text/plain; version=0.0.4; charset=utf-8')